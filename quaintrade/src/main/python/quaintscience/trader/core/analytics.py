@@ -0,0 +1,220 @@
+"""Backtest metrics computed from the paper broker's P&L ledger
+
+Everything here works on whole columns: the closed trades as returned by
+PnLLedger.get_trades and the equity curve of PaperBroker.get_equity_curve.
+Streaks come from run-length encoding the win/loss signs, excursions from
+ufunc.reduceat over the candles each trade was open for, so the cost is a
+handful of NumPy passes however many trades a backtest closed.
+"""
+from typing import Optional
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+from .ds import TransactionType
+from .ledger import get_drawdown, get_periodic_pnl
+
+
+def to_json_value(value):
+    """Plain Python value for json.dump, NaN and infinities become None"""
+    if isinstance(value, (np.integer, np.bool_)):
+        return value.item()
+    if isinstance(value, (float, np.floating)):
+        value = float(value)
+        return value if math.isfinite(value) else None
+    if isinstance(value, (pd.Timestamp, pd.Timedelta, pd.Period)):
+        return None if pd.isna(value) else str(value)
+    return value
+
+
+def get_trade_stats(pnl: np.ndarray) -> dict:
+    """Summary of a sequence of trade P&Ls in the order the trades were closed
+
+    max_drawdown is the largest loss over consecutive losing trades and
+    lowest_point the lowest the cumulative P&L went (both zero or negative).
+    Trades that made exactly nothing count as losses.
+    """
+    pnl = np.asarray(pnl, dtype=np.float64)
+    count = len(pnl)
+    wins = pnl > 0
+    losses = pnl < 0
+    gross_profit = float(pnl[wins].sum())
+    gross_loss = float(-pnl[losses].sum())
+    stats = {"trades": count,
+             "accuracy": float(wins.sum() / count) if count > 0 else 0.,
+             "max_drawdown": 0.,
+             "lowest_point": 0.,
+             "longest_loss_streak": 0,
+             "longest_profit_streak": 0,
+             "final_pnl": float(pnl.sum()),
+             "largest_loss": float(pnl.min()) if count > 0 else 0,
+             "gross_profit": gross_profit,
+             "gross_loss": gross_loss,
+             "profit_factor": gross_profit / gross_loss if gross_loss > 0 else None,
+             "average_win": float(pnl[wins].mean()) if wins.any() else 0.,
+             "average_loss": float(pnl[losses].mean()) if losses.any() else 0.,
+             "expectancy": float(pnl.mean()) if count > 0 else 0.}
+    if count == 0:
+        return stats
+    # Runs of consecutive wins / non-wins
+    starts = np.flatnonzero(np.concatenate([[True], wins[1:] != wins[:-1]]))
+    lengths = np.diff(np.append(starts, count))
+    winning_runs = wins[starts]
+    run_pnl = np.add.reduceat(pnl, starts)
+    stats["max_drawdown"] = float(min(run_pnl[~winning_runs].min(initial=0.), 0.))
+    stats["lowest_point"] = float(min(np.cumsum(pnl).min(), 0.))
+    stats["longest_loss_streak"] = int(lengths[~winning_runs].max(initial=0))
+    stats["longest_profit_streak"] = int(lengths[winning_runs].max(initial=0))
+    return stats
+
+
+def get_drawdown_stats(equity: pd.Series) -> dict:
+    """Deepest drawdown of an equity curve and the longest time spent below a previous peak
+
+    A drawdown lasts from the bar of the peak to the bar that recovers it,
+    or to the last bar if it never did.
+    """
+    stats = {"max_equity_drawdown": 0.,
+             "max_drawdown_duration": None,
+             "max_drawdown_bars": 0}
+    if len(equity) == 0:
+        return stats
+    drawdown = get_drawdown(equity).to_numpy()
+    stats["max_equity_drawdown"] = float(min(drawdown.min(), 0.))
+    underwater = drawdown < 0
+    if not underwater.any():
+        return stats
+    edges = np.diff(np.concatenate([[False], underwater, [False]]).astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    durations = equity.index[np.minimum(ends, len(equity) - 1)] - equity.index[np.maximum(starts - 1, 0)]
+    stats["max_drawdown_duration"] = durations.max()
+    stats["max_drawdown_bars"] = int((ends - starts).max())
+    return stats
+
+
+def get_return_stats(equity: pd.Series,
+                     capital: Optional[float] = None,
+                     periods_per_year: int = 252) -> dict:
+    """Annualized Sharpe and Sortino ratios of daily P&L, and CAGR when the starting capital is known
+
+    Without capital the ratios are taken over daily P&L in money, which
+    gives the same Sharpe ratio as returns on a fixed capital would.
+    """
+    stats = {"sharpe": None,
+             "sortino": None,
+             "cagr": None}
+    if len(equity) == 0:
+        return stats
+    daily = get_periodic_pnl(equity, "1D").to_numpy()
+    if capital is not None:
+        # Return on the capital at the start of each day
+        closing = np.cumsum(daily)
+        daily = daily / (capital + np.concatenate([[0.], closing[:-1]]))
+    if len(daily) > 1:
+        deviation = daily.std(ddof=1)
+        if deviation > 0:
+            stats["sharpe"] = float(daily.mean() / deviation * np.sqrt(periods_per_year))
+        downside = np.sqrt(np.mean(np.minimum(daily, 0.) ** 2))
+        if downside > 0:
+            stats["sortino"] = float(daily.mean() / downside * np.sqrt(periods_per_year))
+    if capital is not None and capital > 0:
+        years = (equity.index[-1] - equity.index[0]) / pd.Timedelta(days=365.25)
+        final = capital + equity.iloc[-1]
+        if years > 0 and final > 0:
+            stats["cagr"] = float((final / capital) ** (1 / years) - 1)
+    return stats
+
+
+def get_excursions(trades: pd.DataFrame,
+                   candle_ranges: dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]]) -> pd.DataFrame:
+    """Maximum adverse and favourable excursion (in money) of every trade
+
+    candle_ranges maps the instrument key of the trades to the (timestamps
+    in ns, highs, lows) of its bars. A trade is open over the bars from
+    its entry to its exit, both included; trades without prices or
+    candles get NaN.
+    """
+    mae = np.full(len(trades), np.nan)
+    mfe = np.full(len(trades), np.nan)
+    if len(trades) > 0:
+        entry_ns = trades["entry_time"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        exit_ns = trades["exit_time"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        entry_prices = trades["entry_price"].to_numpy(dtype=np.float64)
+        quantities = trades["quantity"].to_numpy(dtype=np.float64)
+        buys = (trades["transaction_type"] == TransactionType.BUY.value).to_numpy()
+        for key, rows in trades.groupby("key", sort=False).indices.items():
+            if key not in candle_ranges:
+                continue
+            timestamps, highs, lows = candle_ranges[key]
+            starts = np.searchsorted(timestamps, entry_ns[rows], side="left")
+            ends = np.searchsorted(timestamps, exit_ns[rows], side="right")
+            valid = starts < ends
+            # reduceat over (start, end) pairs reduces every [start, end) slice,
+            # the padding keeps end == len(timestamps) a valid index
+            bounds = np.column_stack([starts, ends]).ravel()
+            highest = np.maximum.reduceat(np.append(highs, np.nan), bounds)[::2]
+            lowest = np.minimum.reduceat(np.append(lows, np.nan), bounds)[::2]
+            entry, quantity, buy = entry_prices[rows], quantities[rows], buys[rows]
+            favourable = np.where(buy, highest - entry, entry - lowest) * quantity
+            adverse = np.where(buy, lowest - entry, entry - highest) * quantity
+            mfe[rows] = np.where(valid, favourable, np.nan)
+            mae[rows] = np.where(valid, adverse, np.nan)
+    return pd.DataFrame({"mae": mae, "mfe": mfe}, index=trades.index)
+
+
+def get_breakdown(equity: pd.Series, trades: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """P&L of the equity curve and the trades closed in each period (e.g. "1D", "1M")"""
+    breakdown = pd.DataFrame({"pnl": get_periodic_pnl(equity, freq) if len(equity) > 0 else pd.Series(dtype=np.float64)})
+    trades = trades[trades["exit_time"].notna()]
+    periods = trades["exit_time"].dt.to_period(freq)
+    closed = pd.DataFrame({"trades": trades["pnl"].groupby(periods).size(),
+                           "winning_trades": (trades["pnl"] > 0).groupby(periods).sum(),
+                           "trade_pnl": trades["pnl"].groupby(periods).sum()})
+    breakdown = breakdown.join(closed, how="outer").fillna({"pnl": 0., "trades": 0, "winning_trades": 0, "trade_pnl": 0.})
+    breakdown["trades"] = breakdown["trades"].astype(np.int64)
+    breakdown["winning_trades"] = breakdown["winning_trades"].astype(np.int64)
+    breakdown["accuracy"] = (breakdown["winning_trades"] / breakdown["trades"]).where(breakdown["trades"] > 0, 0.)
+    breakdown.index.name = "period"
+    return breakdown
+
+
+def get_backtest_report(trades: pd.DataFrame,
+                        equity: pd.Series,
+                        exposure: Optional[pd.Series] = None,
+                        candle_ranges: Optional[dict] = None,
+                        capital: Optional[float] = None,
+                        periods_per_year: int = 252) -> dict:
+    """Stats, daily and monthly breakdowns and per-trade excursions of a backtest
+
+    exposure is the (absolute) quantity held on every bar, the share of
+    bars with a position open is reported as exposure.
+    """
+    stats = get_trade_stats(trades["pnl"].to_numpy())
+    stats.update(get_drawdown_stats(equity))
+    stats.update(get_return_stats(equity, capital=capital, periods_per_year=periods_per_year))
+    stats["exposure"] = float((exposure.to_numpy() != 0).mean()) if exposure is not None and len(exposure) > 0 else None
+    trades = trades.copy()
+    excursions = get_excursions(trades, candle_ranges if candle_ranges is not None else {})
+    trades["mae"] = excursions["mae"]
+    trades["mfe"] = excursions["mfe"]
+    return {"stats": stats,
+            "daily": get_breakdown(equity, trades, "1D"),
+            "monthly": get_breakdown(equity, trades, "1M"),
+            "trades": trades}
+
+
+def write_report_json(report: dict, path: str):
+    """Write a report of get_backtest_report as JSON, tables as lists of records"""
+    stats = {k: to_json_value(v) for k, v in report["stats"].items()}
+    parts = [f'"stats": {json.dumps(stats, indent=1)}']
+    for name in ["daily", "monthly", "trades"]:
+        table = report[name]
+        if isinstance(table.index, pd.PeriodIndex):
+            table = table.set_axis(table.index.astype(str)).reset_index()
+        # pandas serializes in C, NaN/NaT become null
+        parts.append(f'"{name}": {table.to_json(orient="records", date_format="iso")}')
+    with open(path, 'w') as fid:
+        fid.write("{" + ",\n".join(parts) + "}\n")
@@ -1,5 +1,6 @@
 from typing import Union, Optional
 import datetime
+import copy
 import time
 import traceback
 import os
@@ -7,17 +8,29 @@ import traceback
 import os
 from functools import partial
 
+import numpy as np
 import pandas as pd
 import schedule
 from tabulate import tabulate
 
 
-from .ds import OHLCStorageType, TradingProduct
-from .util import resample_candle_data, get_key_from_scrip_and_exchange, new_id, datestring_to_datetime
+from .ds import OHLCStorageType, TradingProduct, TransactionType
+from .util import (resample_candle_data,
+                   get_key_from_scrip_and_exchange,
+                   new_id,
+                   datestring_to_datetime,
+                   datetime_index_to_ns,
+                   to_epoch_ns,
+                   get_nearest_index,
+                   get_last_candle_start)
 from .logging import LoggerMixin
 from .roles import Broker, HistoricDataProvider
 from .strategy import Strategy
+from .indicator import IndicatorCache
+from .shared_candles import SharedCandleStore
 from .graphing import plot_backtesting_results
+from .ledger import get_period_end_pnl
+from .analytics import get_backtest_report, write_report_json
 
 from ..integration.paper import PaperBroker, PaperTraderTimeExceededException
 from ..integration.common import get_instruments_for_provider, get_instrument_for_provider
@@ -41,6 +54,10 @@ class Bot(LoggerMixin):
                  backtest_results_folder: str = "backtest-results",
                  backtest_type: str = "standard",
                  backtest_display_data_only: bool = False,
+                 indicator_cache: Optional[IndicatorCache] = None,
+                 incremental_indicators: bool = True,
+                 backtest_capital: Optional[float] = None,
+                 shared_candles: Optional[SharedCandleStore] = None,
                  **kwargs):
         super().__init__(*args, **kwargs)
         self.broker = broker
@@ -59,6 +76,11 @@ class Bot(LoggerMixin):
         self.one_time_download_done = False
         self.backtest_display_data_only = backtest_display_data_only
         self.live_data_cache = {}
+        self.indicator_cache = indicator_cache
+        self.incremental_indicators = incremental_indicators
+        self.backtest_capital = backtest_capital
+        self.shared_candles = shared_candles
+        self.live_indicator_states = {}
 
     def do(self,
            scrip: str,
@@ -72,16 +94,26 @@ class Bot(LoggerMixin):
                             scrip=scrip,
                             exchange=exchange)
 
+    def resample(self,
+                 data: pd.DataFrame,
+                 interval: str) -> pd.DataFrame:
+        if self.indicator_cache is not None:
+            return self.indicator_cache.resample(data, interval)
+        return resample_candle_data(data, interval)
+
     def get_context(self,
                     data: pd.DataFrame,
                     interval: str):
         
-        rsdata = resample_candle_data(data, interval)
+        rsdata = self.resample(data, interval)
         context = {}
         if self.strategy is not None:
-            rsdata = self.strategy.indicator_pipeline["window"].compute(rsdata)[0]
+            window_pipeline = self.strategy.indicator_pipeline["window"]
+            window_pipeline.cache = self.indicator_cache
+            rsdata = window_pipeline.compute(rsdata)[0]
             for ctx, pipeline in self.strategy.indicator_pipeline["context"].items():
-                ctx_data = resample_candle_data(data, ctx)
+                ctx_data = self.resample(data, ctx)
+                pipeline.cache = self.indicator_cache
                 ctx_data = pipeline.compute(ctx_data)[0]
                 context[ctx] = ctx_data
         return rsdata, context
@@ -139,14 +171,41 @@ class Bot(LoggerMixin):
                                                       finegrained=True)
             self.one_time_download_done = True
 
-    def __get_context_data(self,
-                           scrip: str,
-                           exchange: str,
-                           from_date: Union[str, datetime.datetime],
-                           to_date: Union[str, datetime.datetime],
-                           interval: Optional[str] = None,
-                           blend_live_data: bool = False,
-                           prefer_live_data: bool = False):
+    def get_historic_data(self,
+                          scrip: str,
+                          exchange: str,
+                          from_date: Union[str, datetime.datetime],
+                          to_date: Union[str, datetime.datetime]) -> pd.DataFrame:
+        """1min data as consumed by backtests (scrip and exchange as named by the data provider)"""
+        load = partial(self.data_provider.get_data_as_df,
+                       scrip=scrip, exchange=exchange,
+                       from_date=from_date, to_date=to_date,
+                       interval="1min",
+                       storage_type=OHLCStorageType.PERM,
+                       download_missing_data=self.online_mode)
+        if self.shared_candles is not None and not self.online_mode:
+            # Offline the stored candles do not change during a run
+            data = self.shared_candles.get(("bot", self.data_provider.ProviderName, scrip, exchange,
+                                            "1min", str(from_date), str(to_date)), load)
+        else:
+            data = load()
+        data["date"] = data.index
+        return data
+
+    def set_historic_data(self,
+                          scrip: str,
+                          exchange: str,
+                          data: pd.DataFrame):
+        """Use already loaded 1min data (see get_historic_data) instead of reading it from storage"""
+        self.__set_live_data_cache(scrip, exchange, data)
+
+    def __get_minute_data(self,
+                          scrip: str,
+                          exchange: str,
+                          from_date: Union[str, datetime.datetime],
+                          to_date: Union[str, datetime.datetime],
+                          blend_live_data: bool = False,
+                          prefer_live_data: bool = False):
         to_date_day_begin = to_date.replace(hour=self.live_trading_market_start_hour,
                                             minute=self.live_trading_market_start_minute,
                                             second=0,
@@ -163,7 +222,6 @@ class Bot(LoggerMixin):
         self.__one_time_context_download(scrip=scrip,
                                          exchange=exchange,
                                          to_date=to_date_day_begin)
-        interval = self.strategy.default_interval if interval is None else interval
         if blend_live_data and self.online_mode:
             self.logger.info("Fetching latest data from data provider...")
             self.logger.info("Fetching latest data from data provider...")
@@ -176,15 +234,11 @@ class Bot(LoggerMixin):
         data = self.__get_live_data_cache(scrip, exchange)
         
         if data is None or len(data) == 0:
-            data = self.data_provider.get_data_as_df(scrip=scrip, exchange=exchange,
-                                                    from_date=from_date, to_date=to_date,
-                                                    interval="1min",
-                                                    storage_type=OHLCStorageType.PERM,
-                                                    download_missing_data=self.online_mode)
-            data["date"] = data.index
-            self.__set_live_data_cache(scrip,
-                                       exchange,
-                                       data)
+            data = self.get_historic_data(scrip=scrip, exchange=exchange,
+                                          from_date=from_date, to_date=to_date)
+            self.set_historic_data(scrip,
+                                   exchange,
+                                   data)
         if blend_live_data:
             data_updates = self.data_provider.get_data_as_df(scrip=scrip, exchange=exchange,
                                                              from_date=to_date_day_begin,
@@ -257,24 +311,258 @@ class Bot(LoggerMixin):
         print(data)
         if len(data) > 0:
             self.logger.info(f"First {data.iloc[0].name} - Latest {data.iloc[-1].name}")
+        return data
+
+    def __get_context_data(self,
+                           scrip: str,
+                           exchange: str,
+                           from_date: Union[str, datetime.datetime],
+                           to_date: Union[str, datetime.datetime],
+                           interval: Optional[str] = None,
+                           blend_live_data: bool = False,
+                           prefer_live_data: bool = False):
+        interval = self.strategy.default_interval if interval is None else interval
+        data = self.__get_minute_data(scrip=scrip,
+                                      exchange=exchange,
+                                      from_date=from_date,
+                                      to_date=to_date,
+                                      blend_live_data=blend_live_data,
+                                      prefer_live_data=prefer_live_data)
         data, context = self.get_context(data, interval)
         #data = resample_candle_data(data, interval)
         return context, data
 
+    def __get_minute_updates(self,
+                             scrip: str,
+                             exchange: str,
+                             from_date: datetime.datetime,
+                             to_date: datetime.datetime) -> pd.DataFrame:
+        """1min data between from_date and to_date, historic data wins over live data"""
+        if self.online_mode:
+            self.data_provider.download_historic_data(scrip=scrip,
+                                                      exchange=exchange,
+                                                      interval="1min",
+                                                      from_date=from_date,
+                                                      to_date=to_date,
+                                                      finegrained=True)
+        data = self.data_provider.get_data_as_df(scrip=scrip, exchange=exchange,
+                                                 from_date=from_date,
+                                                 to_date=to_date,
+                                                 interval="1min",
+                                                 storage_type=OHLCStorageType.PERM,
+                                                 download_missing_data=False)
+        live_data = self.data_provider.get_data_as_df(scrip=scrip, exchange=exchange,
+                                                      from_date=from_date,
+                                                      to_date=to_date,
+                                                      interval="1min",
+                                                      storage_type=OHLCStorageType.LIVE)
+        data = pd.concat([live_data, data], axis=0, sort=False)
+        data = data[~data.index.duplicated(keep='last')]
+        return data.sort_index()
+
+    def __update_timeframe(self,
+                           tf_state: Optional[dict],
+                           data: pd.DataFrame,
+                           interval: str,
+                           pipeline,
+                           from_date: datetime.datetime) -> tuple[dict, pd.DataFrame]:
+        """Run the indicators only on candles formed since the last call
+
+        Complete candles are committed to the pipeline state, the last
+        (still forming) candle is computed on a copy of it so that it can be
+        recomputed once more minutes arrive.
+        """
+        if tf_state is None:
+            tf_state = {"state": None, "frame": None, "pending_from": None}
+        else:
+            data = data[data.index >= tf_state["pending_from"]]
+        candles = self.resample(data, interval)
+        if len(candles) > 1:
+            tf_state["state"], committed = pipeline.update(tf_state["state"], candles.iloc[:-1])
+            if tf_state["frame"] is not None:
+                committed = pd.concat([tf_state["frame"], committed], axis=0, sort=False)
+            tf_state["frame"] = committed[committed.index >= from_date]
+        if len(candles) > 0:
+            tf_state["pending_from"] = get_last_candle_start(data, interval)
+            _, pending = pipeline.update(copy.deepcopy(tf_state["state"]), candles.iloc[-1:])
+            frames = [pending] if tf_state["frame"] is None else [tf_state["frame"], pending]
+            frame = pd.concat(frames, axis=0, sort=False)
+        else:
+            frame = tf_state["frame"]
+        return tf_state, frame
+
+    def __get_incremental_context_data(self,
+                                       scrip: str,
+                                       exchange: str,
+                                       from_date: datetime.datetime,
+                                       to_date: datetime.datetime,
+                                       interval: Optional[str] = None):
+        """Same as __get_context_data(blend_live_data=True), but indicators are
+        only run on candles formed since the previous call for this instrument"""
+        interval = self.strategy.default_interval if interval is None else interval
+        key = get_key_from_scrip_and_exchange(scrip, exchange)
+        live_state = self.live_indicator_states.get(key)
+        if live_state is None:
+            data = self.__get_minute_data(scrip=scrip,
+                                          exchange=exchange,
+                                          from_date=from_date,
+                                          to_date=to_date,
+                                          blend_live_data=True)
+            live_state = {"timeframes": {}}
+            self.live_indicator_states[key] = live_state
+        else:
+            # The last known minute is fetched again as it may have been incomplete
+            data = live_state["data"]
+            updates = self.__get_minute_updates(scrip, exchange, data.index[-1].to_pydatetime(), to_date)
+            data = pd.concat([data, updates], axis=0, sort=False)
+            data = data[~data.index.duplicated(keep='last')].sort_index()
+        if len(data) == 0:
+            self.live_indicator_states.pop(key)
+            return {}, data
+
+        pipelines = {interval: self.strategy.indicator_pipeline["window"]}
+        pipelines.update(self.strategy.indicator_pipeline["context"])
+        frames = {}
+        for tf, pipeline in pipelines.items():
+            (live_state["timeframes"][tf],
+             frames[tf]) = self.__update_timeframe(live_state["timeframes"].get(tf),
+                                                   data,
+                                                   tf,
+                                                   pipeline,
+                                                   from_date)
+        # Only minutes of candles that are still forming need to be kept
+        keep_from = min(tf_state["pending_from"] for tf_state in live_state["timeframes"].values())
+        live_state["data"] = data[data.index >= keep_from]
+        data = frames.pop(interval)
+        return frames, data
+
+    def get_context_cutoff(self, context_name: str,
+                           now_tick: datetime.datetime) -> datetime.datetime:
+        """Context candles strictly before the cutoff are complete at now_tick"""
+        if context_name in ["1d", "1w"]:
+            return now_tick.replace(hour=0,
+                                    minute=0,
+                                    second=0,
+                                    microsecond=0)
+        return now_tick - datetime.timedelta(seconds=pd.Timedelta(context_name).total_seconds())
+
     def pick_relevant_context(self, context: dict[str, pd.DataFrame],
                               now_tick: datetime.datetime):
         this_context = {}
+        for k, v in context.items():
+            end = v.index.searchsorted(self.get_context_cutoff(k, now_tick), side="left")
+            this_context[k] = v.iloc[:end]
+        return this_context
+
+    def get_context_alignment(self, ticks: pd.DatetimeIndex,
+                              context: dict[str, pd.DataFrame]) -> dict[str, np.ndarray]:
+        """For every tick, the number of leading rows of each context that are complete at that tick
+
+        Equivalent to calling get_context_cutoff for every tick, but computed
+        with a single searchsorted per context so it can be built once per backtest.
+        """
+        tick_ns = datetime_index_to_ns(ticks)
+        alignment = {}
         for k, v in context.items():
             if k in ["1d", "1w"]:
-                this_context[k] = v[v.index < now_tick.replace(hour=0,
-                                                               minute=0,
-                                                               second=0,
-                                                               microsecond=0)]
-                continue
-            this_context[k] = v[v.index < now_tick - datetime.timedelta(seconds=pd.Timedelta(k).total_seconds())]
-            this_context[k] = v[v.index < now_tick - datetime.timedelta(seconds=pd.Timedelta(k).total_seconds())]
+                cutoffs = datetime_index_to_ns(ticks.normalize())
+            else:
+                cutoffs = tick_ns - pd.Timedelta(k).value
+            alignment[k] = np.searchsorted(datetime_index_to_ns(v.index), cutoffs, side="left")
+        return alignment
+
+    def pick_aligned_context(self, context: dict[str, pd.DataFrame],
+                             alignment: dict[str, np.ndarray],
+                             tick_idx: int) -> Optional[dict[str, pd.DataFrame]]:
+        """Context views for the tick at tick_idx, None if any context has no complete rows yet"""
+        this_context = {}
+        for k, v in context.items():
+            end = alignment[k][tick_idx]
+            if end == 0:
+                return None
+            this_context[k] = v.iloc[:end]
         return this_context
 
+    def __walk_bars(self,
+                    scrip: str,
+                    exchange: str,
+                    data: pd.DataFrame,
+                    context: dict[str, pd.DataFrame],
+                    from_date: datetime.datetime,
+                    to_date: datetime.datetime,
+                    window_size: int,
+                    verbose: bool = True):
+        """Run the strategy on every window of data between from_date and to_date
+
+        Indicators are already computed over the whole range by get_context,
+        so the bars are walked with integer cursors and the strategy gets
+        iloc slices (views). verbose logs every bar, the fast backtest type
+        walks the same bars without it.
+        """
+        ticks = data.index.to_pydatetime()
+        alignment = self.get_context_alignment(data.index, context)
+        start_ii = get_nearest_index(datetime_index_to_ns(data.index), to_epoch_ns(from_date))
+        # Data may extend past to_date when it was preloaded for a longer range
+        end_ii = int(data.index.searchsorted(to_date, side="right"))
+        ts = None
+        first_timeset_done = False
+        for ii in range(start_ii, end_ii - window_size + 1, 1):
+            last_ii = ii + window_size - 1
+            now_tick = ticks[last_ii]
+            prev_tick = ticks[last_ii - 1]
+            if ts is None or ts.day != now_tick.day:
+                self.logger.info(f"Trading on {now_tick.day}")
+            ts = now_tick
+            if not first_timeset_done:
+                self.broker.set_current_time(prev_tick, traverse=False)
+                first_timeset_done = True
+            try:
+                this_context = self.pick_aligned_context(context, alignment, last_ii)
+                if verbose:
+                    self.logger.info(f"Time now is {now_tick}; "
+                                     f"last-data point is at {prev_tick}")
+                if this_context is None:
+                    continue
+                if verbose:
+                    for k, v in this_context.items():
+                        print(f"{now_tick} {k} last tick: {v.index[-1]}")
+                self.do(window=data.iloc[ii:last_ii], context=this_context, scrip=scrip, exchange=exchange)
+                if self.backtesting_print_tables:
+                    if verbose:
+                        self.logger.info(f"--------------Tables After Strategy Computation Start {now_tick}-------------")
+                    self.broker.get_orders_as_table()
+                    self.broker.get_positions_as_table()
+                    if verbose:
+                        self.logger.info(f"--------------Tables After Strategy Computation End {now_tick}-------------")
+                if verbose:
+                    self.logger.info(f"--------------Start Broker Activity for {now_tick} -------------")
+                self.broker.set_current_time(now_tick, traverse=True)
+                if verbose:
+                    self.logger.info(f"--------------End Broker Activity for {now_tick} -------------")
+            except PaperTraderTimeExceededException:
+                self.logger.warn(f"Could not set time in paper broker to {now_tick}")
+
+    def get_backtest_pnl_table(self) -> list[list]:
+        trades = self.broker.ledger.get_trades()
+        return [[order_id, entry_time, exit_time, TransactionType(transaction_type), pnl]
+                for order_id, entry_time, exit_time, transaction_type, pnl in zip(trades["order_id"],
+                                                                                  trades["entry_time"],
+                                                                                  trades["exit_time"],
+                                                                                  trades["transaction_type"],
+                                                                                  trades["pnl"].tolist())]
+
+    def get_backtest_report(self) -> dict:
+        """Stats, daily/monthly breakdowns and per-trade excursions of the paper broker (see analytics)"""
+        return get_backtest_report(self.broker.ledger.get_trades(),
+                                   self.broker.get_equity_curve(),
+                                   exposure=self.broker.get_exposure_curve(),
+                                   candle_ranges=self.broker.get_candle_ranges(),
+                                   capital=self.backtest_capital)
+
+    def get_backtest_stats(self) -> dict:
+        """Summary statistics over the trades closed by the paper broker"""
+        return self.get_backtest_report()["stats"]
+
     def backtest(self,
                  scrip: str,
                  exchange: str,
@@ -302,65 +590,33 @@ class Bot(LoggerMixin):
                                                                 "exchange": exchange},
                                                                 self.data_provider.__class__)
 
-        context, data = None, None
-        if self.backtest_type == "standard":
-            self.logger.info(f"Standard back test")
+        context, data, result = None, None, None
+        if self.backtest_type in ["standard", "fast"]:
+            verbose = self.backtest_type == "standard"
+            self.logger.info(f"{self.backtest_type.capitalize()} back test")
             context, data = self.__get_context_data(scrip=data_provider_instrument["scrip"],
                                                     exchange=data_provider_instrument["exchange"],
                                                     from_date=context_from_date,
                                                     to_date=to_date,
                                                     interval=interval,
                                                     blend_live_data=False)
-
-            print("Backtest Data")
-            print(data)
-            print("Context")
-            print(context)
-            ts = None
-            first_timeset_done = False
+            if verbose:
+                print("Backtest Data")
+                print(data)
+                print("Context")
+                print(context)
 
             if not self.backtest_display_data_only:
-
                 if isinstance(from_date, str):
                     from_date = datestring_to_datetime(from_date)
-                start_ii = data.index.get_indexer([from_date], method="nearest")[0]
-
-                for ii in range(start_ii, len(data) - window_size + 1, 1):
-                    window = data.iloc[ii: ii + window_size]
-                    if ts is None or ts.day != window.iloc[-1].name.day:
-                        self.logger.info(f"Trading on {window.iloc[-1].name.day}")
-                    ts = window.iloc[-1].name
-                    now_tick = window.iloc[-1].name.to_pydatetime()
-                    prev_tick = window.iloc[-2].name.to_pydatetime()
-                    if not first_timeset_done:
-                        self.broker.set_current_time(prev_tick, traverse=False)
-                        first_timeset_done = True
-                    try:
-                        this_context = self.pick_relevant_context(context, now_tick)
-                        self.logger.info(f"Time now is {now_tick}; "
-                                        f"last-data point is at {prev_tick}")
-                        context_empty = False
-                        for k, v in this_context.items():
-                            if len(v) == 0:
-                                context_empty = True
-                                break
-                            print(f"{now_tick} {k} last tick: {v.iloc[-1].name}")
-                        if context_empty:
-                            continue
-                        self.do(window=window[:-1], context=this_context, scrip=scrip, exchange=exchange)                    
-                        if self.backtesting_print_tables:
-                            self.logger.info(f"--------------Tables After Strategy Computation Start {now_tick}-------------")
-                            self.broker.get_orders_as_table()
-                            self.broker.get_positions_as_table()
-                            self.logger.info(f"--------------Tables After Strategy Computation End {now_tick}-------------")
-
-                        self.logger.info(f"--------------Start Broker Activity for {now_tick} -------------")
-                    
-                        self.broker.set_current_time(now_tick, traverse=True)
-                        self.logger.info(f"--------------End Broker Activity for {now_tick} -------------")
-
-                    except PaperTraderTimeExceededException:
-                        self.logger.warn(f"Could not set time in paper broker to {now_tick}")
+                self.__walk_bars(scrip=scrip,
+                                 exchange=exchange,
+                                 data=data,
+                                 context=context,
+                                 from_date=from_date,
+                                 to_date=to_date,
+                                 window_size=window_size,
+                                 verbose=verbose)
         elif self.backtest_type == "live_simulation":
             self.logger.info(f"Live simulation backtest")
             if not self.backtest_display_data_only:
@@ -399,100 +655,53 @@ class Bot(LoggerMixin):
                     print(f"============== End {timeslot} ================")
 
         if not self.backtest_display_data_only:
+            if self.broker.mark_to_market != "bar":
+                self.broker.mark_positions_to_market()
             self.broker.get_tradebook_storage().commit()
 
             self.logger.info("===================== Stats ========================")
-            pnl_data = []
-            for k, v in self.broker.trade_pnl.items():
-                pnl_data.append([k,
-                                self.broker.trade_timestamps[k][0],
-                                self.broker.trade_timestamps[k][1],
-                                self.broker.trade_transaction_types[k],
-                                v])
-            cnts = [1 for v in self.broker.trade_pnl.values() if v > 0]
-            if len(cnts) > 0:
-                cnts = sum(cnts)
-            else:
-                cnts = 0
-            accuracy = 0.
-            if len(self.broker.trade_pnl) > 0:
-                accuracy = cnts / len(self.broker.trade_pnl)
-            max_drawdown = 0.
-            curr_drawdown = 0.
-            running_sum = 0.
-            lowest_point = 0.
-            max_profit_streak = 0
-            max_loss_streak = 0
-            loss_streak = 0
-            profit_streak = 0
-            for k, v in self.broker.trade_pnl.items():
-                running_sum += v
-                lowest_point = min(running_sum, lowest_point)
-                if v > 0:
-                    if curr_drawdown < 0:
-                        max_drawdown = min(max_drawdown, curr_drawdown)
-                        max_loss_streak = max(loss_streak, max_loss_streak)
-                        curr_drawdown = 0.
-                        loss_streak = 0
-                    profit_streak += 1
-                else:
-                    curr_drawdown += v
-                    loss_streak += 1
-                    max_profit_streak = max(profit_streak, max_profit_streak)
-                    profit_streak = 0
-            if curr_drawdown < 0:
-                max_drawdown = min(max_drawdown, curr_drawdown)
-            max_profit_streak = max(profit_streak, max_profit_streak)
-            max_loss_streak = max(loss_streak, max_loss_streak)
+            pnl_data = self.get_backtest_pnl_table()
+            report = self.get_backtest_report()
+            stats = report["stats"]
+            summary = [("Found {} trades.", "trades"),
+                       ("Accuracy: {}", "accuracy"),
+                       ("Max Drawdown: {}", "max_drawdown"),
+                       ("Lowest point: {}", "lowest_point"),
+                       ("Longest Loss Streak: {}", "longest_loss_streak"),
+                       ("Longest Profit Streak: {}", "longest_profit_streak"),
+                       ("Final Pnl: {}", "final_pnl"),
+                       ("Largest loss: {}", "largest_loss"),
+                       ("Profit factor: {}", "profit_factor"),
+                       ("Equity drawdown: {}", "max_equity_drawdown"),
+                       ("Longest drawdown: {}", "max_drawdown_duration"),
+                       ("Sharpe: {}", "sharpe"),
+                       ("Sortino: {}", "sortino"),
+                       ("CAGR: {}", "cagr"),
+                       ("Exposure: {}", "exposure")]
             os.makedirs(self.backtest_results_folder, exist_ok=True)
-            fname = f"backtest-{scrip}:{exchange}-{self.strategy.__class__.__name__}-{interval}-{from_date.strftime('%Y%m%d')}-{to_date.strftime('%Y%m%d')}.txt"
-            with open(os.path.join(self.backtest_results_folder, fname), 'w') as fid:
+            fname = f"backtest-{scrip}:{exchange}-{self.strategy.__class__.__name__}-{interval}-{from_date.strftime('%Y%m%d')}-{to_date.strftime('%Y%m%d')}"
+            with open(os.path.join(self.backtest_results_folder, f"{fname}.txt"), 'w') as fid:
                 print(tabulate(pnl_data, headers=["order_id", "entry_time", "exit_time", "pnl"]), file=fid)
-                print(f"Found {len(self.broker.trade_pnl)} trades.", file=fid)
-                print(f"Accuracy: {accuracy}", file=fid)
-                print(f"Max Drawdown: {max_drawdown}", file=fid)
-                print(f"Lowest point: {lowest_point}", file=fid)
-                print(f"Longest Loss Streak: {max_loss_streak}", file=fid)
-                print(f"Longest Profit Streak: {max_profit_streak}", file=fid)
-                print(f"Final Pnl: {running_sum}", file=fid)
-                print(f"Largest loss: {min(self.broker.trade_pnl.values()) if len(self.broker.trade_pnl) > 0 else 0}", file=fid)
+                for line, key in summary:
+                    print(line.format(stats[key]), file=fid)
+            write_report_json(report, os.path.join(self.backtest_results_folder, f"{fname}.json"))
             print(tabulate(pnl_data, headers=["order_id", "entry_time", "exit_time", "pnl"]))
-            self.logger.info(f"Found {len(self.broker.trade_pnl)} trades.")
-            self.logger.info(f"Accuracy: {accuracy}")
-            self.logger.info(f"Max Drawdown: {max_drawdown}")
-            self.logger.info(f"Lowest point: {lowest_point}")
-            self.logger.info(f"Longest Loss Streak: {max_loss_streak}")
-            self.logger.info(f"Longest Profit Streak: {max_profit_streak}")
-            self.logger.info(f"Final Pnl: {running_sum}")
-            self.logger.info(f"Largest loss: {min(self.broker.trade_pnl.values()) if len(self.broker.trade_pnl) > 0 else 0}")
+            for line, key in summary:
+                self.logger.info(line.format(stats[key]))
+            result = {"scrip": scrip,
+                      "exchange": exchange,
+                      "pnl_data": pnl_data,
+                      "stats": stats}
 
         if plot_results or self.backtest_display_data_only:
             if not self.backtest_display_data_only:
                 storage = self.broker.get_tradebook_storage()
-                positions = storage.get_positions_for_run(self.broker.strategy,
-                                                        self.broker.run_name,
-                                                        run_id=self.broker.run_id,
-                                                        from_date=from_date,
-                                                        to_date=to_date)
-                if positions is not None:
-                    positions = positions[(positions["scrip"] == scrip) & (positions["exchange"] == exchange)]
-                    data = data.merge(positions, on="date", how='left')
-
-                    data["pnl"].fillna(0., inplace=True)
-                    #import ipdb
-                    #ipdb.set_trace()
-                    daily_pnl = data["pnl"].resample('1d').apply('last').resample(interval,
-                                                                                origin=datetime.datetime.fromisoformat('1970-01-01 09:15:00')).ffill().fillna(0.)
-                    data = data.merge(daily_pnl, how='left', left_index=True, right_index=True)
-                    data["daily_pnl"] = data["pnl_y"]
-                    data["pnl"] = data["pnl_x"]
-                    data.drop(["pnl_x", "pnl_y"], axis=1, inplace=True)
-
-                    monthly_pnl = data["pnl"].resample('1M').apply('last').resample(interval).ffill().fillna(0.)
-                    data = data.merge(monthly_pnl, how='left', left_index=True, right_index=True)
-                    data["monthly_pnl"] = data["pnl_y"].fillna(0.)
-                    data["pnl"] = data["pnl_x"]
-                    data.drop(["pnl_x", "pnl_y"], axis=1, inplace=True)
+                equity = self.broker.get_equity_curve(scrip=scrip, exchange=exchange)
+                if len(equity) > 0:
+                    # Broker candles may be finer than the strategy bars
+                    data["pnl"] = equity.reindex(data.index, method="ffill").fillna(0.)
+                    data["daily_pnl"] = get_period_end_pnl(data["pnl"], "1D")
+                    data["monthly_pnl"] = get_period_end_pnl(data["pnl"], "1M")
                     print(data)
                     self.strategy.plottables["indicator_fields"].append({"field": "pnl", "panel": 1})
                     self.strategy.plottables["indicator_fields"].append({"field": "daily_pnl", "panel": 1})
@@ -512,6 +721,7 @@ class Bot(LoggerMixin):
                                         indicator_fields=self.strategy.plottables["indicator_fields"],
                                         plot_contexts=self.strategy.plot_context_candles,
                                         mpf_custom_kwargs=self.strategy.custom_plot_kwargs)
+        return result
 
     def get_trading_timeslots(self,
                               interval,
@@ -592,12 +802,19 @@ class Bot(LoggerMixin):
         self.broker.gtt_order_callback(refresh_cache=True)
         for ii, instrument in enumerate(data_provider_instruments):
             scrip, exchange = instrument["scrip"], instrument["exchange"]
-            context, data = self.__get_context_data(scrip=scrip,
-                                                    exchange=exchange,
-                                                    from_date=from_date,
-                                                    to_date=to_date,
-                                                    interval=interval,
-                                                    blend_live_data=True)
+            if self.incremental_indicators:
+                context, data = self.__get_incremental_context_data(scrip=scrip,
+                                                                    exchange=exchange,
+                                                                    from_date=from_date,
+                                                                    to_date=to_date,
+                                                                    interval=interval)
+            else:
+                context, data = self.__get_context_data(scrip=scrip,
+                                                        exchange=exchange,
+                                                        from_date=from_date,
+                                                        to_date=to_date,
+                                                        interval=interval,
+                                                        blend_live_data=True)
             context = self.pick_relevant_context(context, datetime.datetime.now())
 
 
@@ -607,10 +824,19 @@ class Bot(LoggerMixin):
                     exchange=broker_instruments[ii]["exchange"])
         self.logger.info(f"===== ended for {running_for_timeslot} =====")
 
+    def supports_incremental_indicators(self) -> bool:
+        """Whether every indicator pipeline of the strategy can be updated incrementally"""
+        pipelines = [self.strategy.indicator_pipeline["window"]] + list(self.strategy.indicator_pipeline["context"].values())
+        return all(pipeline.supports_update() for pipeline in pipelines)
+
     def live(self,
              instruments: list[dict[str, str]],
              interval: Optional[str] = None):
 
+        if self.incremental_indicators and not self.supports_incremental_indicators():
+            self.logger.warn("Indicators with an unbounded look-back cannot be updated incrementally, "
+                             "recomputing them on every timeslot instead")
+            self.incremental_indicators = False
         for timeslot, exectime in self.get_trading_timeslots(interval):
                 func = partial(self.do_live_trade_task,
                                instruments=instruments,
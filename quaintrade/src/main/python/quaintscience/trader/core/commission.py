@@ -0,0 +1,111 @@
+"""Commission models computing the charges of a fill
+
+A model is called with a completed order like the commission functions
+brokers always took, and remembers the charges of every order id, so
+every fill is priced once. The entry order of a trade is looked up again
+when its exit closes the trade, to net its charges out of the trade P&L,
+and gets the charges computed when it filled. Only the latest
+max_cached_orders orders are remembered, older ones are priced again if
+they are ever looked up.
+"""
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+from .logging import LoggerMixin
+from .ds import Order, TransactionType, TradingProduct
+
+
+class CommissionModel(ABC, LoggerMixin):
+
+    def __init__(self, *args,
+                 log_breakdown: bool = True,
+                 max_cached_orders: int = 10000,
+                 **kwargs):
+        self.log_breakdown = log_breakdown
+        self.max_cached_orders = max_cached_orders
+        self.cache = {}
+        super().__init__(*args, **kwargs)
+
+    @abstractmethod
+    def get_breakdown(self,
+                      price: float,
+                      quantity: float,
+                      transaction_type: TransactionType,
+                      product: TradingProduct) -> dict:
+        """Charges of one fill by component, with their sum under "total" """
+        pass
+
+    def __call__(self, order: Order) -> float:
+        fill = (order.price, order.quantity, order.transaction_type, order.product)
+        cached = self.cache.get(order.order_id)
+        if cached is not None and cached[0] == fill:
+            return cached[1]
+        breakdown = self.get_breakdown(*fill)
+        if self.log_breakdown:
+            self.logger.debug(f"Charges for {order.order_id} {order.transaction_type.value} "
+                              + " | ".join(f"{k}: {v}" for k, v in breakdown.items()),
+                              context={"order_id": order.order_id, **breakdown})
+        self.cache.pop(order.order_id, None)
+        self.cache[order.order_id] = (fill, breakdown["total"])
+        if len(self.cache) > self.max_cached_orders:
+            # Forget the oldest order, it is priced again if looked up later
+            del self.cache[next(iter(self.cache))]
+        return breakdown["total"]
+
+    def clear_cache(self):
+        self.cache = {}
+
+
+class NSECommissionModel(CommissionModel):
+    """Brokerage (a percentage capped at max_commission), STT, exchange, SEBI and stamp charges and GST"""
+
+    def __init__(self,
+                 *args,
+                 brokerage_percentage: float = 0.03,
+                 max_commission: float = 20,
+                 **kwargs):
+        self.brokerage_percentage = brokerage_percentage
+        self.max_commission = max_commission
+        super().__init__(*args, **kwargs)
+
+    def get_breakdown(self,
+                      price: float,
+                      quantity: float,
+                      transaction_type: TransactionType,
+                      product: TradingProduct) -> dict:
+        # NumPy scalars (prices of paper fills) round differently, see float.__round__
+        price, quantity = float(price), float(quantity)
+        brokerage = (self.brokerage_percentage / 100) * price * quantity
+        if self.max_commission > 0:
+            brokerage = min(brokerage, self.max_commission)
+        stt = 0.
+        if product == TradingProduct.MIS:
+            if transaction_type == TransactionType.SELL:
+                stt = (0.025 / 100) * price * quantity
+        else:
+            stt = (0.1 / 100) * price * quantity
+        transaction_charges = (0.00325 / 100) * price * quantity
+        sebi_charges = (price * quantity / 10000000) * 10
+        stamp_charges = 0.
+        if transaction_type == TransactionType.BUY:
+            stamp_charges = (0.015 / 100) * (price * quantity / 10000000)
+        gst = (18 / 100) * (brokerage + sebi_charges + transaction_charges)
+        breakdown = {"brokerage": round(brokerage, 2),
+                     "stt": round(stt, 2),
+                     "transaction_charges": round(transaction_charges, 2),
+                     "sebi_charges": round(sebi_charges, 2),
+                     "stamp_charges": round(stamp_charges, 2),
+                     "gst": round(gst, 2)}
+        breakdown["total"] = round(sum(breakdown.values()), 2)
+        return breakdown
+
+
+@lru_cache(maxsize=None)
+def get_nse_commission_model(brokerage_percentage: float, max_commission: float) -> NSECommissionModel:
+    return NSECommissionModel(brokerage_percentage=brokerage_percentage,
+                              max_commission=max_commission,
+                              log_breakdown=False)
+
+
+def nse_commission_func(order: Order, brokerage_percentage: float = 0.03, max_commission: float = 20) -> float:
+    return get_nse_commission_model(brokerage_percentage, max_commission)(order)
@@ -1,7 +1,9 @@
 from enum import Enum
-from dataclasses import dataclass
+from dataclasses import dataclass, fields, MISSING
+from typing import Optional, Iterable
 import datetime
-from typing import Optional
+import copy
+import sys
 
 
 from .util import (default_dataclass_field,
@@ -39,7 +41,42 @@ class OrderState(Enum):
     REJECTED = "rejected"
 
 
-@dataclass
+INTERNED_TAGS = {}
+MAX_INTERNED_TAGS = 100000
+
+
+def intern_tags(tags: Iterable[str]) -> tuple:
+    """Shared immutable tuple of interned tag strings, one per distinct list of tags
+
+    Strategies tag every order of a kind the same way, so orders end up
+    sharing a handful of tuples instead of holding a list each.
+    """
+    tags = tuple(tags) if tags is not None else ()
+    interned = INTERNED_TAGS.get(tags)
+    if interned is None:
+        interned = tuple(sys.intern(tag) if isinstance(tag, str) else tag for tag in tags)
+        if len(INTERNED_TAGS) < MAX_INTERNED_TAGS:
+            INTERNED_TAGS[interned] = interned
+    return interned
+
+
+def set_slotted_state(obj: object, state: object):
+    """Restore a slotted dataclass from a pickle, including ones taken before it had slots"""
+    if isinstance(state, tuple):
+        dict_state, slot_state = state
+        state = {**(dict_state or {}), **(slot_state or {})}
+    for f in fields(obj):
+        if f.name in state:
+            continue
+        if f.default is not MISSING:
+            object.__setattr__(obj, f.name, f.default)
+        elif f.default_factory is not MISSING:
+            object.__setattr__(obj, f.name, f.default_factory())
+    for k, v in state.items():
+        object.__setattr__(obj, k, v)
+
+
+@dataclass(slots=True)
 class Order:
     scrip_id: str
     exchange_id: str
@@ -60,9 +97,22 @@ class Order:
     cancelled_quantity: float = 0
     price: float = 0
     raw_dict: dict = default_dataclass_field({})
-    tags: list = default_dataclass_field([])
+    tags: tuple = ()
     parent_order_id: Optional[str] = None
     group_id: Optional[str] = None
+
+    def __post_init__(self):
+        self.tags = intern_tags(self.tags)
+
+    def __setstate__(self, state):
+        set_slotted_state(self, state)
+        self.tags = intern_tags(self.tags)
+
+    def copy(self) -> "Order":
+        """Shallow copy, sharing the (immutable) tags and copying raw_dict"""
+        order = copy.copy(self)
+        order.raw_dict = dict(self.raw_dict)
+        return order
    
     def __hash__(self):
         return hash(self.scrip, self.exchange, self.product.value, self.order_id)
@@ -77,7 +127,7 @@ class Order:
             return True
         return False
 
-@dataclass
+@dataclass(slots=True)
 class Position:
     scrip_id: str
     scrip: str
@@ -95,6 +145,16 @@ class Position:
     raw_dict: dict = default_dataclass_field({})
     stats: dict = default_dataclass_field({})
 
+    def __setstate__(self, state):
+        set_slotted_state(self, state)
+
+    def copy(self) -> "Position":
+        """Shallow copy, copying raw_dict and stats"""
+        position = copy.copy(self)
+        position.raw_dict = dict(self.raw_dict)
+        position.stats = dict(self.stats)
+        return position
+
     def __hash__(self):
         return hash(self.scrip, self.exchange, self.product.value)
 
@@ -0,0 +1,105 @@
+from typing import Optional, Iterable, Iterator
+import itertools
+
+from .ds import Order, OrderState
+
+
+class GTTRegistry:
+    """GTT pairs of (entry order, order placed once the entry completes), indexed by entry order id
+
+    Iterating the registry yields the pairs in the order they were added,
+    like the list of tuples brokers used to keep. Entries are not polled:
+    brokers call mark_ready whenever an entry order may have left the
+    pending state (filled, cancelled, rejected) and gtt_order_callback only
+    looks at the pairs returned by pop_ready_pairs.
+    """
+
+    def __init__(self, gtt_orders: Optional[Iterable[tuple[Order, Order]]] = None):
+        self.pairs = {}
+        self.seqs = {}
+        self.children = {}
+        self.ready = {}
+        self.counter = itertools.count()
+        if gtt_orders is not None:
+            for entry_order, other_order in gtt_orders:
+                self.add(entry_order, other_order)
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    def __iter__(self) -> Iterator[tuple[Order, Order]]:
+        # Over a copy, callers place and remove orders while iterating
+        return iter(list(self.pairs.values()))
+
+    def __contains__(self, entry_order_id: str) -> bool:
+        return entry_order_id in self.children
+
+    def add(self, entry_order: Order, other_order: Order):
+        key = (entry_order.order_id, other_order.order_id)
+        if key not in self.pairs:
+            self.seqs[key] = next(self.counter)
+            self.children.setdefault(entry_order.order_id, {})[other_order.order_id] = None
+        self.pairs[key] = (entry_order, other_order)
+        if entry_order.state != OrderState.PENDING:
+            self.mark_ready(entry_order.order_id)
+
+    def update(self, entry_order: Order, other_order: Order) -> bool:
+        """Replace a known pair, returns False if there is none"""
+        key = (entry_order.order_id, other_order.order_id)
+        if key not in self.pairs:
+            return False
+        self.pairs[key] = (entry_order, other_order)
+        return True
+
+    def update_entry(self, entry_order: Order):
+        """Use entry_order for every pair of its order id"""
+        for other_order_id in self.children.get(entry_order.order_id, {}):
+            key = (entry_order.order_id, other_order_id)
+            self.pairs[key] = (entry_order, self.pairs[key][1])
+        if entry_order.state != OrderState.PENDING:
+            self.mark_ready(entry_order.order_id)
+
+    def get_entry_orders(self, entry_order_id: str) -> list[Order]:
+        """Entry orders stored for an order id, one per pair"""
+        return [self.pairs[(entry_order_id, other_order_id)][0]
+                for other_order_id in self.children.get(entry_order_id, {})]
+
+    def get_orders_for(self, entry_order_id: str) -> list[Order]:
+        return [self.pairs[(entry_order_id, other_order_id)][1]
+                for other_order_id in self.children.get(entry_order_id, {})]
+
+    def remove(self, entry_order_id: str, other_order_id: str):
+        key = (entry_order_id, other_order_id)
+        if self.pairs.pop(key, None) is None:
+            return
+        del self.seqs[key]
+        children = self.children[entry_order_id]
+        del children[other_order_id]
+        if len(children) == 0:
+            del self.children[entry_order_id]
+            self.ready.pop(entry_order_id, None)
+
+    def remove_entry(self, entry_order_id: str) -> list[tuple[str, str]]:
+        """Forget every pair of an entry order, returns their (entry, other) order ids"""
+        removed = [(entry_order_id, other_order_id)
+                   for other_order_id in self.children.get(entry_order_id, {})]
+        for entry_id, other_id in removed:
+            self.remove(entry_id, other_id)
+        return removed
+
+    def clear(self):
+        self.__init__()
+
+    def mark_ready(self, entry_order_id: Optional[str]):
+        """Queue the pairs of an entry order for the next pop_ready_pairs"""
+        if entry_order_id in self.children:
+            self.ready[entry_order_id] = None
+
+    def pop_ready_pairs(self) -> list[tuple[Order, Order]]:
+        """Pairs of every entry marked ready since the last call, in the order they were added"""
+        keys = [(entry_order_id, other_order_id)
+                for entry_order_id in self.ready
+                for other_order_id in self.children.get(entry_order_id, {})]
+        self.ready = {}
+        keys.sort(key=lambda key: self.seqs[key])
+        return [self.pairs[key] for key in keys]
@@ -1,13 +1,19 @@
 from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
 from typing import Optional, Union, Tuple
 import datetime
+import hashlib
+import pickle
 import copy
+import os
 import numpy as np
 import pandas as pd
 import pandas_ta as pd_ta
 import talib
 
 from .logging import LoggerMixin
+from .util import resample_candle_data
+from .rolling import rolling_max, rolling_min, centered
 
 
 class Indicator(ABC, LoggerMixin):
@@ -148,16 +154,292 @@ class Indicator(ABC, LoggerMixin):
                 settings: dict) -> pd.DataFrame:
         pass
 
+    def get_lookback(self, settings: dict) -> Optional[int]:
+        """Rows of input, the current one included, that an output row depends on
+
+        None when it is not bounded (recursive definitions) or not known.
+        """
+        return None
+
+    def supports_update(self, settings: Optional[dict] = None) -> bool:
+        """Whether update() gives the rows compute() gives
+
+        The default update_impl does as long as the look-back is bounded,
+        indicators carrying their own accumulators override this.
+        """
+        return self.get_lookback(self.get_default_settings(settings)) is not None
+
+    def update(self, state: Optional[dict],
+               new_rows: pd.DataFrame,
+               output_column_names: Optional[Union[str, dict[str, str]]] = None,
+               settings: Optional[dict] = None) -> Tuple[dict, pd.DataFrame]:
+        """Compute the indicator for new_rows only, continuing from state
+
+        Pass state=None on the first call and the returned state on every
+        later call. Returns the new state and new_rows with the indicator
+        columns added.
+        """
+        new_rows, output_column_names, settings = self.preprocess(df=new_rows.copy(),
+                                                                  output_column_names=output_column_names,
+                                                                  settings=settings)
+        if not self.supports_update(settings):
+            raise ValueError(f"{self.__class__.__name__} cannot be updated incrementally, "
+                             f"its look-back is not bounded.")
+        if state is None:
+            state = {}
+        state, new_rows = self.update_impl(state=state,
+                                           new_rows=new_rows,
+                                           output_column_names=output_column_names,
+                                           settings=settings)
+        new_rows = self.postprocess(df=new_rows,
+                                    output_column_names=output_column_names,
+                                    settings=settings)
+        return state, new_rows
+
+    def update_impl(self, state: dict,
+                    new_rows: pd.DataFrame,
+                    output_column_names: dict[str, str],
+                    settings: dict) -> Tuple[dict, pd.DataFrame]:
+        """Recompute over the rows of the look-back (see get_lookback) plus new_rows
+
+        Indicators with recursive definitions override this to carry their
+        accumulators.
+        """
+        history = state.get("history")
+        df = new_rows if history is None else pd.concat([history, new_rows], axis=0)
+        state["history"] = df.iloc[-self.get_lookback(settings):]
+        df = self.compute_impl(df=df.copy(),
+                               output_column_names=output_column_names,
+                               settings=settings)
+        if isinstance(df, tuple):
+            df = df[0]
+        return state, df.iloc[len(df) - len(new_rows):]
+
+    def get_cache_token(self,
+                        output_column_names: Optional[Union[str, dict[str, str]]] = None,
+                        settings: Optional[dict] = None) -> str:
+        """Identifies what compute() produces for a given input
+
+        Only the class and the declared settings (setting_attrs) go into the
+        token, so it is the same in every process and cache files written by
+        one run are found by the next. Indicators must declare every
+        attribute their output depends on as a setting.
+        """
+        return repr((self.__class__.__module__,
+                     self.__class__.__qualname__,
+                     output_column_names,
+                     self.get_default_settings(settings)))
+
+
+class IndicatorCache(LoggerMixin):
+    """In-memory cache of resampled candles and indicator outputs
+
+    Indicator outputs are keyed by a checksum of the candles fed into the
+    pipeline plus the cache tokens of every indicator up to and including
+    the cached one, so an indicator is reused only if nothing upstream of
+    it changed. Only the columns an indicator added or modified are kept.
+
+    With cache_path set, indicator outputs are also written there as NumPy
+    files named by a hash of their key, so later runs over the same candles
+    skip the indicator. The least recently used files are evicted once the
+    folder grows beyond max_disk_bytes, and the least recently used entries
+    once those in memory hold more than max_memory_bytes (or number more
+    than max_entries).
+    """
+
+    def __init__(self, *args,
+                 max_entries: int = 1024,
+                 max_memory_bytes: int = 512 * 1024 * 1024,
+                 cache_path: Optional[str] = None,
+                 max_disk_bytes: int = 1024 * 1024 * 1024,
+                 **kwargs):
+        self.entries = OrderedDict()
+        self.entry_sizes = {}
+        self.memory_bytes = 0
+        self.max_entries = max_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.cache_path = cache_path
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        super().__init__(*args, **kwargs)
+        if self.cache_path is not None:
+            os.makedirs(self.cache_path, exist_ok=True)
+
+    @staticmethod
+    def checksum(df: pd.DataFrame) -> str:
+        row_hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+        digest = hashlib.sha1(row_hashes.tobytes())
+        digest.update(repr(list(df.columns)).encode())
+        return digest.hexdigest()
+
+    def get(self, key: tuple, persist: bool = False):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if persist and self.cache_path is not None:
+            value = self.read_from_disk(key)
+            if value is not None:
+                self.disk_hits += 1
+                self.put(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key: tuple, value, persist: bool = False):
+        if key in self.entries:
+            self.memory_bytes -= self.entry_sizes.pop(key)
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        self.entry_sizes[key] = self.get_memory_size(value)
+        self.memory_bytes += self.entry_sizes[key]
+        self.evict_from_memory()
+        if persist and self.cache_path is not None:
+            self.write_to_disk(key, value)
+
+    @classmethod
+    def get_memory_size(cls, value) -> int:
+        """Bytes held by the frames and series in a cached value"""
+        if isinstance(value, pd.DataFrame):
+            return int(value.memory_usage(index=True).sum())
+        if isinstance(value, pd.Series):
+            # Columns of a change share the index of their frame
+            return int(value.memory_usage(index=False))
+        if isinstance(value, dict):
+            return sum(cls.get_memory_size(item) for item in value.values())
+        if isinstance(value, (list, tuple)):
+            return sum(cls.get_memory_size(item) for item in value)
+        return 0
+
+    def evict_from_memory(self):
+        while len(self.entries) > 0 and (len(self.entries) > self.max_entries
+                                         or self.memory_bytes > self.max_memory_bytes):
+            key, _ = self.entries.popitem(last=False)
+            self.memory_bytes -= self.entry_sizes.pop(key)
+
+    def get_disk_filepath(self, key: tuple) -> str:
+        return os.path.join(self.cache_path, f"{hashlib.sha1(repr(key).encode()).hexdigest()}.npz")
+
+    def read_from_disk(self, key: tuple):
+        fpath = self.get_disk_filepath(key)
+        try:
+            with np.load(fpath, allow_pickle=True) as fid:
+                meta = pickle.loads(fid["meta"].tobytes())
+                if meta["key"] != key:
+                    return None
+                index = pd.Index(fid["index"], name=meta["index_name"])
+                frame = pd.DataFrame({col: fid[f"col{ii}"] for ii, col in enumerate(meta["columns"])},
+                                     index=index,
+                                     columns=meta["columns"])
+        except (OSError, KeyError, ValueError, pickle.UnpicklingError):
+            return None
+        # Touch the file so that eviction sees it as recently used
+        os.utime(fpath)
+        if meta["whole_frame"]:
+            changes = {"frame": frame}
+        else:
+            changes = {"columns": {col: frame[col] for col in frame.columns},
+                       "removed": meta["removed"]}
+        return changes, meta["output_column_names"], meta["settings"]
+
+    def write_to_disk(self, key: tuple, value):
+        changes, output_column_names, settings = value
+        if "frame" in changes:
+            frame = changes["frame"]
+        else:
+            frame = pd.DataFrame(changes["columns"])
+        meta = {"key": key,
+                "whole_frame": "frame" in changes,
+                "removed": changes.get("removed", []),
+                "columns": list(frame.columns),
+                "index_name": frame.index.name,
+                "output_column_names": output_column_names,
+                "settings": settings}
+        arrays = {f"col{ii}": frame[col].to_numpy() for ii, col in enumerate(frame.columns)}
+        fpath = self.get_disk_filepath(key)
+        tmp_fpath = f"{fpath}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_fpath, "wb") as fid:
+                np.savez(fid,
+                         meta=np.frombuffer(pickle.dumps(meta), dtype=np.uint8),
+                         index=frame.index.to_numpy(),
+                         **arrays)
+            os.replace(tmp_fpath, fpath)
+        except (OSError, pickle.PicklingError) as ex:
+            self.logger.warn(f"Could not write indicator cache file {fpath}: {ex}")
+            if os.path.exists(tmp_fpath):
+                os.remove(tmp_fpath)
+            return
+        self.evict_from_disk()
+
+    def evict_from_disk(self):
+        files = []
+        for entry in os.scandir(self.cache_path):
+            if entry.name.endswith(".npz"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, fpath in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(fpath)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def resample(self, data: pd.DataFrame, interval: str) -> pd.DataFrame:
+        key = ("resample", self.checksum(data), interval)
+        resampled = self.get(key)
+        if resampled is None:
+            resampled = resample_candle_data(data, interval)
+            self.put(key, resampled)
+        return resampled.copy()
+
+    def get_changes(self, before: pd.DataFrame, after: pd.DataFrame) -> dict:
+        if not before.index.equals(after.index):
+            return {"frame": after.copy()}
+        columns = {}
+        for col in after.columns:
+            if col not in before.columns or not before[col].equals(after[col]):
+                columns[col] = after[col].copy()
+        return {"columns": columns,
+                "removed": [col for col in before.columns if col not in after.columns]}
+
+    def apply_changes(self, df: pd.DataFrame, changes: dict) -> pd.DataFrame:
+        if "frame" in changes:
+            return changes["frame"].copy()
+        if len(changes["removed"]) > 0:
+            df = df.drop(columns=changes["removed"])
+        for col, values in changes["columns"].items():
+            df[col] = values.to_numpy(copy=True)
+        return df
+
 
 class IndicatorPipeline(Indicator):
     
     def __init__(self,
                  indicators: list[(Indicator, Union[str, dict[str, str]], dict)],
                  *args,
+                 cache: Optional[IndicatorCache] = None,
                  **kwargs):
         self.indicators = indicators
+        self.cache = cache
         super().__init__(*args, **kwargs)
 
+    def get_cache_token(self,
+                        output_column_names: Optional[Union[str, dict[str, str]]] = None,
+                        settings: Optional[dict] = None) -> str:
+        return repr((super().get_cache_token(output_column_names, settings),
+                     [indicator.get_cache_token(ind_output_column_names, indicator_settings)
+                      for indicator, ind_output_column_names, indicator_settings in self.indicators]))
+
+    def supports_update(self, settings: Optional[dict] = None) -> bool:
+        return all(indicator.supports_update(indicator_settings)
+                   for indicator, _, indicator_settings in self.indicators)
+
     def get_default_column_names_impl(self,
                                       output_column_names: dict[str, str],
                                       settings: dict) -> dict[str, str]:
@@ -168,20 +450,60 @@ class IndicatorPipeline(Indicator):
                 settings: dict) -> pd.DataFrame:
         ret_settings = {}
         ret_col_names = {}
+        cache_key = None
+        if self.cache is not None:
+            cache_key = (self.cache.checksum(df),)
         for indicator, ind_output_column_names, indicator_settings in self.indicators:
             if indicator_settings is None:
                 indicator_settings = {}
             indicator_settings = copy.deepcopy(indicator_settings).update(settings)
+            if cache_key is not None:
+                cache_key = cache_key + (indicator.get_cache_token(ind_output_column_names,
+                                                                   indicator_settings),)
+                cached = self.cache.get(cache_key, persist=True)
+                if cached is not None:
+                    self.logger.info(f"Reusing cached {indicator.__class__.__name__}")
+                    changes, indicator_output_column_names, indicator_settings = cached
+                    df = self.cache.apply_changes(df, changes)
+                    ret_col_names.update(indicator_output_column_names)
+                    ret_settings.update(indicator_settings)
+                    continue
+                before = df.copy()
             self.logger.info(f"Applying {indicator.__class__.__name__}")
             (df,
              indicator_output_column_names,
              indicator_settings) = indicator.compute(df,
                                                      ind_output_column_names,
                                                      indicator_settings)
+            if cache_key is not None:
+                self.cache.put(cache_key, (self.cache.get_changes(before, df),
+                                           copy.deepcopy(indicator_output_column_names),
+                                           copy.deepcopy(indicator_settings)),
+                               persist=True)
             ret_col_names.update(indicator_output_column_names)
             ret_settings.update(indicator_settings)
         return df, ret_col_names, ret_settings
 
+    def update(self, state: Optional[dict],
+               new_rows: pd.DataFrame,
+               output_column_names: Optional[Union[str, dict[str, str]]] = None,
+               settings: Optional[dict] = None) -> Tuple[dict, pd.DataFrame]:
+        if state is None:
+            state = {"indicators": [None for _ in self.indicators]}
+        settings = self.get_default_settings(settings)
+        df = new_rows.copy()
+        for ii, (indicator, ind_output_column_names, indicator_settings) in enumerate(self.indicators):
+            if indicator_settings is None:
+                indicator_settings = {}
+            # Same settings as compute_impl hands to each indicator
+            indicator_settings = copy.deepcopy(indicator_settings).update(settings)
+            (state["indicators"][ii],
+             df) = indicator.update(state["indicators"][ii],
+                                    df,
+                                    ind_output_column_names,
+                                    indicator_settings)
+        return state, df
+
 
 class SlopeIndicator(Indicator):
     def __init__(self,
@@ -202,6 +524,9 @@ class SlopeIndicator(Indicator):
         output_column_names["acceleration"] = f"{settings['signal']}_acceleration"
         return output_column_names
 
+    def get_lookback(self, settings: dict) -> Optional[int]:
+        return settings['shift'] + 2
+
     def compute_impl(self, df: pd.DataFrame,
                      output_column_names: dict[str, str],
                      settings: dict) -> pd.DataFrame:
@@ -231,11 +556,34 @@ class DonchianIndicator(Indicator):
                 output_column_names: dict[str, str],
                 settings: dict) -> pd.DataFrame:
             
-        df[output_column_names["upper"]] = df["high"].rolling(settings['period']).apply(lambda x: max(x))
-        df[output_column_names["lower"]] = df["low"].rolling(settings['period']).apply(lambda x: min(x))
+        df[output_column_names["upper"]] = rolling_max(df["high"].to_numpy(dtype=float), settings['period'])
+        df[output_column_names["lower"]] = rolling_min(df["low"].to_numpy(dtype=float), settings['period'])
         df[output_column_names["basis"]] = (df[output_column_names["upper"]] + df[output_column_names["lower"]]) / 2
         return df
 
+    def update_impl(self, state: dict,
+                    new_rows: pd.DataFrame,
+                    output_column_names: dict[str, str],
+                    settings: dict) -> Tuple[dict, pd.DataFrame]:
+        period = settings['period']
+        highs = state.setdefault("highs", deque(maxlen=period))
+        lows = state.setdefault("lows", deque(maxlen=period))
+        upper = np.full(len(new_rows), np.nan)
+        lower = np.full(len(new_rows), np.nan)
+        for ii, (high, low) in enumerate(zip(new_rows["high"].to_numpy(), new_rows["low"].to_numpy())):
+            highs.append(high)
+            lows.append(low)
+            if len(highs) == period:
+                upper[ii] = max(highs)
+                lower[ii] = min(lows)
+        new_rows[output_column_names["upper"]] = upper
+        new_rows[output_column_names["lower"]] = lower
+        new_rows[output_column_names["basis"]] = (new_rows[output_column_names["upper"]] + new_rows[output_column_names["lower"]]) / 2
+        return state, new_rows
+
+    def supports_update(self, settings: Optional[dict] = None) -> bool:
+        return True
+
 
 class PullbackDetector(Indicator):
 
@@ -276,70 +624,78 @@ class PullbackDetector(Indicator):
                      output_column_names: dict[str, str],
                      settings: dict) -> pd.DataFrame:
            
-        after_breakout = False
-        pull_back_in_progress = False
-
         df["_breakouts"] = 0.0
         if settings["pullback_direction"] == PullbackDetector.PULLBACK_DIRECTION_DOWN:
             df.loc[df[settings["price_column"]] >= df[settings["breakout_column"]], "_breakouts"] = 1.0
         else:
             df.loc[df[settings["price_column"]] <= df[settings["breakout_column"]], "_breakouts"] = 1.0
 
-        prev_row = None
         for v in output_column_names.values():
             df[v] = 0.
-        for _, row in df.iterrows():
-            if settings["pullback_direction"] == PullbackDetector.PULLBACK_DIRECTION_DOWN:
-                if (prev_row is not None
-                    and row["_breakouts"] != 1.0
-                    and prev_row["_breakouts"] == 1.0):
-                        df.loc[row.name, output_column_names["pullback_start"]] = 1.0
-                        if self.is_red_candle(row):
-                            pull_back_in_progress = True
-                            after_breakout = False
-                        else:
-                            after_breakout = True
-                            pull_back_in_progress = False
-                        prev_row = row
-                        continue
-                if after_breakout:
-                    if (self.is_red_candle(row)
-                        and not self.is_doji(row, settings=settings)):
-                        pull_back_in_progress = True
-                        after_breakout = False
-                elif pull_back_in_progress:
-                    if self.is_green_candle(row):
-                        df.loc[row.name, output_column_names["pullback_end"]] = 1.0
-                        pull_back_in_progress = False
-                        after_breakout = False
-                prev_row = row
-            if settings["pullback_direction"] == PullbackDetector.PULLBACK_DIRECTION_UP:
-                if (prev_row is not None
-                    and row["_breakouts"] != 1.0
-                    and prev_row["_breakouts"] == 1.0):
-                        df.loc[row.name, output_column_names["pullback_start"]] = 1.0
-                        if self.is_green_candle(row):
-                            pull_back_in_progress = True
-                            after_breakout = False
-                        else:
-                            after_breakout = True
-                            pull_back_in_progress = False
-                        prev_row = row
-                        continue
-                if after_breakout:
-                    if (self.is_green_candle(row)
-                        and not self.is_doji(row, settings=settings)):
-                        pull_back_in_progress = True
-                        after_breakout = False
-                elif pull_back_in_progress:
-                    if self.is_red_candle(row):
-                        df.loc[row.name, output_column_names["pullback_end"]] = 1.0
-                        pull_back_in_progress = False
-                        after_breakout = False
-                prev_row = row
-
+        if settings["pullback_direction"] not in [PullbackDetector.PULLBACK_DIRECTION_DOWN,
+                                                  PullbackDetector.PULLBACK_DIRECTION_UP]:
+            return df
+
+        # A pullback starts on the first bar after a run of breakout bars. It is
+        # in progress right away if that bar moves against the breakout, or else
+        # from the next such non-doji bar, and ends on the next bar moving with
+        # the breakout. Later breakouts discard any pullback still in progress.
+        red = self.get_red_candles(df)
+        if settings["pullback_direction"] == PullbackDetector.PULLBACK_DIRECTION_DOWN:
+            against, towards = red, ~red
+        else:
+            against, towards = ~red, red
+        breakouts = df["_breakouts"].to_numpy()
+        starts = np.flatnonzero((breakouts[1:] != 1.0) & (breakouts[:-1] == 1.0)) + 1
+        if len(starts) == 0:
+            return df
+        n = len(df)
+        next_against = self.next_true_index(against & ~self.get_dojis(df, settings))
+        next_towards = self.next_true_index(towards)
+        segment_ends = np.append(starts[1:], n)
+        progress_from = np.where(against[starts], starts, next_against[starts + 1])
+        valid = progress_from < segment_ends
+        ends = next_towards[progress_from[valid] + 1]
+        ends = ends[ends < segment_ends[valid]]
+
+        df.iloc[starts, df.columns.get_loc(output_column_names["pullback_start"])] = 1.0
+        df.iloc[ends, df.columns.get_loc(output_column_names["pullback_end"])] = 1.0
         return df
 
+    @staticmethod
+    def next_true_index(mask: np.ndarray) -> np.ndarray:
+        """For every position, the first position at or after it where mask is set (len(mask) if none)
+
+        Has one extra trailing element so that it can be looked up at len(mask).
+        """
+        n = len(mask)
+        idx = np.where(mask, np.arange(n), n)
+        return np.append(np.minimum.accumulate(idx[::-1])[::-1], n)
+
+    def get_red_candles(self, df: pd.DataFrame) -> np.ndarray:
+        """Vectorized is_red_candle over all rows"""
+        red = (df["open"] > df["close"]).to_numpy()
+        for col in ["CDLSHOOTINGSTAR", "CDLHANGINGMAN"]:
+            if col in df.columns:
+                red = red | (df[col] != 0).to_numpy()
+        return red
+
+    def get_dojis(self, df: pd.DataFrame, settings: dict) -> np.ndarray:
+        """Vectorized is_doji over all rows"""
+        wick_threshold = settings.get("wick_threshold", getattr(self, "wick_threshold", 2.0))
+        opn = df["open"].to_numpy(dtype=float)
+        high = df["high"].to_numpy(dtype=float)
+        low = df["low"].to_numpy(dtype=float)
+        close = df["close"].to_numpy(dtype=float)
+        body = np.abs(opn - close)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            upper = body / (high - np.where(opn > close, opn, close))
+            lower = body / (np.where(close < opn, close, opn) - low)
+        doji = ~((upper >= wick_threshold) | (lower >= wick_threshold))
+        if "CDLDOJI" in df.columns:
+            doji = doji | (df["CDLDOJI"] != 0).to_numpy()
+        return doji
+
 
 class PastPeriodHighLowIndicator(Indicator):
 
@@ -434,37 +790,32 @@ class IntradayHighLowIndicator(Indicator):
                      settings: dict) -> pd.DataFrame:
 
 
-        df[output_column_names["period_high"]] = np.nan
-        df[output_column_names["period_low"]] = np.nan
-
-        current_high = np.nan
-        current_low = np.nan
-        
-        for row_id, row in df.iterrows():
-            if (row_id.hour < settings["start_hour"]
-                or (row_id.hour == settings["start_hour"] and row_id.minute < settings["start_minute"])):
-                current_high = np.nan
-                current_low = np.nan
-                continue
-            if (((row_id.hour == settings["start_hour"] and row_id.minute >= settings["start_minute"])
-                 or row_id.hour > settings["start_hour"])
-                 and (row_id.hour < settings["end_hour"] or
-                      (row_id.hour == settings["end_hour"] and row_id.minute <= settings["end_hour"]))):
-                if np.isnan(current_high):
-                    current_high = row["high"]
-                else:
-                    current_high = max(current_high, row["high"])
-                if np.isnan(current_low):
-                    current_low = row["low"]
-                else:
-                    current_low = min(current_low, row["low"])
-            df.loc[row_id, output_column_names["period_high"]] = current_high
-            df.loc[row_id, output_column_names["period_low"]] = current_low
+        hours = df.index.hour.to_numpy()
+        minutes = df.index.minute.to_numpy()
+        before = ((hours < settings["start_hour"])
+                  | ((hours == settings["start_hour"]) & (minutes < settings["start_minute"])))
+        inside = ~before & ((hours < settings["end_hour"])
+                            | ((hours == settings["end_hour"]) & (minutes <= settings["end_hour"])))
+        # The running high/low restarts after every bar before the start time,
+        # is extended by bars inside the period and carried over bars after it
+        segments = np.cumsum(before)
+        for col, signal in [("period_high", "high"), ("period_low", "low")]:
+            values = pd.Series(np.where(inside, df[signal].to_numpy(dtype=float), np.nan))
+            if signal == "high":
+                values = values.groupby(segments).cummax()
+            else:
+                values = values.groupby(segments).cummin()
+            values = values.groupby(segments).ffill().to_numpy(copy=True)
+            values[before] = np.nan
+            df[output_column_names[col]] = values
 
         return df
 
 
 class MAIndicator(Indicator):
+
+    # Moving averages whose accumulators update_impl carries
+    stateful_ma_types = ["SMA", "EMA"]
         
     def __init__(self, *args,
                  period: int = 22,
@@ -490,6 +841,50 @@ class MAIndicator(Indicator):
                                                                             timeperiod=self.period)
         return df
 
+    def update_impl(self, state: dict,
+                    new_rows: pd.DataFrame,
+                    output_column_names: dict[str, str],
+                    settings: dict) -> Tuple[dict, pd.DataFrame]:
+        # Mirrors TA-Lib's running sum (SMA) and SMA-seeded recursion (EMA)
+        if settings["ma_type"] not in self.stateful_ma_types:
+            return super().update_impl(state, new_rows, output_column_names, settings)
+        period = self.period
+        values = state.setdefault("values", deque())
+        total = state.get("total", 0.)
+        ema = state.get("ema", np.nan)
+        count = state.get("count", 0)
+        k = 2.0 / (period + 1)
+        out = np.full(len(new_rows), np.nan)
+        for ii, value in enumerate(new_rows[settings['signal']].to_numpy(dtype=float)):
+            count += 1
+            if settings["ma_type"] == "SMA":
+                values.append(value)
+                total += value
+                if len(values) == period:
+                    out[ii] = total / period
+                    total -= values.popleft()
+            elif count < period:
+                total += value
+            elif count == period:
+                total += value
+                ema = total / period
+                out[ii] = ema
+            else:
+                ema = ((value - ema) * k) + ema
+                out[ii] = ema
+        state.update({"total": total, "ema": ema, "count": count})
+        new_rows[output_column_names["MA"]] = out
+        return state, new_rows
+
+    def get_lookback(self, settings: dict) -> Optional[int]:
+        if settings["ma_type"] in ["SMA", "WMA", "TRIMA"]:
+            return self.period
+        return None
+
+    def supports_update(self, settings: Optional[dict] = None) -> bool:
+        settings = self.get_default_settings(settings)
+        return settings["ma_type"] in self.stateful_ma_types or super().supports_update(settings)
+
 class SMMAIndicator(Indicator):
         
     def __init__(self, *args,
@@ -553,6 +948,47 @@ class ATRIndicator(Indicator):
         df[output_column_names["ATR"]] = talib.ATR(df["high"], df["low"], df["close"], timeperiod=settings['period'])
         return df
 
+    def update_impl(self, state: dict,
+                    new_rows: pd.DataFrame,
+                    output_column_names: dict[str, str],
+                    settings: dict) -> Tuple[dict, pd.DataFrame]:
+        # Mirrors TA-Lib: SMA of the first `period` true ranges, then Wilder smoothing
+        period = settings['period']
+        prev_close = state.get("prev_close")
+        count = state.get("count", 0)
+        atr = state.get("atr", 0.)
+        out = np.full(len(new_rows), np.nan)
+        for ii, (high, low, close) in enumerate(zip(new_rows["high"].to_numpy(dtype=float),
+                                                    new_rows["low"].to_numpy(dtype=float),
+                                                    new_rows["close"].to_numpy(dtype=float))):
+            if prev_close is None:
+                prev_close = close
+                continue
+            true_range = high - low
+            true_range = max(true_range, abs(prev_close - high))
+            true_range = max(true_range, abs(prev_close - low))
+            prev_close = close
+            count += 1
+            if period == 1:
+                out[ii] = true_range
+            elif count < period:
+                atr += true_range
+            elif count == period:
+                atr += true_range
+                atr = atr / period
+                out[ii] = atr
+            else:
+                atr *= period - 1
+                atr += true_range
+                atr /= period
+                out[ii] = atr
+        state.update({"prev_close": prev_close, "count": count, "atr": atr})
+        new_rows[output_column_names["ATR"]] = out
+        return state, new_rows
+
+    def supports_update(self, settings: Optional[dict] = None) -> bool:
+        return True
+
 
 class RSIIndicator(Indicator):
         
@@ -580,6 +1016,43 @@ class RSIIndicator(Indicator):
         df[output_column_names["RSI"]] = talib.RSI(df["close"], timeperiod=settings['period'])
         return df
 
+    def update_impl(self, state: dict,
+                    new_rows: pd.DataFrame,
+                    output_column_names: dict[str, str],
+                    settings: dict) -> Tuple[dict, pd.DataFrame]:
+        # Mirrors TA-Lib: average gain/loss over the first `period` changes, then Wilder smoothing
+        period = settings['period']
+        prev = state.get("prev")
+        count = state.get("count", 0)
+        gain = state.get("gain", 0.)
+        loss = state.get("loss", 0.)
+        out = np.full(len(new_rows), np.nan)
+        for ii, value in enumerate(new_rows["close"].to_numpy(dtype=float)):
+            if prev is None:
+                prev = value
+                continue
+            change = value - prev
+            prev = value
+            count += 1
+            if count > period:
+                loss *= period - 1
+                gain *= period - 1
+            if change < 0:
+                loss -= change
+            else:
+                gain += change
+            if count >= period:
+                loss /= period
+                gain /= period
+                total = gain + loss
+                out[ii] = 0. if -1e-8 < total < 1e-8 else 100. * (gain / total)
+        state.update({"prev": prev, "count": count, "gain": gain, "loss": loss})
+        new_rows[output_column_names["RSI"]] = out
+        return state, new_rows
+
+    def supports_update(self, settings: Optional[dict] = None) -> bool:
+        return True
+
 
 class ChoppinessIndicator(Indicator):
         
@@ -676,6 +1149,9 @@ class BBANDSIndicator(Indicator):
         output_column_names.update(dict(zip(x, y)))
         return output_column_names
 
+    def get_lookback(self, settings: dict) -> Optional[int]:
+        return settings['period']
+
     def compute_impl(self, df: pd.DataFrame,
                      output_column_name: dict[str, str],
                      settings: dict = None) -> pd.DataFrame:
@@ -732,6 +1208,9 @@ class MajorityRuleIndicator(Indicator):
         output_column_names.update({"majority_rule": f"majority_rule_{settings['period']}"})
         return output_column_names
 
+    def get_lookback(self, settings: dict) -> Optional[int]:
+        return settings['period']
+
     def compute_impl(self, df: pd.DataFrame,
                      output_column_names: dict[str, str],
                      settings: dict) -> pd.DataFrame:
@@ -773,24 +1252,26 @@ class IchimokuIndicator(Indicator):
         return output_column_names
 
     def compute_impl(self, df: pd.DataFrame,
-                     output_column_name: dict[str, str],
+                     output_column_names: dict[str, str],
                      settings: dict) -> pd.DataFrame:
         # Tenkan-sen (Conversion Line): (9-period high + 9-period low)/2))
-        period9_high = df["high"].rolling(window=settings["tenkan_period"]).max()
-        period9_low = df["low"].rolling(window=settings["tenkan_period"]).min()
+        highs = df["high"].to_numpy(dtype=float)
+        lows = df["low"].to_numpy(dtype=float)
+        period9_high = pd.Series(rolling_max(highs, settings["tenkan_period"]), index=df.index)
+        period9_low = pd.Series(rolling_min(lows, settings["tenkan_period"]), index=df.index)
         tenkan_sen = (period9_high + period9_low) / 2
 
         # Kijun-sen (Base Line): (26-period high + 26-period low)/2))
-        period26_high = df["high"].rolling(window=settings["kijun_period"]).max()
-        period26_low = df["low"].rolling(window=settings["kijun_period"]).min()
+        period26_high = pd.Series(rolling_max(highs, settings["kijun_period"]), index=df.index)
+        period26_low = pd.Series(rolling_min(lows, settings["kijun_period"]), index=df.index)
         kijun_sen = (period26_high + period26_low) / 2
 
         # Senkou Span A (Leading Span A): (Conversion Line + Base Line)/2))
         senkou_span_a = ((tenkan_sen + kijun_sen) / 2).shift(26)
 
         # Senkou Span B (Leading Span B): (52-period high + 52-period low)/2))
-        period52_high = df["high"].rolling(window=settings["senkou_span_b_period"]).max()
-        period52_low = df["low"].rolling(window=settings["senkou_span_b_period"]).min()
+        period52_high = pd.Series(rolling_max(highs, settings["senkou_span_b_period"]), index=df.index)
+        period52_low = pd.Series(rolling_min(lows, settings["senkou_span_b_period"]), index=df.index)
         senkou_span_b = ((period52_high + period52_low) / 2).shift(26)
 
         # The most current closing price plotted 22 time periods behind (optional)
@@ -834,9 +1315,10 @@ class PivotIndicator(Indicator):
                      output_column_names: dict[str, str],
                      settings: dict) -> pd.DataFrame:
 
-        df[output_column_names["pivot_high"]] = df["high"].shift(-settings["right_period"], fill_value=0).rolling(settings["left_period"]).max()
-        df[output_column_names["pivot_low"]] = df["low"].shift(-settings["right_period"], fill_value=0).rolling(settings["left_period"]).min()
-        print(df)
+        df[output_column_names["pivot_high"]] = rolling_max(df["high"].shift(-settings["right_period"], fill_value=0).to_numpy(dtype=float),
+                                                            settings["left_period"])
+        df[output_column_names["pivot_low"]] = rolling_min(df["low"].shift(-settings["right_period"], fill_value=0).to_numpy(dtype=float),
+                                                           settings["left_period"])
         return df
 
 
@@ -854,6 +1336,9 @@ class GapUpDownIndicator(Indicator):
                                     "gapdown": "gapdown"})
         return output_column_names
 
+    def get_lookback(self, settings: dict) -> Optional[int]:
+        return 2
+
     def compute_impl(self, df: pd.DataFrame,
                      output_column_names: dict[str, str],
                      settings: dict) -> pd.DataFrame:
@@ -893,34 +1378,40 @@ class HeikinAshiIndicator(Indicator):
                      settings: dict) -> pd.DataFrame:
 
 
-        heikin_ashi_df = pd.DataFrame(index=df.index.values,
-                                      columns=['open',
-                                               'high',
-                                               'low',
-                                               'close',
-                                               'volume',
-                                               'oi'])
-    
-        heikin_ashi_df['close'] = (df['open'] + df['high'] + df['low'] + df['close']) / 4
-        #heikin_ashi_df['close'] = df["close"]
-        heikin_ashi_df['close'] = (df['open'] + df['high'] + df['low'] + df['close']) / 4
-        #heikin_ashi_df['close'] = df["close"]
-        
-        for i in range(len(df)):
-            if i == 0:
-                heikin_ashi_df.iat[0, 0] = df['open'].iloc[0]
+        return self.update_impl({}, df, output_column_names, settings)[1]
+
+    def update_impl(self, state: dict,
+                    new_rows: pd.DataFrame,
+                    output_column_names: dict[str, str],
+                    settings: dict) -> Tuple[dict, pd.DataFrame]:
+        prev_open = state.get("prev_open")
+        prev_close = state.get("prev_close")
+        opens = new_rows["open"].to_numpy(dtype=float)
+        highs = new_rows["high"].to_numpy(dtype=float)
+        lows = new_rows["low"].to_numpy(dtype=float)
+        ha_close = ((new_rows['open'] + new_rows['high'] + new_rows['low'] + new_rows['close']) / 4).to_numpy(dtype=float)
+        ha_open = np.empty(len(new_rows))
+        for ii in range(len(new_rows)):
+            if prev_open is None:
+                ha_open[ii] = opens[ii]
             else:
-                heikin_ashi_df.iat[i, 0] = (heikin_ashi_df.iat[i-1, 0] + heikin_ashi_df.iat[i-1, 3]) / 2
-            
-        heikin_ashi_df['high'] = heikin_ashi_df.loc[:, ['open', 'close']].join(df['high']).max(axis=1)
-        
-        heikin_ashi_df['low'] = heikin_ashi_df.loc[:, ['open', 'close']].join(df['low']).min(axis=1)
-        
+                ha_open[ii] = (prev_open + prev_close) / 2
+            prev_open, prev_close = ha_open[ii], ha_close[ii]
+        state.update({"prev_open": prev_open, "prev_close": prev_close})
+        ha = {"open": ha_open,
+              "high": np.fmax(np.fmax(ha_open, ha_close), highs),
+              "low": np.fmin(np.fmin(ha_open, ha_close), lows),
+              "close": ha_close}
         for col in ["open", "high", "low", "close"]:
-            df[f"ha_{col}"] = heikin_ashi_df[col].astype(float)
+            new_rows[f"ha_{col}"] = ha[col]
             if settings['replace_ohlc']:
-                df[col] = heikin_ashi_df[col].astype(float)
+                new_rows[col] = ha[col]
+        return state, self.add_candle_signals(new_rows)
 
+    def supports_update(self, settings: Optional[dict] = None) -> bool:
+        return True
+
+    def add_candle_signals(self, df: pd.DataFrame) -> pd.DataFrame:
         df["ha_bullish"] = 0.
         df.loc[(df["ha_close"] > df["ha_open"]) & (df["ha_open"] == df["ha_low"]), "ha_bullish"] = 1.0
         df["ha_bearish"] = 0.
@@ -1012,6 +1503,9 @@ class BreakoutDetector(Indicator):
         output_column_names.update({"breakout": f"breakout_{settings['direction']}_of_{settings['threshold_signal']}_by_{settings['signal']}"})
         return output_column_names
 
+    def get_lookback(self, settings: dict) -> Optional[int]:
+        return 2
+
     def compute_impl(self, df: pd.DataFrame,
                      output_column_names: dict[str, str],
                      settings: dict | None = None) -> pd.DataFrame:
@@ -1143,6 +1637,7 @@ class WilliamsFractals(Indicator):
     def __init__(self, period: int = 2, *args, **kwargs):
         self.period = period
         kwargs["setting_attrs"] = ["period"]
+        super().__init__(*args, **kwargs)
     
     
     def get_default_column_names_impl(self,
@@ -1157,8 +1652,13 @@ class WilliamsFractals(Indicator):
         period = settings["period"]
         window = 2 * period + 1 # default 5
 
-        bears = df['high'].rolling(window, center=True).apply(lambda x: x[period] == max(x), raw=True)
-        bulls = df['low'].rolling(window, center=True).apply(lambda x: x[period] == min(x), raw=True)
+        highs = df['high'].to_numpy(dtype=float)
+        lows = df['low'].to_numpy(dtype=float)
+        # A fractal bar is the extreme of the window centered on it
+        window_high = centered(rolling_max(highs, window), window)
+        window_low = centered(rolling_min(lows, window), window)
+        bears = np.where(np.isnan(window_high), np.nan, (highs == window_high).astype(float))
+        bulls = np.where(np.isnan(window_low), np.nan, (lows == window_low).astype(float))
         df[output_column_names["up_fractal"]] = bulls
         df[output_column_names["down_fractal"]] = bears
 
@@ -0,0 +1,174 @@
+"""Columnar ledger of the fills and closed trades of a paper broker
+
+Fills are appended per instrument to growable NumPy columns (timestamp,
+signed quantity, price, charges). Positions are never marked to market
+bar by bar: the running quantity, cash flow and charges at any set of
+timestamps are cumulative sums looked up with searchsorted, so the P&L of
+every bar is a single vectorized multiply against the close array.
+"""
+from typing import Optional, Union
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from .ds import TransactionType
+from .util import to_epoch_ns
+
+
+class GrowableColumns:
+    """Equally long NumPy columns appended to one row at a time, doubling capacity when full"""
+
+    def __init__(self, dtypes: dict, capacity: int = 64):
+        self.dtypes = dtypes
+        self.size = 0
+        self.columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in dtypes.items()}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, **values) -> int:
+        row = self.size
+        if row == len(next(iter(self.columns.values()))):
+            for name, column in self.columns.items():
+                grown = np.empty(2 * len(column), dtype=column.dtype)
+                grown[:row] = column
+                self.columns[name] = grown
+        for name, value in values.items():
+            self.columns[name][row] = value
+        self.size += 1
+        return row
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name][:self.size]
+
+
+class PnLLedger:
+
+    FILL_DTYPES = {"timestamp": np.int64,
+                   "quantity": np.float64,
+                   "price": np.float64,
+                   "charges": np.float64}
+    TRADE_DTYPES = {"entry_timestamp": np.int64,
+                    "exit_timestamp": np.int64,
+                    "transaction_type": np.int8,
+                    "pnl": np.float64,
+                    "entry_price": np.float64,
+                    "exit_price": np.float64,
+                    "quantity": np.float64}
+
+    def __init__(self):
+        self.fills = {}
+        self.trades = GrowableColumns(self.TRADE_DTYPES)
+        self.trade_ids = []
+        self.trade_keys = []
+        self.trade_rows = {}
+
+    @staticmethod
+    def get_timestamp_ns(timestamp: Optional[Union[datetime.datetime, pd.Timestamp]]) -> int:
+        if timestamp is None or pd.isna(timestamp):
+            return np.iinfo(np.int64).min
+        return to_epoch_ns(timestamp)
+
+    def record_fill(self, key: str,
+                    timestamp: Union[int, datetime.datetime, pd.Timestamp],
+                    quantity: float,
+                    price: float,
+                    charges: float):
+        """Record a fill of an instrument, quantity is negative for sells"""
+        if key not in self.fills:
+            self.fills[key] = GrowableColumns(self.FILL_DTYPES)
+        if not isinstance(timestamp, (int, np.integer)):
+            timestamp = self.get_timestamp_ns(timestamp)
+        self.fills[key].append(timestamp=timestamp, quantity=quantity, price=price, charges=charges)
+
+    def record_trade(self, entry_order_id: str,
+                     entry_timestamp: Optional[datetime.datetime],
+                     exit_timestamp: Optional[datetime.datetime],
+                     transaction_type: TransactionType,
+                     pnl: float,
+                     key: Optional[str] = None,
+                     entry_price: float = np.nan,
+                     exit_price: float = np.nan,
+                     quantity: float = np.nan):
+        """Record the P&L of a closed trade, replacing an earlier one of the same entry order"""
+        values = {"entry_timestamp": self.get_timestamp_ns(entry_timestamp),
+                  "exit_timestamp": self.get_timestamp_ns(exit_timestamp),
+                  "transaction_type": 1 if transaction_type == TransactionType.BUY else -1,
+                  "pnl": pnl,
+                  "entry_price": entry_price,
+                  "exit_price": exit_price,
+                  "quantity": quantity}
+        row = self.trade_rows.get(entry_order_id)
+        if row is None:
+            self.trade_rows[entry_order_id] = self.trades.append(**values)
+            self.trade_ids.append(entry_order_id)
+            self.trade_keys.append(key)
+        else:
+            for name, value in values.items():
+                self.trades.columns[name][row] = value
+            self.trade_keys[row] = key
+
+    def clear_trades(self):
+        self.trades = GrowableColumns(self.TRADE_DTYPES)
+        self.trade_ids = []
+        self.trade_keys = []
+        self.trade_rows = {}
+
+    def get_trades(self) -> pd.DataFrame:
+        """Closed trades in the order they were first closed"""
+        return pd.DataFrame({"order_id": self.trade_ids,
+                             "entry_time": pd.to_datetime(self.trades["entry_timestamp"]),
+                             "exit_time": pd.to_datetime(self.trades["exit_timestamp"]),
+                             "transaction_type": np.where(self.trades["transaction_type"] > 0,
+                                                          TransactionType.BUY.value,
+                                                          TransactionType.SELL.value),
+                             "pnl": self.trades["pnl"],
+                             "key": self.trade_keys,
+                             "entry_price": self.trades["entry_price"],
+                             "exit_price": self.trades["exit_price"],
+                             "quantity": self.trades["quantity"]})
+
+    def get_fills(self, key: str) -> pd.DataFrame:
+        fills = self.fills.get(key, GrowableColumns(self.FILL_DTYPES))
+        return pd.DataFrame({"quantity": fills["quantity"],
+                             "price": fills["price"],
+                             "charges": fills["charges"]},
+                            index=pd.to_datetime(fills["timestamp"]))
+
+    def get_positions_at(self, key: str, timestamps: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Net quantity, cash flow and charges of an instrument after the fills up to each timestamp (ns)"""
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        fills = self.fills.get(key)
+        if fills is None or len(fills) == 0:
+            zeros = np.zeros(len(timestamps))
+            return zeros, zeros.copy(), zeros.copy()
+        # Fills are appended as time goes by, so they are sorted by timestamp
+        counts = np.searchsorted(fills["timestamp"], timestamps, side="right")
+        result = []
+        for column in [fills["quantity"], -fills["quantity"] * fills["price"], fills["charges"]]:
+            running = np.concatenate([[0.], np.cumsum(column)])
+            result.append(running[counts])
+        return tuple(result)
+
+    def mark_to_market(self, key: str, timestamps: np.ndarray, closes: np.ndarray) -> np.ndarray:
+        """P&L of an instrument at each timestamp (ns), valued at the matching close"""
+        quantity, cash_flow, charges = self.get_positions_at(key, timestamps)
+        return cash_flow + quantity * np.asarray(closes, dtype=np.float64) - charges
+
+
+def get_drawdown(equity: pd.Series) -> pd.Series:
+    """Distance of an equity curve below its running peak (zero or negative)"""
+    return equity - equity.cummax().clip(lower=0.)
+
+
+def get_period_end_pnl(equity: pd.Series, freq: str) -> pd.Series:
+    """Equity at the end of the period (e.g. "1D", "1M") each timestamp falls in"""
+    periods = equity.index.to_period(freq)
+    return equity.groupby(periods).transform("last")
+
+
+def get_periodic_pnl(equity: pd.Series, freq: str) -> pd.Series:
+    """P&L made in each period (e.g. "1D", "1M"), indexed by period"""
+    closing = equity.groupby(equity.index.to_period(freq)).last()
+    return closing.diff().fillna(closing.iloc[:1])
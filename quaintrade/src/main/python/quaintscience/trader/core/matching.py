@@ -0,0 +1,192 @@
+"""Price-priority queues matching pending orders against candles
+
+Every instrument keeps four heaps, each ordered by the price at which its
+orders become actionable first: buy stop triggers (ascending), sell stop
+triggers (descending), buy limits (descending) and sell limits
+(ascending). Only orders at the top of a heap that the candle actually
+reached are popped, so orders far from the market cost nothing per bar.
+
+Heap entries are invalidated lazily: an entry is skipped once its order
+is no longer pending, changed type, was replaced in the order book
+(update_order) or had its price edited, in which case it is queued again
+at the new price.
+
+How the price moved inside a candle is unknown, so the order in which
+crossed orders fill is decided by an intrabar path: a function of
+(open, high, low, close) returning the prices visited in order. The
+"placement" ordering skips the path and matches every crossed order
+against the whole candle in placement order, as the paper broker always
+did.
+"""
+from typing import Callable, Optional, Union
+import heapq
+import itertools
+
+from .ds import Order, OrderType, OrderState, TransactionType
+from .orderbook import OrderBook
+from .reflection import dynamically_load_class
+
+
+def nearest_extreme_first(open_price: float, high: float, low: float, close: float) -> list[float]:
+    """open -> whichever extreme is nearer to the open -> the other one -> close (high on ties)"""
+    if high - open_price <= open_price - low:
+        return [open_price, high, low, close]
+    return [open_price, low, high, close]
+
+
+def high_first(open_price: float, high: float, low: float, close: float) -> list[float]:
+    return [open_price, high, low, close]
+
+
+def low_first(open_price: float, high: float, low: float, close: float) -> list[float]:
+    return [open_price, low, high, close]
+
+
+def candle_direction(open_price: float, high: float, low: float, close: float) -> list[float]:
+    """Green candles dip to the low before the high, red ones peak before the low"""
+    if close >= open_price:
+        return [open_price, low, high, close]
+    return [open_price, high, low, close]
+
+
+INTRABAR_PATHS = {"nearest_extreme_first": nearest_extreme_first,
+                  "high_first": high_first,
+                  "low_first": low_first,
+                  "candle_direction": candle_direction,
+                  "placement": None}
+
+
+def get_intrabar_path(intrabar_path: Union[str, Callable, None]) -> Optional[Callable]:
+    """Resolve a path name (see INTRABAR_PATHS) or a fully qualified function name"""
+    if intrabar_path is None or callable(intrabar_path):
+        return intrabar_path
+    if intrabar_path in INTRABAR_PATHS:
+        return INTRABAR_PATHS[intrabar_path]
+    return dynamically_load_class(intrabar_path)
+
+
+class InstrumentOrderQueues:
+
+    def __init__(self):
+        self.buy_triggers = []
+        self.sell_triggers = []
+        self.buy_limits = []
+        self.sell_limits = []
+        self.market = []
+
+
+class OrderMatchingEngine:
+
+    TRIGGER_TYPES = (OrderType.SL_LIMIT, OrderType.SL_MARKET)
+
+    def __init__(self, order_book: OrderBook):
+        self.order_book = order_book
+        self.queues = {}
+        self.counter = itertools.count()
+
+    def get_queues(self, scrip: str, exchange: str) -> InstrumentOrderQueues:
+        return self.queues.setdefault((scrip, exchange), InstrumentOrderQueues())
+
+    def add(self, order: Order):
+        """Queue a pending order by the price that makes it actionable"""
+        if order.state != OrderState.PENDING:
+            return
+        queues = self.get_queues(order.scrip, order.exchange)
+        buy = order.transaction_type == TransactionType.BUY
+        if order.order_type in self.TRIGGER_TYPES:
+            if buy:
+                heapq.heappush(queues.buy_triggers, (order.trigger_price, next(self.counter), order))
+            else:
+                heapq.heappush(queues.sell_triggers, (-order.trigger_price, next(self.counter), order))
+        elif order.order_type == OrderType.LIMIT:
+            if buy:
+                heapq.heappush(queues.buy_limits, (-order.limit_price, next(self.counter), order))
+            else:
+                heapq.heappush(queues.sell_limits, (order.limit_price, next(self.counter), order))
+        else:
+            heapq.heappush(queues.market, (0., next(self.counter), order))
+
+    def __is_queued_as(self, order: Order, heap: list, queues: InstrumentOrderQueues) -> bool:
+        if order.state != OrderState.PENDING or self.order_book.get(order.order_id) is not order:
+            return False
+        if heap is queues.market:
+            return order.order_type == OrderType.MARKET
+        if order.order_type not in (self.TRIGGER_TYPES if heap is queues.buy_triggers or heap is queues.sell_triggers
+                                    else (OrderType.LIMIT,)):
+            return False
+        return (order.transaction_type == TransactionType.BUY) == (heap is queues.buy_triggers
+                                                                   or heap is queues.buy_limits)
+
+    def __peek(self, heap: list, queues: InstrumentOrderQueues) -> Optional[tuple]:
+        """Top valid entry of a heap as (price, seq, order), dropping stale ones"""
+        while len(heap) > 0:
+            key, seq, order = heap[0]
+            if not self.__is_queued_as(order, heap, queues):
+                heapq.heappop(heap)
+                continue
+            if heap is queues.market:
+                return key, seq, order
+            current = order.trigger_price if order.order_type in self.TRIGGER_TYPES else order.limit_price
+            price = -key if heap is queues.sell_triggers or heap is queues.buy_limits else key
+            if price != current:
+                heapq.heappop(heap)
+                self.add(order)
+                continue
+            return price, seq, order
+        return None
+
+    def pop_crossed_orders(self, scrip: str, exchange: str,
+                           low: float, high: float) -> list[Order]:
+        """Every order the candle range reached, in placement order"""
+        queues = self.queues.get((scrip, exchange))
+        if queues is None:
+            return []
+        orders = []
+        for heap, crossed in [(queues.buy_triggers, lambda price: price <= high),
+                              (queues.sell_triggers, lambda price: price >= low),
+                              (queues.buy_limits, lambda price: price >= low),
+                              (queues.sell_limits, lambda price: price <= high),
+                              (queues.market, lambda price: True)]:
+            while True:
+                top = self.__peek(heap, queues)
+                if top is None or not crossed(top[0]):
+                    break
+                heapq.heappop(heap)
+                orders.append(top[2])
+        orders.sort(key=lambda order: self.order_book.positions[order.order_id])
+        return orders
+
+    def pop_next_order(self, scrip: str, exchange: str,
+                       start: float, end: float) -> Optional[tuple[Order, float]]:
+        """Next order reached while the price moves from start to end, with the price it is reached at
+
+        Market orders come first at the start price. start == end looks both
+        ways, which is how orders crossed by a gap at the open are found.
+        """
+        queues = self.queues.get((scrip, exchange))
+        if queues is None:
+            return None
+        top = self.__peek(queues.market, queues)
+        if top is not None:
+            heapq.heappop(queues.market)
+            return top[2], start
+        best = None
+        candidates = []
+        if end >= start:
+            candidates += [(queues.buy_triggers, lambda price: price <= end, lambda price: max(price, start)),
+                           (queues.sell_limits, lambda price: price <= end, lambda price: max(price, start))]
+        if end <= start:
+            candidates += [(queues.sell_triggers, lambda price: price >= end, lambda price: min(price, start)),
+                           (queues.buy_limits, lambda price: price >= end, lambda price: min(price, start))]
+        for heap, crossed, reached_at in candidates:
+            top = self.__peek(heap, queues)
+            if top is None or not crossed(top[0]):
+                continue
+            price = reached_at(top[0])
+            rank = (abs(price - start), top[1])
+            if best is None or rank < best[0]:
+                best = (rank, heap, top[2], price)
+        if best is None:
+            return None
+        heapq.heappop(best[1])
+        return best[2], best[3]
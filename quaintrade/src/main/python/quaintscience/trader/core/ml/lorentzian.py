@@ -193,7 +193,8 @@ class LorentzianClassificationIndicator(Indicator):
                  lookback_window: int = 8,
                  relative_weight: float = 8.0,
                  regression_level: int = 25,
-                 crossover_lag: int = 2, **kwargs):
+                 crossover_lag: int = 2,
+                 knn_memory_limit_mb: float = 16.0, **kwargs):
         
         self.source = source
         self.neighbors_count = neighbors_count
@@ -215,6 +216,7 @@ class LorentzianClassificationIndicator(Indicator):
         self.relative_weight = relative_weight
         self.regression_level = regression_level
         self.crossover_lag = crossover_lag
+        self.knn_memory_limit_mb = knn_memory_limit_mb
 
         if feature_def is None:
             feature_def = [("RSI", 14, 2),  # f1
@@ -228,6 +230,14 @@ class LorentzianClassificationIndicator(Indicator):
         self.filter = None
         self.yhat1 = None
         self.yhat2 = None
+        # knn_memory_limit_mb only bounds the neighbor search, the predictions do not depend on it
+        kwargs["setting_attrs"] = ["source", "feature_def", "neighbors_count", "max_bars_back",
+                                   "use_dynamic_exists", "use_ema_filter", "ema_period",
+                                   "use_sma_filter", "sma_period", "signals", "use_volatility_filter",
+                                   "use_regime_filter", "use_adx_filter", "regime_threshold",
+                                   "adx_threshold", "use_kernel_filter", "use_kernel_smoothing",
+                                   "lookback_window", "relative_weight", "regression_level",
+                                   "crossover_lag"]
         super().__init__(*args, **kwargs)
 
 
@@ -452,6 +462,109 @@ class LorentzianClassificationIndicator(Indicator):
         return val
 
 
+    # Distances are scanned for neighbors in blocks of this many bars
+    neighbor_search_block_size = 64
+
+    def get_lorentzian_distances(self,
+                                 features: np.ndarray,
+                                 bars: range,
+                                 history: np.ndarray,
+                                 out: np.ndarray,
+                                 buffer: np.ndarray) -> np.ndarray:
+        """Lorentzian distances of each of the given bars to the history bars
+
+        Accumulated feature by feature into out (one row per bar) using
+        buffer as scratch space.
+        """
+        out.fill(0.0)
+        for feature, history_feature in zip(features, history):
+            np.subtract(feature[bars.start:bars.stop].reshape(-1, 1), history_feature.reshape(1, -1), out=buffer)
+            np.abs(buffer, out=buffer)
+            np.add(1, buffer, out=buffer)
+            np.log(buffer, out=buffer)
+            out += buffer
+        return out
+
+    def find_next_neighbor(self,
+                           distances: np.ndarray,
+                           block_max: np.ndarray,
+                           start: int,
+                           last_distance: float) -> int:
+        """First position from start on with a distance not below last_distance, -1 if none"""
+        block_size = self.neighbor_search_block_size
+        block = start // block_size
+        block_end = (block + 1) * block_size
+        if start < block_end:
+            hits = distances[start:block_end] >= last_distance
+            ii = hits.argmax()
+            if hits[ii]:
+                return start + int(ii)
+        blocks = block_max[block + 1:] >= last_distance
+        if len(blocks) == 0:
+            return -1
+        ii = blocks.argmax()
+        if not blocks[ii]:
+            return -1
+        block_start = (block + 1 + int(ii)) * block_size
+        return block_start + int((distances[block_start:block_start + block_size] >= last_distance).argmax())
+
+    def get_lorentzian_predictions(self,
+                                   features: np.ndarray,
+                                   y_train_array: np.ndarray,
+                                   maxBarsBackIndex: int) -> np.ndarray:
+        """Sum of the labels of the approximate nearest neighbors of every bar (see compute_impl)
+
+        Distances are computed for as many bars at a time as fit in
+        knn_memory_limit_mb. Instead of visiting every historic bar, each bar
+        jumps straight to the next one that would be accepted as a neighbor,
+        using per-block maxima of its distances.
+        """
+        n = features.shape[1]
+        prediction = np.zeros(n, dtype=np.int64)
+        size = n - maxBarsBackIndex
+        if size <= 0:
+            return prediction
+        # Every 4th bar is skipped to keep neighbors chronologically apart, so
+        # distances are only computed to the others
+        candidates = np.flatnonzero(np.arange(size) % 4 != 0)
+        history = features[:, candidates]
+        labels = y_train_array[candidates]
+        block_size = self.neighbor_search_block_size
+        padded_size = -(-len(candidates) // block_size) * block_size
+        # Two float64 matrices (distances and scratch space) per chunk of bars
+        chunk_size = int(self.knn_memory_limit_mb * 1024 * 1024 // (2 * 8 * max(padded_size, 1)))
+        chunk_size = max(1, min(chunk_size, size))
+        out = np.full((chunk_size, padded_size), -np.inf)
+        buffer = np.empty((chunk_size, len(candidates)))
+        predictions = []
+        distances = []
+        drop_index = round(self.neighbors_count * 3 / 4)
+        for chunk_start in range(maxBarsBackIndex, n, chunk_size):
+            bars = range(chunk_start, min(chunk_start + chunk_size, n))
+            chunk = self.get_lorentzian_distances(features, bars, history,
+                                                  out[:len(bars), :len(candidates)],
+                                                  buffer[:len(bars)])
+            chunk[np.isnan(chunk)] = -np.inf
+            for rr, bar_index in enumerate(bars):
+                span = min(self.max_bars_back, bar_index + 1)
+                chunk[rr, np.searchsorted(candidates, span):] = -np.inf
+            block_maxes = out[:len(bars)].reshape(len(bars), -1, block_size).max(axis=2)
+            for rr, bar_index in enumerate(bars):
+                row = out[rr]
+                lastDistance = -1.0
+                ii = self.find_next_neighbor(row, block_maxes[rr], 0, lastDistance)
+                while ii >= 0:
+                    lastDistance = row[ii]
+                    distances.append(lastDistance)
+                    predictions.append(int(labels[ii]))
+                    if len(predictions) > self.neighbors_count:
+                        lastDistance = distances[drop_index]
+                        distances.pop(0)
+                        predictions.pop(0)
+                    ii = self.find_next_neighbor(row, block_maxes[rr], ii + 1, lastDistance)
+                prediction[bar_index] = sum(predictions)
+        return prediction
+
     def compute_impl(self, df: pd.DataFrame,
                      output_column_names: str | dict[str, str] | None = None,
                      settings: dict | None = None) -> pd.DataFrame:
@@ -552,60 +665,14 @@ class LorentzianClassificationIndicator(Indicator):
 
         src = df[self.source]
 
-        def get_lorentzian_predictions():
-            for bar_index in range(maxBarsBackIndex): yield 0
-
-            predictions = []
-            distances = []
-            y_train_array = np.where(src.shift(4) < src.shift(0),
-                                     Direction.SHORT,
-                                     np.where(src.shift(4) > src.shift(0),
-                                              Direction.LONG,
-                                              Direction.NEUTRAL))
-
-            class Distances(object):
-                batchSize = 50
-                lastBatch = 0
-
-                def __init__(self, distances_features):
-                    self.size = (len(src) - maxBarsBackIndex)
-                    self.features = distances_features
-                    self.maxBarsBackIndex = maxBarsBackIndex
-                    self.dists = np.array([[0.0] * self.size] * self.batchSize)
-                    self.rows = np.array([0.0] * self.batchSize)
-
-                def __getitem__(self, item):
-                    batch = math.ceil((item + 1)/self.batchSize) * self.batchSize
-                    if batch > self.lastBatch:
-                        self.dists.fill(0.0)
-                        for feature in self.features:
-                            self.rows.fill(0.0)
-                            fBatch = feature[(self.maxBarsBackIndex + self.lastBatch):(self.maxBarsBackIndex + batch)]
-                            self.rows[:fBatch.size] = fBatch.reshape(-1,)
-                            val = np.log(1 + np.abs(self.rows.reshape(-1,1) - feature[:self.size].reshape(1,-1)))
-                            self.dists += val
-                        self.lastBatch = batch
-
-                    return self.dists[item % self.batchSize]
-
-            dists = Distances(features)
-            for bar_index in range(maxBarsBackIndex, len(src)):
-                lastDistance = -1.0
-                span = min(self.max_bars_back,
-                           bar_index + 1)
-                for i, d in enumerate(dists[bar_index - maxBarsBackIndex][:span]):
-                    if d >= lastDistance and i % 4:
-                        lastDistance = d
-                        distances.append(d)
-                        predictions.append(round(y_train_array[i]))
-                        if len(predictions) > self.neighbors_count:
-                            lastDistance = distances[round(self.neighbors_count * 3 / 4)]
-                            distances.pop(0)
-                            predictions.pop(0)
-                yield sum(predictions)
-
-
-        prediction = np.array([p for p in get_lorentzian_predictions()])
+        y_train_array = np.where(src.shift(4) < src.shift(0),
+                                 Direction.SHORT,
+                                 np.where(src.shift(4) > src.shift(0),
+                                          Direction.LONG,
+                                          Direction.NEUTRAL))
+        prediction = self.get_lorentzian_predictions(np.vstack(features),
+                                                     y_train_array.astype(np.int64),
+                                                     maxBarsBackIndex)
 
 
         # ============================
@@ -744,10 +811,10 @@ class LorentzianClassificationIndicator(Indicator):
         df["isNewBuySignal"] = isNewBuySignal
         df["isNewSellSignal"] = isNewSellSignal
 
-        df["startLongTrade"] = np.where(startLongTrade, df['low'], np.NaN)
-        df["startShortTrade"] = np.where(startShortTrade, df['high'], np.NaN)
-        df["endLongTrade"] = np.where(endLongTrade, df['high'], np.NaN)
-        df["endShortTrade"] = np.where(endShortTrade, df['low'], np.NaN)
+        df["startLongTrade"] = np.where(startLongTrade, df['low'], np.nan)
+        df["startShortTrade"] = np.where(startShortTrade, df['high'], np.nan)
+        df["endLongTrade"] = np.where(endLongTrade, df['high'], np.nan)
+        df["endShortTrade"] = np.where(endShortTrade, df['low'], np.nan)
         df["isBearish"] = isBearishSmooth
         df["isBullish"] = isBullishSmooth
         df["yhat1"] = yhat1
@@ -773,8 +840,8 @@ class LorentzianClassificationIndicator(Indicator):
         matplotlib.use('qtagg')
         siz = df.index.size
 
-        # yhat1_g = [self.yhat1[v] if np.where(useKernelSmoothing, isBullishSmooth, isBullishRate)[v] else np.NaN for v in range(self.df.head(len).index.size)]
-        # yhat1_r = [self.yhat1[v] if ~np.where(useKernelSmoothing, isBullishSmooth, isBullishRate)[v] else np.NaN for v in range(self.df.head(len).index.size)]
+        # yhat1_g = [self.yhat1[v] if np.where(useKernelSmoothing, isBullishSmooth, isBullishRate)[v] else np.nan for v in range(self.df.head(len).index.size)]
+        # yhat1_r = [self.yhat1[v] if ~np.where(useKernelSmoothing, isBullishSmooth, isBullishRate)[v] else np.nan for v in range(self.df.head(len).index.size)]
         sub_plots = [
             mpf.make_addplot(yhat1, ylabel="Kernel Regression Estimate", color='blue', type="line"),
             mpf.make_addplot(yhat2, ylabel="yhat2", color='gray'),
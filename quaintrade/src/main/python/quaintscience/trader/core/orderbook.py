@@ -0,0 +1,170 @@
+from typing import Optional, Iterable, Iterator
+
+from .ds import Order, OrderState
+
+
+class OrderBook:
+    """Orders indexed by order_id, parent_order_id, group_id, (scrip, exchange) and state
+
+    Orders are kept in placement order in a plain list, so iterating the
+    book behaves like iterating the list of orders brokers used to keep
+    (orders placed during iteration are visited too). Pending orders are
+    additionally indexed per instrument so order matching only touches
+    the orders that can still change.
+
+    Brokers flip order.state in place, so orders leave the pending indexes
+    lazily: get_pending_orders (and any state lookup) moves orders that are
+    no longer pending to the index of their current state. Call
+    update_state right after a transition to do it eagerly.
+
+    version goes up whenever an order is added, replaced, changes state in
+    the indexes or is removed.
+    """
+
+    def __init__(self, orders: Optional[Iterable[Order]] = None):
+        self.version = 0
+        self.orders = []
+        self.positions = {}
+        self.by_id = {}
+        self.by_parent = {}
+        self.by_group = {}
+        self.by_instrument = {}
+        self.by_state = {state: {} for state in OrderState}
+        self.pending_by_instrument = {}
+        self.indexed_states = {}
+        if orders is not None:
+            for order in orders:
+                self.add(order)
+
+    def __len__(self) -> int:
+        return len(self.orders)
+
+    def __iter__(self) -> Iterator[Order]:
+        return iter(self.orders)
+
+    def __contains__(self, order_id: str) -> bool:
+        return order_id in self.by_id
+
+    @staticmethod
+    def get_instrument(order: Order) -> tuple[str, str]:
+        return (order.scrip, order.exchange)
+
+    def __get_buckets(self, order: Order, state: OrderState) -> list[dict]:
+        instrument = self.get_instrument(order)
+        buckets = [self.by_id,
+                   self.by_instrument.setdefault(instrument, {}),
+                   self.by_state[state]]
+        if order.parent_order_id is not None:
+            buckets.append(self.by_parent.setdefault(order.parent_order_id, {}))
+        if order.group_id is not None:
+            buckets.append(self.by_group.setdefault(order.group_id, {}))
+        if state == OrderState.PENDING:
+            buckets.append(self.pending_by_instrument.setdefault(instrument, {}))
+        return buckets
+
+    def add(self, order: Order) -> Order:
+        if order.order_id in self.by_id:
+            return self.replace(order)
+        self.positions[order.order_id] = len(self.orders)
+        self.orders.append(order)
+        for bucket in self.__get_buckets(order, order.state):
+            bucket[order.order_id] = order
+        self.indexed_states[order.order_id] = order.state
+        self.version += 1
+        return order
+
+    def replace(self, order: Order) -> Order:
+        """Swap the stored order having the same order_id for this one"""
+        if order.order_id not in self.by_id:
+            raise KeyError(f"Order {order} not found.")
+        order_id = order.order_id
+        old_buckets = self.__get_buckets(self.by_id[order_id], self.indexed_states[order_id])
+        new_buckets = self.__get_buckets(order, order.state)
+        for bucket in old_buckets:
+            if not any(bucket is other for other in new_buckets):
+                del bucket[order_id]
+        # Buckets the order stays in keep its position, i.e. placement order
+        for bucket in new_buckets:
+            bucket[order_id] = order
+        self.orders[self.positions[order_id]] = order
+        self.indexed_states[order_id] = order.state
+        self.version += 1
+        return order
+
+    def get(self, order_id: Optional[str]) -> Optional[Order]:
+        return self.by_id.get(order_id)
+
+    def update_state(self, order: Order):
+        """Move an order to the index of its current state"""
+        order_id = order.order_id
+        old_state = self.indexed_states.get(order_id)
+        if old_state is None or old_state == order.state:
+            return
+        self.by_state[old_state].pop(order_id, None)
+        self.by_state[order.state][order_id] = order
+        self.indexed_states[order_id] = order.state
+        self.version += 1
+        instrument = self.get_instrument(order)
+        if old_state == OrderState.PENDING:
+            pending = self.pending_by_instrument.get(instrument, {})
+            pending.pop(order_id, None)
+            if len(pending) == 0:
+                self.pending_by_instrument.pop(instrument, None)
+        elif order.state == OrderState.PENDING:
+            self.pending_by_instrument.setdefault(instrument, {})[order_id] = order
+
+    def get_pending_orders(self,
+                           scrip: Optional[str] = None,
+                           exchange: Optional[str] = None) -> list[Order]:
+        """Pending orders in placement order, optionally of one instrument only"""
+        if scrip is not None and exchange is not None:
+            candidates = list(self.pending_by_instrument.get((scrip, exchange), {}).values())
+        else:
+            candidates = list(self.by_state[OrderState.PENDING].values())
+        orders = []
+        for order in candidates:
+            if order.state == OrderState.PENDING:
+                orders.append(order)
+            else:
+                self.update_state(order)
+        return orders
+
+    def get_orders(self,
+                   state: Optional[OrderState] = None,
+                   scrip: Optional[str] = None,
+                   exchange: Optional[str] = None,
+                   parent_order_id: Optional[str] = None,
+                   group_id: Optional[str] = None) -> list[Order]:
+        """Orders matching every given criteria, in placement order"""
+        if state == OrderState.PENDING:
+            orders = self.get_pending_orders(scrip=scrip, exchange=exchange)
+        elif parent_order_id is not None:
+            orders = list(self.by_parent.get(parent_order_id, {}).values())
+        elif group_id is not None:
+            orders = list(self.by_group.get(group_id, {}).values())
+        elif state is not None:
+            self.get_pending_orders()
+            orders = list(self.by_state[state].values())
+        elif scrip is not None and exchange is not None:
+            orders = list(self.by_instrument.get((scrip, exchange), {}).values())
+        else:
+            orders = list(self.orders)
+        # State buckets are filled in transition order
+        orders.sort(key=lambda order: self.positions[order.order_id])
+        return [order for order in orders
+                if ((state is None or order.state == state)
+                    and (scrip is None or order.scrip == scrip)
+                    and (exchange is None or order.exchange == exchange)
+                    and (parent_order_id is None or order.parent_order_id == parent_order_id)
+                    and (group_id is None or order.group_id == group_id))]
+
+    def remove_orders(self, states: Iterable[OrderState]) -> int:
+        """Forget every order in one of the given states, returns how many were removed"""
+        states = set(states)
+        orders = [order for order in self.orders if order.state not in states]
+        removed = len(self.orders) - len(orders)
+        if removed > 0:
+            version = self.version
+            self.__init__(orders)
+            self.version = version + 1
+        return removed
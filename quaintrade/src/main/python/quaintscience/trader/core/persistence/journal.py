@@ -0,0 +1,206 @@
+"""Broker state persisted as a snapshot plus an append-only journal of GTT deltas
+
+The snapshot is the pickle brokers always wrote ({"gtt_orders": ...,
+"extra": ...}), with the sequence number of the last delta it includes.
+GTT changes are appended to <snapshot>.journal as pickled records of
+(seq, op, args) by a background writer, which coalesces everything
+recorded within flush_interval into a single write. Every op is keyed by
+order ids and idempotent, so replaying records already reflected in a
+snapshot is harmless.
+
+The writer takes a new snapshot (and empties the journal) once
+compact_every records were appended, or at most every snapshot_interval
+seconds while the broker reports that state outside the GTT pairs
+(orders, positions) changed. Snapshots and the
+emptied journal are written to temporary files first and moved in place
+with os.replace, so a crash leaves either the old or the new file. A
+record cut short by a crash ends the replay.
+"""
+from typing import Callable, Optional
+from threading import Thread, Lock, Condition
+import atexit
+import copy
+import os
+import pickle
+import time
+
+from ..logging import LoggerMixin
+from ..ds import Order
+
+
+def apply_gtt_delta(gtt_orders: list[tuple[Order, Order]], op: str, args: tuple) -> list[tuple[Order, Order]]:
+    """Apply a journal op to a list of (entry order, other order) pairs"""
+    if op == "put":
+        entry_order, other_order = args
+        for ii, (o1, o2) in enumerate(gtt_orders):
+            if o1.order_id == entry_order.order_id and o2.order_id == other_order.order_id:
+                gtt_orders[ii] = (entry_order, other_order)
+                break
+        else:
+            gtt_orders.append((entry_order, other_order))
+        return gtt_orders
+    if op == "delete_for":
+        (entry_order_id,) = args
+        return [(o1, o2) for o1, o2 in gtt_orders if o1.order_id != entry_order_id]
+    if op == "remove":
+        (pairs,) = args
+        pairs = set(pairs)
+        return [(o1, o2) for o1, o2 in gtt_orders if (o1.order_id, o2.order_id) not in pairs]
+    if op == "clear":
+        return []
+    raise ValueError(f"Unknown state journal op {op}")
+
+
+class StateJournal(LoggerMixin):
+
+    def __init__(self,
+                 path: str,
+                 get_state: Callable[[], dict],
+                 *args,
+                 flush_interval: float = 0.5,
+                 compact_every: int = 1000,
+                 snapshot_interval: float = 10.,
+                 **kwargs):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.get_state = get_state
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+        self.snapshot_interval = snapshot_interval
+        self.last_snapshot_time = 0.
+        self.seq = 0
+        self.snapshot_seq = 0
+        self.records_since_snapshot = 0
+        self.pending = []
+        self.snapshot_requested = False
+        self.seq_lock = Lock()
+        self.condition = Condition()
+        self.file_lock = Lock()
+        self.thread = None
+        self.pid = None
+        super().__init__(*args, **kwargs)
+
+    def load(self) -> Optional[dict]:
+        """Snapshot with the journal replayed over it, None if there is no prior state"""
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as fid:
+                state = pickle.load(fid)
+        elif os.path.exists(self.journal_path):
+            # Crashed before the first snapshot
+            state = {"gtt_orders": [], "extra": None}
+        else:
+            return None
+        self.snapshot_seq = self.seq = state.get("journal_seq", 0)
+        replayed = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb') as fid:
+                while True:
+                    offset = fid.tell()
+                    try:
+                        seq, op, args = pickle.load(fid)
+                    except EOFError:
+                        break
+                    except Exception as exc:
+                        self.logger.warn(f"Dropping truncated state journal record in {self.journal_path}: {exc}")
+                        # Records appended later must not follow the broken one
+                        os.truncate(self.journal_path, offset)
+                        break
+                    if seq <= self.snapshot_seq:
+                        continue
+                    state["gtt_orders"] = apply_gtt_delta(state["gtt_orders"], op, args)
+                    self.seq = seq
+                    replayed += 1
+        self.logger.info(f"Loaded broker state from {self.path} with {replayed} journal records")
+        return state
+
+    def record(self, op: str, *args):
+        """Queue a GTT delta for the journal"""
+        with self.seq_lock:
+            self.seq += 1
+            seq = self.seq
+        with self.condition:
+            self.pending.append(pickle.dumps((seq, op, args)))
+        self.__wake()
+
+    def request_snapshot(self):
+        """State outside the GTT pairs changed, write a new snapshot with the next flush"""
+        self.snapshot_requested = True
+        self.__wake()
+
+    def __wake(self):
+        if self.thread is None or self.pid != os.getpid():
+            # Threads do not survive a fork, so a forked worker starts its own
+            self.pid = os.getpid()
+            self.thread = Thread(target=self.run, daemon=True)
+            self.thread.start()
+            atexit.register(self.flush, True)
+        with self.condition:
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while len(self.pending) == 0:
+                    if not self.snapshot_requested:
+                        self.condition.wait()
+                        continue
+                    # Only a snapshot is waiting, nothing to do before it is due
+                    timeout = self.last_snapshot_time + self.snapshot_interval - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self.condition.wait(timeout)
+            # Debounce: everything recorded meanwhile goes out with this flush
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as exc:
+                self.logger.error(f"Could not persist broker state to {self.path}: {exc}")
+
+    def flush(self, force_snapshot: bool = False):
+        """Append pending records, compacting into a new snapshot when due"""
+        with self.file_lock:
+            with self.condition:
+                records, self.pending = self.pending, []
+            if len(records) > 0:
+                with open(self.journal_path, 'ab') as fid:
+                    fid.write(b"".join(records))
+                    fid.flush()
+                    os.fsync(fid.fileno())
+                self.records_since_snapshot += len(records)
+            snapshot_due = time.monotonic() - self.last_snapshot_time >= self.snapshot_interval
+            if ((self.snapshot_requested and (snapshot_due or force_snapshot))
+                or self.records_since_snapshot >= self.compact_every):
+                self.snapshot_requested = False
+                self.__write_snapshot()
+
+    def compact(self):
+        """Write a snapshot of the current state right away and empty the journal"""
+        with self.file_lock:
+            with self.condition:
+                self.pending = []
+            self.snapshot_requested = False
+            self.__write_snapshot()
+
+    def __write_snapshot(self):
+        with self.seq_lock:
+            seq = self.seq
+            state = self.get_state()
+        # Container copies are atomic, the broker may keep changing them while pickling
+        state = {"gtt_orders": list(state["gtt_orders"]),
+                 "extra": ({k: copy.copy(v) for k, v in state["extra"].items()}
+                           if state.get("extra") is not None else None),
+                 "journal_seq": seq}
+        self.__atomic_write(self.path, pickle.dumps(state))
+        self.__atomic_write(self.journal_path, b"")
+        self.snapshot_seq = seq
+        self.records_since_snapshot = 0
+        self.last_snapshot_time = time.monotonic()
+
+    @staticmethod
+    def __atomic_write(path: str, data: bytes):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as fid:
+            fid.write(data)
+            fid.flush()
+            os.fsync(fid.fileno())
+        os.replace(tmp_path, path)
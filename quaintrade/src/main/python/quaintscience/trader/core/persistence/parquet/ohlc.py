@@ -0,0 +1,161 @@
+"""OHLC bars stored as Parquet files, one per instrument and month
+
+<path>/<scrip>__<exchange>/<YYYY-MM>.parquet holds the bars of a month
+sorted by date. Reads only open the months overlapping the range, skip
+row groups outside it by their date statistics (filters are pushed down
+into the reader) and convert the Arrow columns to pandas without copying
+the numeric data. Writes rewrite the months they touch through a
+temporary file and os.replace, so readers never see half a file.
+"""
+from typing import Union, Optional
+import datetime
+import glob
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ..common import Storage
+from ..ohlc import OHLCStorageMixin
+from ...util import sanitize, get_datetime
+
+
+class ParquetOHLCStorage(Storage, OHLCStorageMixin):
+
+    # get_db_path names a directory per instrument and storage type
+    path_suffix = ".parquet"
+
+    schema = pa.schema([("date", pa.timestamp("ns")),
+                        ("open", pa.float64()),
+                        ("high", pa.float64()),
+                        ("low", pa.float64()),
+                        ("close", pa.float64()),
+                        ("volume", pa.int64()),
+                        ("oi", pa.int64())])
+
+    def __init__(self,
+                 *args,
+                 read_only: bool = False,
+                 row_group_size: int = 4096,
+                 compression: str = "zstd",
+                 **kwargs):
+        """row_group_size rows (about ten days of minute bars) share date statistics for pushdown"""
+        self.read_only = read_only
+        self.row_group_size = row_group_size
+        self.compression = compression
+        super().__init__(*args, **kwargs)
+
+    def connect(self):
+        if not self.read_only:
+            os.makedirs(self.path, exist_ok=True)
+
+    def commit(self):
+        # Every put is on disk when it returns
+        pass
+
+    def get_instrument_path(self, scrip: str, exchange: str) -> str:
+        return os.path.join(self.path, f"{sanitize(scrip)}__{sanitize(exchange)}")
+
+    def get_month_path(self, scrip: str, exchange: str, month: pd.Period) -> str:
+        return os.path.join(self.get_instrument_path(scrip, exchange), f"{month.strftime('%Y-%m')}.parquet")
+
+    def to_table(self, df: pd.DataFrame) -> pa.Table:
+        df = df.copy()
+        df.index = pd.DatetimeIndex(df.index)
+        if df.index.tz is not None:
+            # Dates are stored as local wall time, like the sqlite storage does
+            df.index = df.index.tz_localize(None)
+        for col in ["volume", "oi"]:
+            df[col] = df[col].fillna(0) if col in df.columns else 0
+        columns = {"date": df.index.as_unit("ns")}
+        for field in self.schema:
+            if field.name != "date":
+                columns[field.name] = df[field.name].to_numpy()
+        return pa.Table.from_pydict(columns, schema=self.schema)
+
+    def put(self,
+            scrip: str,
+            exchange: str,
+            df: pd.DataFrame,
+            conflict_resolution_type: str = "IGNORE"):
+        """Merge bars into their month files; on duplicate dates IGNORE keeps the stored bar, REPLACE the new one"""
+        if len(df) == 0:
+            return
+        os.makedirs(self.get_instrument_path(scrip, exchange), exist_ok=True)
+        table = self.to_table(df)
+        dates = table.column("date").to_numpy()
+        months = pd.DatetimeIndex(dates).to_period("M")
+        for month in months.unique():
+            rows = np.flatnonzero(months == month)
+            update = table.take(pa.array(rows))
+            filepath = self.get_month_path(scrip, exchange, month)
+            if os.path.exists(filepath):
+                stored = pq.read_table(filepath, schema=self.schema)
+                update = (pa.concat_tables([stored, update]) if conflict_resolution_type == "REPLACE"
+                          else pa.concat_tables([update, stored]))
+            update = self.sort_and_deduplicate(update)
+            tmp_path = f"{filepath}.tmp"
+            pq.write_table(update, tmp_path,
+                           row_group_size=self.row_group_size,
+                           compression=self.compression)
+            os.replace(tmp_path, filepath)
+
+    @staticmethod
+    def sort_and_deduplicate(table: pa.Table) -> pa.Table:
+        """Sorted by date, keeping the last row of every date"""
+        dates = table.column("date").to_numpy()
+        # A stable sort keeps equal dates in table order, so the last of each run wins
+        order = np.argsort(dates, kind="stable")
+        dates = dates[order]
+        last = np.append(dates[1:] != dates[:-1], True)
+        return table.take(pa.array(order[last]))
+
+    def get_month_paths(self, scrip: str, exchange: str,
+                        from_date: datetime.datetime,
+                        to_date: datetime.datetime) -> list[str]:
+        months = pd.period_range(pd.Timestamp(from_date).to_period("M"),
+                                 pd.Timestamp(to_date).to_period("M"), freq="M")
+        paths = [self.get_month_path(scrip, exchange, month) for month in months]
+        return [path for path in paths if os.path.exists(path)]
+
+    def get(self, scrip: str, exchange: str,
+            from_date: Union[str, datetime.datetime],
+            to_date: Union[str, datetime.datetime],
+            conflict_resolution_type: Optional[str] = None,
+            autofix: bool = True) -> pd.DataFrame:
+        if from_date is None:
+            from_date = self.get_first_date(scrip, exchange)
+        if to_date is None:
+            to_date = datetime.datetime.now()
+        from_date = get_datetime(from_date)
+        # to_date covers its whole second, as in SqliteStorage.get_timestamped_data
+        to_bound = get_datetime(to_date).replace(microsecond=0) + datetime.timedelta(seconds=1)
+        tables = []
+        if from_date is not None:
+            filters = [("date", ">=", pd.Timestamp(from_date)), ("date", "<", pd.Timestamp(to_bound))]
+            for filepath in self.get_month_paths(scrip, exchange, from_date, to_date):
+                tables.append(pq.read_table(filepath, schema=self.schema, filters=filters, memory_map=True))
+        table = pa.concat_tables(tables) if len(tables) > 0 else self.schema.empty_table()
+        data = table.to_pandas(split_blocks=True, self_destruct=True)
+        data = data.set_index("date")
+        if autofix:
+            low_fix, high_fix = data["low"] == 0., data["high"] == 0.
+            self.logger.warn(f'Fixing {low_fix.sum() + high_fix.sum()} rows...')
+            # The columns share Arrow's read-only buffers, fixed ones are replaced instead of written to
+            if low_fix.any():
+                data["low"] = np.where(low_fix, np.minimum(data["open"], data["close"]), data["low"])
+            if high_fix.any():
+                data["high"] = np.where(high_fix, np.maximum(data["open"], data["close"]), data["high"])
+        return data
+
+    def get_first_date(self, scrip: str, exchange: str) -> Optional[datetime.datetime]:
+        paths = sorted(glob.glob(os.path.join(self.get_instrument_path(scrip, exchange), "*.parquet")))
+        if len(paths) == 0:
+            return None
+        return datetime.datetime.strptime(os.path.basename(paths[0])[:-len(".parquet")], "%Y-%m")
+
+    def clear_data(self, scrip: str, exchange: str, conflict_resolution_type: str = "IGNORE"):
+        shutil.rmtree(self.get_instrument_path(scrip, exchange), ignore_errors=True)
@@ -1,8 +1,11 @@
 from abc import abstractmethod, ABC
 from typing import Union, Optional
-from threading import Lock
+from threading import Lock, Thread
+import queue
 import sqlite3
 import datetime
+import urllib.parse
+import os
 
 import pandas as pd
 
@@ -10,61 +13,282 @@ from ..common import Storage
 from ...util import sanitize, get_datetime
 
 
+DATE_TEXT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def get_date_text(date: Union[str, datetime.datetime]) -> str:
+    """Dates are stored as naive ISO text ("YYYY-MM-DD HH:MM:SS[.ffffff]", local wall time)
+
+    Text in this form sorts chronologically, so date columns are compared
+    directly and range reads use the index on them. Strings are assumed to
+    be in this form already (see migration.py for older tables).
+    """
+    if isinstance(date, str):
+        return date
+    if date.tzinfo is not None:
+        date = date.replace(tzinfo=None)
+    return str(date)
+
+
+class SqliteConnection:
+    """An open connection to a database file with the lock its users serialize writes with"""
+
+    def __init__(self, connection: sqlite3.Connection, read_only: bool):
+        self.connection = connection
+        self.read_only = read_only
+        self.lock = Lock()
+        self.pid = os.getpid()
+        # Tables known to exist, so DDL runs once per file and process
+        self.tables = set()
+
+
+class SqliteConnectionRegistry:
+    """One connection per database file (and mode) per process, shared by every storage of the file
+
+    Writable connections switch the file to WAL, so readers, in this or
+    other processes, do not block on a writer and the other way around.
+    Read-only connections fall back to a writable one while the file does
+    not exist yet. Connections are not carried over a fork: a forked
+    process opens its own on first use.
+    """
+
+    DEFAULT_PRAGMAS = {"journal_mode": "WAL",
+                       "mmap_size": 256 * 1024 * 1024,
+                       # Negative values are in KiB
+                       "cache_size": -64 * 1024}
+
+    def __init__(self):
+        self.lock = Lock()
+        self.connections = {}
+        self.pid = os.getpid()
+
+    def get(self, path: str,
+            read_only: bool = False,
+            pragmas: Optional[dict] = None) -> SqliteConnection:
+        path = os.path.realpath(path)
+        with self.lock:
+            if self.pid != os.getpid():
+                self.connections = {}
+                self.pid = os.getpid()
+            if read_only and not os.path.exists(path):
+                read_only = False
+            key = (path, read_only)
+            handle = self.connections.get(key)
+            if handle is None or handle.connection is None:
+                handle = SqliteConnection(self.connect(path, read_only, pragmas), read_only)
+                self.connections[key] = handle
+            return handle
+
+    def connect(self, path: str, read_only: bool, pragmas: Optional[dict] = None) -> sqlite3.Connection:
+        pragmas = {**self.DEFAULT_PRAGMAS, **(pragmas if pragmas is not None else {})}
+        if read_only:
+            connection = sqlite3.connect(f"file:{urllib.parse.quote(path)}?mode=ro", uri=True,
+                                         check_same_thread=False)
+            # The journal mode belongs to the file, only writers may change it
+            pragmas.pop("journal_mode", None)
+        else:
+            connection = sqlite3.connect(path, check_same_thread=False)
+        for name, value in pragmas.items():
+            if value is not None:
+                connection.execute(f"PRAGMA {name}={value};")
+        return connection
+
+    def close(self, path: Optional[str] = None):
+        """Close the connections to a file (every file by default); storages reconnect on next use"""
+        with self.lock:
+            for key in list(self.connections.keys()):
+                if path is not None and key[0] != os.path.realpath(path):
+                    continue
+                handle = self.connections.pop(key)
+                if handle.pid == os.getpid():
+                    with handle.lock:
+                        handle.connection.close()
+                handle.connection = None
+
+
+sqlite_connections = SqliteConnectionRegistry()
+
+
+class SqliteBatchWriter:
+    """Writes batches of buffered rows of a SqliteStorage on a background thread"""
+
+    def __init__(self, storage: "SqliteStorage"):
+        self.storage = storage
+        self.queue = queue.Queue()
+        self.error = None
+        self.thread = None
+        self.pid = None
+
+    def run(self):
+        while True:
+            batches = self.queue.get()
+            try:
+                self.storage.write_batches(batches)
+            except Exception as exc:
+                self.storage.logger.error(f"Could not write to {self.storage.path}: {exc}")
+                self.error = exc
+            finally:
+                self.queue.task_done()
+
+    def submit(self, batches: list[tuple[str, list]]):
+        # Threads do not survive a fork, so a forked worker starts its own
+        if self.thread is None or self.pid != os.getpid():
+            self.queue = queue.Queue()
+            self.pid = os.getpid()
+            self.thread = Thread(target=self.run, daemon=True)
+            self.thread.start()
+        self.queue.put(batches)
+
+    def wait(self):
+        """Block until every submitted batch is written, re-raising the first failure"""
+        if self.thread is None or self.pid != os.getpid():
+            return
+        self.queue.join()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+
 class SqliteStorage(Storage):
 
-    def __init__(self, *args, **kwargs):
+    # Column order of the rows buffered for every table suffix, see init_cache_for
+    table_columns = {}
+
+    def __init__(self, *args,
+                 async_writes: bool = True,
+                 read_only: bool = False,
+                 pragmas: Optional[dict] = None,
+                 **kwargs):
+        """The connection comes from sqlite_connections, pragmas apply when it is first opened"""
         self.cache = {}
-        self.write_lock = Lock()
+        self.table_keys = {}
+        self.read_only = read_only
+        self.pragmas = pragmas
+        self.handle = None
+        self.writer = SqliteBatchWriter(self) if async_writes else None
         super().__init__(*args, **kwargs)
 
+    def get_handle(self) -> SqliteConnection:
+        if self.handle.connection is None or self.handle.pid != os.getpid():
+            # Closed meanwhile, or inherited over a fork
+            self.connect()
+        return self.handle
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        return self.get_handle().connection
+
+    @property
+    def write_lock(self) -> Lock:
+        return self.get_handle().lock
+
     def init_cache_for(self, *args,
                        conflict_resolution_type: str = "REPLACE"):
-        key = self.get_table_name(*args)
-        with self.write_lock:
-            self.create_tables(*args,
-                            conflict_resolution_type=conflict_resolution_type)
+        """Buffer key for the tables of args, creating the tables the first time only
+
+        Rows are buffered in self.cache[key][table_suffix], as tuples in the
+        order of table_columns[table_suffix] (dicts for tables not listed
+        there), and written by commit()/flush().
+        """
+        key = self.table_keys.get(args)
+        if key is None:
+            key = self.get_table_name(*args)
+            with self.write_lock:
+                self.create_tables(*args,
+                                conflict_resolution_type=conflict_resolution_type)
+            self.table_keys[args] = key
         if key not in self.cache:
             self.cache[key] = {}
             for k in self.table_names:
                 self.cache[key][k] = []
         return key
 
-    def commit(self):
+    def write_batches(self, batches: list[tuple[str, list]]):
+        with self.write_lock:
+            # One transaction for all of them, rolled back on failure
+            with self.connection:
+                for sql, rows in batches:
+                    self.connection.executemany(sql, rows)
+
+    def flush(self):
+        """Hand buffered rows over to the background writer (or write them now without one)"""
+        batches = []
         for key, all_data in self.cache.items():
-            for table_suffix, data in all_data.items():
-                if len(data) > 0:
-                    self.logger.debug(f"Writing cache for {key} / {table_suffix} with {len(data)} to {self.path}")
-                    df = pd.DataFrame(data)
+            for table_suffix, rows in all_data.items():
+                if len(rows) == 0:
+                    continue
+                self.logger.debug(f"Writing cache for {key} / {table_suffix} with {len(rows)} to {self.path}")
+                if table_suffix not in self.table_columns:
+                    # Rows buffered as dicts
                     with self.write_lock:
-                        df.to_sql(f"{key}__{table_suffix}",
-                                con=self.connection,
-                                if_exists="append",
-                                index=False)
+                        pd.DataFrame(rows).to_sql(f"{key}__{table_suffix}",
+                                                  con=self.connection,
+                                                  if_exists="append",
+                                                  index=False)
+                    continue
+                cols = self.table_columns[table_suffix]
+                batches.append((f"INSERT INTO {key}__{table_suffix} ({', '.join(cols)}) "
+                                f"VALUES ({', '.join(['?'] * len(cols))});", rows))
         self.cache = {}
+        if len(batches) == 0:
+            return
+        if self.writer is None:
+            self.write_batches(batches)
+        else:
+            self.writer.submit(batches)
+
+    def commit(self):
+        """Write every buffered row and wait until it is in the database"""
+        self.flush()
+        if self.writer is not None:
+            self.writer.wait()
 
     def connect(self):
-        self.logger.debug(f"Connecting to {self.path}")
-        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.handle = sqlite_connections.get(self.path, read_only=self.read_only, pragmas=self.pragmas)
 
     def get_table_name(self, *args):
         return "__".join([sanitize(str(arg)) for arg in args])
 
     def create_tables(self, *args,
                       conflict_resolution_type: str = "IGNORE"):
+        """Create the tables of args once per file and process (never on read-only connections)"""
         table_name = self.get_table_name(*args)
-        self.create_tables_impl(table_name,
-                                conflict_resolution_type)
+        handle = self.get_handle()
+        if table_name not in handle.tables and not handle.read_only:
+            self.create_tables_impl(table_name,
+                                    conflict_resolution_type)
+            handle.tables.add(table_name)
         return table_name
 
+    def drop_table(self, table_name: str):
+        self.connection.execute(f"DROP TABLE IF EXISTS {table_name}")
+        self.get_handle().tables.discard(table_name)
+
+    def table_exists(self, table_name: str) -> bool:
+        handle = self.get_handle()
+        if table_name in handle.tables:
+            return True
+        exists = handle.connection.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?;",
+                                           (table_name,)).fetchone() is not None
+        if exists:
+            handle.tables.add(table_name)
+        return exists
+
     def __date_parse(self, from_date, to_date):
+        """Bounds of from_date <= date < to_date; to_date covers its whole second, as datetime(date) did"""
         if from_date is None:
             from_date = datetime.datetime.now() - datetime.timedelta(days=100000)
         if to_date is None:
             to_date = datetime.datetime.now()
-        from_date = get_datetime(from_date).strftime("%Y-%m-%d %H:%M:%S")
-        to_date = get_datetime(to_date).strftime("%Y-%m-%d %H:%M:%S")
+        from_date = get_datetime(from_date).strftime(DATE_TEXT_FORMAT)
+        to_date = (get_datetime(to_date).replace(microsecond=0)
+                   + datetime.timedelta(seconds=1)).strftime(DATE_TEXT_FORMAT)
         return from_date, to_date
 
+    def get_date_bounds(self, from_date, to_date) -> tuple[str, str]:
+        """Parameters of the (date >= ? AND date < ?) range of get_timestamped_data"""
+        return self.__date_parse(from_date, to_date)
+
     @abstractmethod
     def create_tables_impl(self, table_name, conflict_resolution_type: str = "IGNORE"):
         pass
@@ -80,14 +304,24 @@ class SqliteStorage(Storage):
                              col_filters: Optional[dict] = None,
                              skip_time_stamps: bool = False,
                              conflict_resolution_type: str = "IGNORE"):
-        self.create_tables(*args,
-                           conflict_resolution_type=conflict_resolution_type)
+        # Rows flushed before the read are visible, as with synchronous writes
+        if self.writer is not None:
+            self.writer.wait()
+        table_name = self.create_tables(*args,
+                                        conflict_resolution_type=conflict_resolution_type)
         if table_name_suffixes is None:
             table_name_suffixes = []
-        table_name = self.create_tables(*args)
         if len(table_name_suffixes) > 0:
             table_name = f"{table_name}__{'__'.join(table_name_suffixes)}"
-        if cols is None or len(cols) == 0:
+        # A read-only storage gets a writable connection while its file does not exist
+        if self.get_handle().read_only and not self.table_exists(table_name):
+            # Nothing was ever written, and readers do not create tables
+            if cols is None:
+                cols = []
+            skip_reading = True
+        else:
+            skip_reading = False
+        if (cols is None or len(cols) == 0) and not skip_reading:
             self.logger.info(f"Inferring column names for {table_name}")
             cursor = self.connection.execute(f"SELECT * from {table_name} LIMIT 1;")
             cols = list(map(lambda x: x[0], cursor.description))
@@ -110,11 +344,14 @@ class SqliteStorage(Storage):
                     filters.append(f"{k}='{v}'")
             filters = " AND ".join(filters)
             filters = f"AND {filters}"
+        params = ()
         if not skip_time_stamps:
+            # The bare column (no datetime(date)) lets SQLite search the date index
             sql = (f"SELECT {', '.join(cols)} FROM "
                 f"{table_name} WHERE "
-                f"(datetime(date) BETWEEN '{from_date}' AND '{to_date}')"
+                f"(date >= ? AND date < ?)"
                 f"{filters};")
+            params = (from_date, to_date)
         elif filters != "" and filters is not None:
             sql = (f"SELECT {', '.join(cols)} FROM "
                 f"{table_name} WHERE "
@@ -123,8 +360,10 @@ class SqliteStorage(Storage):
             sql = (f"SELECT {', '.join(cols)} FROM "
                    f"{table_name}")
         self.logger.debug(f"Executing {sql}")
-        with self.write_lock:
-            data = self.connection.execute(sql).fetchall()
+        data = []
+        if not skip_reading:
+            with self.write_lock:
+                data = self.connection.execute(sql, params).fetchall()
         data = pd.DataFrame(data, columns=cols)
         if index_col is not None:
             data.index = data[index_col]
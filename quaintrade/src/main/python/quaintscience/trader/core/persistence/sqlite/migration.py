@@ -0,0 +1,70 @@
+"""Rewrite the date columns of existing sqlite files as naive ISO text (see get_date_text)
+
+Range reads compare the date column directly, which is only correct when
+every stored date is in the "YYYY-MM-DD HH:MM:SS[.ffffff]" form. Tables
+written before may hold other forms ("T" separators, UTC offsets from
+tz-aware frames, bare dates); those rows are rewritten as their local
+wall time, and every date column gets an index. Rows already in the
+normalized form are left alone, so migrating a file twice is harmless.
+"""
+import glob
+import os
+import sqlite3
+
+import configargparse
+import pandas as pd
+
+from .common import get_date_text
+
+
+NORMALIZED_DATE_SQL = ("((length(date) = 19 AND date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9] "
+                       "[0-9][0-9]:[0-9][0-9]:[0-9][0-9]') OR "
+                       "(length(date) = 26 AND date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9] "
+                       "[0-9][0-9]:[0-9][0-9]:[0-9][0-9].[0-9][0-9][0-9][0-9][0-9][0-9]'))")
+
+
+def get_date_tables(connection: sqlite3.Connection) -> list[str]:
+    tables = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type='table';")]
+    return [table for table in tables
+            if "date" in [row[1] for row in connection.execute(f"PRAGMA table_info('{table}');")]]
+
+
+def has_date_index(connection: sqlite3.Connection, table: str) -> bool:
+    for index in connection.execute(f"PRAGMA index_list('{table}');").fetchall():
+        columns = [row[2] for row in connection.execute(f"PRAGMA index_info('{index[1]}');")]
+        if len(columns) > 0 and columns[0] == "date":
+            return True
+    return False
+
+
+def migrate_sqlite_dates(path: str) -> dict[str, int]:
+    """Normalize the date columns of every table in a sqlite file, returns the rows rewritten per table"""
+    rewritten = {}
+    connection = sqlite3.connect(path)
+    try:
+        with connection:
+            for table in get_date_tables(connection):
+                rows = connection.execute(f"SELECT rowid, date FROM '{table}' "
+                                          f"WHERE typeof(date) = 'text' AND NOT {NORMALIZED_DATE_SQL};").fetchall()
+                updates = [(get_date_text(pd.Timestamp(date).to_pydatetime()), rowid) for rowid, date in rows]
+                # Two forms of the same date collapse into one row of a date primary key
+                connection.executemany(f"UPDATE OR REPLACE '{table}' SET date = ? WHERE rowid = ?;", updates)
+                if not has_date_index(connection, table):
+                    connection.execute(f"CREATE INDEX IF NOT EXISTS '{table}__date' ON '{table}' (date);")
+                rewritten[table] = len(updates)
+    finally:
+        connection.close()
+    return rewritten
+
+
+def main():
+    p = configargparse.ArgParser(description=__doc__.split("\n")[0])
+    p.add('paths', nargs='+', help="sqlite files, or folders to search for files matching --pattern")
+    p.add('--pattern', help="File name pattern within folders", default="*_perm.sqlite")
+    args = p.parse_args()
+    for path in args.paths:
+        files = [path] if not os.path.isdir(path) else sorted(glob.glob(os.path.join(path, "**", args.pattern),
+                                                                          recursive=True))
+        for filepath in files:
+            rewritten = migrate_sqlite_dates(filepath)
+            print(f"{filepath}: rewrote {sum(rewritten.values())} dates in {len(rewritten)} tables")
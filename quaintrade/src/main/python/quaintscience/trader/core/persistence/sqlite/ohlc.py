@@ -1,13 +1,29 @@
-from typing import Union
+from typing import Union, Optional
 import datetime
 
+import numpy as np
 import pandas as pd
 
 from ..ohlc import OHLCStorageMixin
 from .common import SqliteStorage
 
+
+# Rows of SqliteOHLCStorage.read_bars; dates are at most 26 bytes once normalized
+# (see get_date_text), the extra room shows any longer text
+BAR_DTYPE = np.dtype([("date", "S32"),
+                      ("open", np.float64),
+                      ("high", np.float64),
+                      ("low", np.float64),
+                      ("close", np.float64),
+                      ("volume", np.int64),
+                      ("oi", np.int64)])
+
+
 class SqliteOHLCStorage(SqliteStorage, OHLCStorageMixin):
 
+    # get_db_path names a file per instrument and storage type
+    path_suffix = ".sqlite"
+
     def __init__(self,
                  *args,
                  **kwargs):
@@ -31,6 +47,9 @@ class SqliteOHLCStorage(SqliteStorage, OHLCStorageMixin):
             conflict_resolution_type: str = "IGNORE"):
         table_name = self.create_tables(scrip, exchange,
                                         conflict_resolution_type=conflict_resolution_type)
+        if isinstance(df.index, pd.DatetimeIndex) and df.index.tz is not None:
+            # Dates are stored as local wall time, see get_date_text
+            df = df.tz_localize(None)
         df.to_sql(table_name, con=self.connection, if_exists="append")
         self.connection.commit()
 
@@ -39,26 +58,74 @@ class SqliteOHLCStorage(SqliteStorage, OHLCStorageMixin):
             to_date: Union[str, datetime.datetime],
             conflict_resolution_type: str,
             autofix: bool = True) -> pd.DataFrame:
-        cols = ["date", "open", "high", "low",
-                "close", "volume", "oi"]
-        data = self.get_timestamped_data(scrip, exchange,
-                                         table_name_suffixes=[],
-                                         from_date=from_date,
-                                         to_date=to_date,
-                                         cols=cols,
-                                         index_col="date",
-                                         conflict_resolution_type=conflict_resolution_type)
+        # Rows flushed before the read are visible, as with synchronous writes
+        if self.writer is not None:
+            self.writer.wait()
+        table_name = self.create_tables(scrip, exchange,
+                                        conflict_resolution_type=conflict_resolution_type)
+        data = self.read_bars(table_name, from_date, to_date)
+        if data is None:
+            # Dates in other forms (see migration.py) are left to pandas
+            cols = ["date", "open", "high", "low",
+                    "close", "volume", "oi"]
+            data = self.get_timestamped_data(scrip, exchange,
+                                             table_name_suffixes=[],
+                                             from_date=from_date,
+                                             to_date=to_date,
+                                             cols=cols,
+                                             index_col="date",
+                                             conflict_resolution_type=conflict_resolution_type)
         if autofix:
-            self.logger.warn(f'Fixing {sum(data["low"] == 0) + sum(data["high"] == 0)} rows...')
-            data.loc[data["low"] == 0., "low"] = data[data["low"] == 0.].apply(lambda x: min(x["open"], x["close"]), axis=1)
-            data.loc[data["high"] == 0., "high"] = data[data["high"] == 0.].apply(lambda x: max(x["open"], x["close"]), axis=1)
-            #print("fixed data")
-            #print(data)
+            low_fix = (data["low"] == 0.).to_numpy()
+            high_fix = (data["high"] == 0.).to_numpy()
+            self.logger.warn(f'Fixing {low_fix.sum() + high_fix.sum()} rows...')
+            if low_fix.any():
+                data["low"] = np.where(low_fix, np.minimum(data["open"], data["close"]), data["low"])
+            if high_fix.any():
+                data["high"] = np.where(high_fix, np.maximum(data["open"], data["close"]), data["high"])
+        return data
+
+    def read_bars(self,
+                  table_name: str,
+                  from_date: Union[str, datetime.datetime],
+                  to_date: Union[str, datetime.datetime]) -> Optional[pd.DataFrame]:
+        """Bars of table_name in the range of get_timestamped_data, None if dates are not all normalized
+
+        Rows are streamed from the cursor into one typed array, so no list
+        of row tuples is built, and the fixed-width date bytes are parsed
+        by NumPy at once.
+        """
+        from_date, to_date = self.get_date_bounds(from_date, to_date)
+        self.logger.debug(f"Reading data from {from_date} to {to_date} from {table_name}...")
+        bars = np.empty(0, dtype=BAR_DTYPE)
+        # A read-only storage gets a writable connection while its file does not exist
+        if not self.get_handle().read_only or self.table_exists(table_name):
+            with self.write_lock:
+                cursor = self.connection.execute(f"SELECT date, open, high, low, close, volume, oi FROM "
+                                                 f"{table_name} WHERE (date >= ? AND date < ?);",
+                                                 (from_date, to_date))
+                try:
+                    bars = np.fromiter(cursor, dtype=BAR_DTYPE)
+                finally:
+                    cursor.close()
+        lengths = np.char.str_len(bars["date"])
+        if not ((lengths == 19) | (lengths == 26)).all():
+            return None
+        try:
+            dates = bars["date"].astype("datetime64[us]")
+        except ValueError:
+            return None
+        data = pd.DataFrame({col: bars[col] for col in ["open", "high", "low", "close", "volume", "oi"]},
+                            index=pd.DatetimeIndex(dates, name="date"))
+        timestamps = dates.view(np.int64)
+        if len(timestamps) > 1 and not (np.diff(timestamps) > 0).all():
+            # Rows out of date order, or several texts of the same date
+            data = data[~data.index.duplicated(keep='last')]
         return data
 
     def clear_data(self, scrip: str, exchange: str, conflict_resolution_type: str = "IGNORE"):
         table_name = self.create_tables(scrip, exchange,
                                         conflict_resolution_type=conflict_resolution_type)
-        self.connection.execute(f"DROP TABLE IF EXISTS {table_name}")
+        self.drop_table(table_name)
         table_name = self.create_tables(scrip, exchange,
                                         conflict_resolution_type=conflict_resolution_type)
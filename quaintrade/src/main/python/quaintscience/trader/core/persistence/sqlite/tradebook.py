@@ -3,7 +3,7 @@ import datetime
 
 import pandas as pd
 
-from .common import SqliteStorage
+from .common import SqliteStorage, get_date_text
 from ..tradebook import TradeBookStorageMixin
 from ...ds import Order, Position, TransactionType, TradingProduct
 
@@ -11,9 +11,30 @@ from ...ds import Order, Position, TransactionType, TradingProduct
 
 class SqliteTradeBookStorage(SqliteStorage, TradeBookStorageMixin):
 
-    def __init__(self, *args, **kwargs):
+    table_columns = {"orders": ["date", "strategy", "run_name", "run_id", "scrip", "exchange", "order_id",
+                                "transaction_type", "tags", "product", "order_type", "quantity", "price",
+                                "limit_price", "trigger_price", "parent_order_id", "group_id", "event"],
+                     "positions": ["date", "scrip", "exchange", "strategy", "run_name", "run_id",
+                                   "product", "pnl", "charges"],
+                     "events": ["date", "scrip", "exchange", "strategy", "run_id", "run_name",
+                                "quantity", "price", "transaction_type", "event_type"]}
+
+    def __init__(self, *args,
+                 position_rows: str = "all",
+                 flush_every: int = 1000,
+                 **kwargs):
+        """position_rows: "all" stores every position update (a row per position per bar
+        in backtests), "on_change" only the ones changing pnl or charges and "none" none
+        of them. Buffered rows are flushed to the background writer every flush_every rows.
+        """
+        if position_rows not in ["all", "on_change", "none"]:
+            raise ValueError(f"Unknown position_rows {position_rows}")
+        self.position_rows = position_rows
+        self.flush_every = flush_every
+        self.last_position_states = {}
         super().__init__(*args, **kwargs)
 
+
     def create_tables_impl(self, table_name: str, conflict_resolution_type: str = "REPLACE"):
         self.connection.execute(f"""CREATE TABLE IF NOT EXISTS {table_name}__orders (date VARCHAR(255) NOT NULL,
                                                                              strategy VARCHAR(255) NOT NULL,
@@ -34,6 +55,7 @@ class SqliteTradeBookStorage(SqliteStorage, TradeBookStorageMixin):
                                                                              group_id VARCHAR(255),
                                                                              event VARCHAR(255),
                                                                              PRIMARY KEY (order_id) ON CONFLICT {conflict_resolution_type});""")
+        self.connection.execute(f"CREATE INDEX IF NOT EXISTS {table_name}__orders__date ON {table_name}__orders (date);")
         self.connection.execute(f"""CREATE TABLE IF NOT EXISTS {table_name}__positions (date VARCHAR(255) NOT NULL,
                                                                              scrip VARCHAR(255) NOT NULL,
                                                                              exchange VARCHAR(255) NOT NULL,
@@ -75,20 +97,20 @@ class SqliteTradeBookStorage(SqliteStorage, TradeBookStorageMixin):
         transaction_type = transaction_type.value if isinstance(transaction_type,
                                                                 TransactionType) else None
         if date is None:
-            data = datetime.datetime.now()
-        
-        self.cache[key]["events"].append({"scrip": scrip,
-                                          "exchange": exchange,
-                                          "transaction_type": transaction_type,
-                                          "event_type": event_type,
-                                          "quantity": quantity,
-                                          "price": price,
-                                          "strategy": strategy,
-                                          "run_name": run_name,
-                                          "run_id": run_id,
-                                          "date": date})
-        if len(self.cache[key]["events"]) > 1000:
-            self.commit()
+            date = datetime.datetime.now()
+
+        self.cache[key]["events"].append((get_date_text(date),
+                                          scrip,
+                                          exchange,
+                                          strategy,
+                                          run_id,
+                                          run_name,
+                                          quantity,
+                                          price,
+                                          transaction_type,
+                                          event_type))
+        if len(self.cache[key]["events"]) > self.flush_every:
+            self.flush()
 
     def store_order_execution(self,
                               strategy: str,
@@ -105,26 +127,26 @@ class SqliteTradeBookStorage(SqliteStorage, TradeBookStorageMixin):
         if date is None:
             date = datetime.datetime.now()
 
-        self.cache[key]["orders"].append({"scrip": order.scrip,
-                                          "exchange": order.exchange,
-                                          "order_id": order.order_id,
-                                          "transaction_type": order.transaction_type.value,
-                                          "tags": ", ".join(order.tags),
-                                          "product": order.product.value,
-                                          "quantity": order.quantity,
-                                          "price": order.price,
-                                          "limit_price": order.limit_price,
-                                          "trigger_price": order.trigger_price,
-                                          "parent_order_id": order.parent_order_id,
-                                          "group_id": order.group_id,
-                                          "strategy": strategy,
-                                          "order_type": order.order_type.value,
-                                          "event": event,
-                                          "run_id": run_id,
-                                          "run_name": run_name,
-                                          "date": date})
-        if len(self.cache[key]["orders"]) > 1000:
-            self.commit()
+        self.cache[key]["orders"].append((get_date_text(date),
+                                          strategy,
+                                          run_name,
+                                          run_id,
+                                          order.scrip,
+                                          order.exchange,
+                                          order.order_id,
+                                          order.transaction_type.value,
+                                          ", ".join(order.tags),
+                                          order.product.value,
+                                          order.order_type.value,
+                                          order.quantity,
+                                          order.price,
+                                          order.limit_price,
+                                          order.trigger_price,
+                                          order.parent_order_id,
+                                          order.group_id,
+                                          event))
+        if len(self.cache[key]["orders"]) > self.flush_every:
+            self.flush()
 
     def store_position_state(self,
                              strategy: str,
@@ -133,24 +155,32 @@ class SqliteTradeBookStorage(SqliteStorage, TradeBookStorageMixin):
                              position: Position,
                              date: Optional[Union[str, datetime.datetime]] = None,
                              conflict_resolution_type: str = "REPLACE"):
-        
+        if self.position_rows == "none":
+            return
         key = self.init_cache_for(strategy, run_name,
                                   conflict_resolution_type=conflict_resolution_type)
 
+        if self.position_rows == "on_change":
+            position_key = (key, run_id, position.scrip, position.exchange, position.product)
+            state = (position.pnl, position.charges)
+            if self.last_position_states.get(position_key) == state:
+                return
+            self.last_position_states[position_key] = state
+
         if date is None:
             date = datetime.datetime.now()
 
-        self.cache[key]["positions"].append({"scrip": position.scrip,
-                                             "exchange": position.exchange,
-                                             "strategy": strategy,
-                                             "run_name": run_name,
-                                             "run_id": run_id,
-                                             "product": position.product.value,
-                                             "pnl": position.pnl,
-                                             "charges": position.charges,
-                                             "date": date})
-        if len(self.cache[key]["positions"]) > 1000:
-            self.commit()
+        self.cache[key]["positions"].append((get_date_text(date),
+                                             position.scrip,
+                                             position.exchange,
+                                             strategy,
+                                             run_name,
+                                             run_id,
+                                             position.product.value,
+                                             position.pnl,
+                                             position.charges))
+        if len(self.cache[key]["positions"]) > self.flush_every:
+            self.flush()
 
     def get_orders_for_run(self,
                            strategy: str,
@@ -241,6 +271,8 @@ class SqliteTradeBookStorage(SqliteStorage, TradeBookStorageMixin):
                   exchange: str):
         table_name = self.create_tables(strategy, run_name,
                                         conflict_resolution_type="REPLACE")
+        if self.writer is not None:
+            self.writer.wait()
         for table in self.table_names:
             sql = f"DELETE FROM {table_name}__{table} WHERE scrip='{scrip}' AND exchange='{exchange}';"
             self.logger.debug(f"Executing {sql}")
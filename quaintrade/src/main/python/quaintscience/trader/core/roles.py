@@ -2,7 +2,6 @@ from abc import ABC, abstractmethod
 from typing import Union, Type
 import datetime
 import os
-import pickle
 from threading import Lock
 from collections import defaultdict
 import http.server
@@ -28,91 +27,18 @@ from .util import (resample_candle_data,
                    new_id)
 from .reflection import dynamically_load_class
 from .reflection import dynamically_load_class
+from .orderbook import OrderBook
+from .gtt import GTTRegistry
+from .commission import NSECommissionModel, nse_commission_func
 
 from .persistence.sqlite.ohlc import SqliteOHLCStorage
 from .persistence.ohlc import OHLCStorageMixin
 from .persistence.tradebook import TradeBookStorageMixin
+from .persistence.journal import StateJournal
 from .persistence.sqlite.tradebook import SqliteTradeBookStorage
 
 
 
-def nse_commission_func(order: Order, brokerage_percentage: float = 0.03, max_commission: float = 20):
-    charges = 0.
-    if max_commission > 0:
-        brokerage = min((brokerage_percentage / 100) * order.price * order.quantity, max_commission)
-    else:
-        brokerage = (brokerage_percentage / 100) * order.price * order.quantity
-    stt = 0.
-    if order.product == TradingProduct.MIS:
-        if order.transaction_type == TransactionType.SELL:
-            stt = (0.025 / 100) * order.price * order.quantity # STT
-    else:
-        stt = (0.1 / 100) * order.price * order.quantity # STT
-    transaction_charges = (0.00325 / 100) * order.price * order.quantity # Transaction charges NSE
-    sebi_charges = (order.price * order.quantity / 10000000) * 10
-    stamp_charges = 0.
-    if order.transaction_type == TransactionType.BUY:
-        stamp_charges = (0.015 / 100) * (order.price * order.quantity / 10000000)
-    gst = (18 / 100) * (brokerage + sebi_charges + transaction_charges)
-    
-    brokerage = round(brokerage, 2)
-    stt = round(stt, 2)
-    transaction_charges = round(transaction_charges, 2)
-    sebi_charges = round(sebi_charges, 2)
-    stamp_charges = round(stamp_charges, 2)
-    gst = round(gst, 2)
-    
-    total = round(brokerage + stt + transaction_charges + sebi_charges + stamp_charges + gst, 2)
-    print(f"Brokerage: {brokerage} for {order.order_id[:4]} {order.transaction_type}"
-          f"| STT: {stt} "
-          f"| TransactionCharges: {transaction_charges} "
-          f"| SEBICharges: {sebi_charges} "
-          f"| Stamp: {stamp_charges} "
-          f"| GST: {gst} "
-          f"| Total : {total}")
-    return total
-
-
-
-
-def nse_commission_func(order: Order, brokerage_percentage: float = 0.03, max_commission: float = 20):
-    charges = 0.
-    if max_commission > 0:
-        brokerage = min((brokerage_percentage / 100) * order.price * order.quantity, max_commission)
-    else:
-        brokerage = (brokerage_percentage / 100) * order.price * order.quantity
-    stt = 0.
-    if order.product == TradingProduct.MIS:
-        if order.transaction_type == TransactionType.SELL:
-            stt = (0.025 / 100) * order.price * order.quantity # STT
-    else:
-        stt = (0.1 / 100) * order.price * order.quantity # STT
-    transaction_charges = (0.00325 / 100) * order.price * order.quantity # Transaction charges NSE
-    sebi_charges = (order.price * order.quantity / 10000000) * 10
-    stamp_charges = 0.
-    if order.transaction_type == TransactionType.BUY:
-        stamp_charges = (0.015 / 100) * (order.price * order.quantity / 10000000)
-    gst = (18 / 100) * (brokerage + sebi_charges + transaction_charges)
-    
-    brokerage = round(brokerage, 2)
-    stt = round(stt, 2)
-    transaction_charges = round(transaction_charges, 2)
-    sebi_charges = round(sebi_charges, 2)
-    stamp_charges = round(stamp_charges, 2)
-    gst = round(gst, 2)
-    
-    total = round(brokerage + stt + transaction_charges + sebi_charges + stamp_charges + gst, 2)
-    print(f"Brokerage: {brokerage} for {order.order_id[:4]} {order.transaction_type}"
-          f"| STT: {stt} "
-          f"| TransactionCharges: {transaction_charges} "
-          f"| SEBICharges: {sebi_charges} "
-          f"| Stamp: {stamp_charges} "
-          f"| GST: {gst} "
-          f"| Total : {total}")
-    return total
-
-
-
 def CallbackHandleFactory(context):
     class CallbackHandler(http.server.BaseHTTPRequestHandler):
 
@@ -193,10 +119,13 @@ class DataProvider(TradingServiceProvider):
     def __init__(self,
                  data_path: str,
                  *args,
-                 StorageClass: Type[OHLCStorageMixin] = SqliteOHLCStorage,
+                 StorageClass: Union[str, Type[OHLCStorageMixin]] = SqliteOHLCStorage,
                  **kwargs):
+        if isinstance(StorageClass, str):
+            StorageClass = dynamically_load_class(StorageClass)
         self.data_path = data_path
         self.StorageClass = StorageClass
+        self.storages = {}
         super().__init__(*args, **kwargs)
 
 
@@ -207,21 +136,29 @@ class DataProvider(TradingServiceProvider):
         root = os.path.join(self.data_path, self.ProviderName,
                             "historical_data", exchange, scrip)
         os.makedirs(root, exist_ok=True)
-        if self.StorageClass == SqliteOHLCStorage:
-            if storage_type == OHLCStorageType.PERM:
-                return os.path.join(root, f"{scrip}__{exchange}_perm.sqlite")
-            elif storage_type == OHLCStorageType.LIVE:
-                return os.path.join(root, f"{scrip}__{exchange}_live.sqlite")
-            else:
-                raise ValueError(f"Cannot find DB for type {storage_type} [{type(storage_type)}]")
-        else:
+        # Storage classes name their file (or directory) extension
+        path_suffix = getattr(self.StorageClass, "path_suffix", None)
+        if path_suffix is None:
             raise ValueError(f"Cannot handle storage type {self.StorageClass}")
+        if storage_type == OHLCStorageType.PERM:
+            return os.path.join(root, f"{scrip}__{exchange}_perm{path_suffix}")
+        elif storage_type == OHLCStorageType.LIVE:
+            return os.path.join(root, f"{scrip}__{exchange}_live{path_suffix}")
+        else:
+            raise ValueError(f"Cannot find DB for type {storage_type} [{type(storage_type)}]")
 
     def get_storage(self, scrip: str,
                     exchange: str,
-                    storage_type: OHLCStorageType):
-        db_path = self.get_db_path(scrip, exchange, storage_type)
-        return self.StorageClass(db_path)
+                    storage_type: OHLCStorageType,
+                    read_only: bool = False):
+        """Storage of an instrument, kept for later calls (the connection itself is shared per file)"""
+        key = (scrip, exchange, storage_type, read_only)
+        storage = self.storages.get(key)
+        if storage is None:
+            db_path = self.get_db_path(scrip, exchange, storage_type)
+            storage = self.StorageClass(db_path, read_only=read_only)
+            self.storages[key] = storage
+        return storage
 
     def get_data_as_df(self,
                        scrip:str,
@@ -231,7 +168,7 @@ class DataProvider(TradingServiceProvider):
                        to_date: datetime.datetime,
                        storage_type: OHLCStorageType = OHLCStorageType.PERM) -> pd.DataFrame:
         
-        storage = self.get_storage(scrip, exchange, storage_type)
+        storage = self.get_storage(scrip, exchange, storage_type, read_only=True)
         if storage_type == OHLCStorageType.LIVE:
             conflict_resolution_type = "REPLACE"
         else:
@@ -482,11 +419,15 @@ class Broker(TradingServiceProvider):
                  audit_records_path: str,
                  *args,
                  TradingBookStorageClass: Type[TradeBookStorageMixin] = SqliteTradeBookStorage,
+                 tradebook_storage_kwargs: Optional[dict] = None,
                  strategy: Optional[str] = None,
                  run_name: Optional[str] = None,
                  thread_id: str = "1",
                  disable_state_persistence: bool = False,
                  commission_func: Optional[callable] = None,
+                 state_flush_interval: float = 0.5,
+                 state_compact_every: int = 1000,
+                 state_snapshot_interval: float = 10.,
                  **kwargs):
         LoggerMixin.__init__(self, *args, **kwargs)
         if isinstance(TradingBookStorageClass, str):
@@ -494,6 +435,9 @@ class Broker(TradingServiceProvider):
         if isinstance(TradingBookStorageClass, str):
             TradingBookStorageClass = dynamically_load_class(TradingBookStorageClass)
         self.TradingBookStorageClass = TradingBookStorageClass
+        if tradebook_storage_kwargs is None:
+            tradebook_storage_kwargs = {}
+        self.tradebook_storage_kwargs = tradebook_storage_kwargs
         self.audit_records_path = audit_records_path
         self.strategy = strategy
         self.run_name = run_name
@@ -504,14 +448,16 @@ class Broker(TradingServiceProvider):
         self.gtt_state_lock = Lock()
         self.state_file_lock = Lock()
         self.disable_state_persistence = disable_state_persistence
-        self.gtt_orders = []
-        self.trade_pnl = {}
-        if commission_func is None:
-            commission_func = nse_commission_func
-        self.commission_func = commission_func
+        self.state_flush_interval = state_flush_interval
+        self.state_compact_every = state_compact_every
+        self.state_snapshot_interval = state_snapshot_interval
+        self.gtt_registry = GTTRegistry()
+        # get_state_version when the last snapshot was requested
+        self.snapshot_state_version = None
         self.trade_pnl = {}
         if commission_func is None:
-            commission_func = nse_commission_func
+            # Prices every order once, entry orders closing a trade reuse the charges of their fill
+            commission_func = NSECommissionModel(logger=self.logger)
         self.commission_func = commission_func
         super().__init__(*args, **kwargs)
         self.load_state()
@@ -521,24 +467,62 @@ class Broker(TradingServiceProvider):
             self.state_filepath = os.path.join(self.audit_records_path,
                                             f"state_{self.__class__.__name__}_"
                                             f"{self.thread_id}.pickle")
+            self.state_journal = StateJournal(self.state_filepath,
+                                              self.get_state,
+                                              flush_interval=self.state_flush_interval,
+                                              compact_every=self.state_compact_every,
+                                              snapshot_interval=self.state_snapshot_interval,
+                                              logger=self.logger)
             self.logger.debug(f"Searching for state in {self.state_filepath}")
-            if os.path.exists(self.state_filepath):
+            state = self.state_journal.load()
+            if state is not None:
                 self.logger.info(f"Loading broker state from {self.state_filepath}")
-                with open(self.state_filepath, 'rb') as fid:
-                    state = pickle.load(fid)
-                    self.gtt_orders = state["gtt_orders"]
-                    if state["extra"] is not None:
-                        for k, v in state["extra"].items():
-                            setattr(self, k, v)
+                self.gtt_orders = state["gtt_orders"]
+                if state["extra"] is not None:
+                    for k, v in state["extra"].items():
+                        setattr(self, k, v)
+                    self.__relink_gtt_orders(state["extra"])
             else:
                 self.logger.info(f"No prior broker state found.")
 
-    def save_state(self):
+    def __relink_gtt_orders(self, extra: dict):
+        """Point GTT pairs replayed from the journal back at the restored orders"""
+        orders = {}
+        for v in extra.values():
+            if isinstance(v, list):
+                for order in v:
+                    if isinstance(order, Order):
+                        orders[order.order_id] = order
+        self.gtt_orders = [(orders.get(o1.order_id, o1), orders.get(o2.order_id, o2))
+                           for o1, o2 in self.gtt_orders]
+
+    def save_state(self, op: Optional[str] = None, *args):
+        """Persist a GTT change (see persistence.journal.apply_gtt_delta), or everything without one
+
+        Only queues the change: a background writer appends it to the
+        state journal and snapshots the full state when due.
+        """
         if not self.disable_state_persistence:
-            self.logger.debug(f"Saving state to {self.state_filepath}")
-            with open(self.state_filepath, 'wb') as fid:
-                state = self.get_state()
-                pickle.dump(state, fid)
+            if op is not None:
+                self.state_journal.record(op, *args)
+            else:
+                self.state_journal.request_snapshot()
+
+    def get_state_version(self) -> Optional[object]:
+        """Changes whenever orders or positions change, None if the broker does not track it
+
+        gtt_order_callback only requests a snapshot when it changed.
+        """
+        return None
+
+    @property
+    def gtt_orders(self) -> list[tuple[Order, Order]]:
+        """GTT pairs of (entry order, other order), in the order they were placed"""
+        return list(self.gtt_registry)
+
+    @gtt_orders.setter
+    def gtt_orders(self, gtt_orders: list[tuple[Order, Order]]):
+        self.gtt_registry = GTTRegistry(gtt_orders)
 
     def clear_tradebooks(self, scrip: str, exchange: str):
         if (self.strategy is not None and self.run_name is not None):
@@ -564,50 +548,54 @@ class Broker(TradingServiceProvider):
             self.logger.debug("Connecting to new Tradebook storage")
             self.logger.debug("Connecting to new Tradebook storage")
             db_path = self.get_tradebook_db_path()
-            self.tradebook_storage = self.TradingBookStorageClass(db_path)
+            self.tradebook_storage = self.TradingBookStorageClass(db_path, **self.tradebook_storage_kwargs)
         return self.tradebook_storage
 
+    def get_order_book(self) -> OrderBook:
+        """Orders indexed by id, parent, group, instrument and state
+
+        Brokers keeping an OrderBook of their own return it as is, the rest get one
+        built from the cached orders.
+        """
+        return OrderBook(self.get_orders(refresh_cache=False))
+
     def cancel_invalid_child_orders(self):
         state_changed = False
-        for order in self.get_orders(refresh_cache=False):
-            if order.state != OrderState.PENDING:
-                if order.parent_order_id is not None:
-                    #self.logger.info(f"Searching for siblings of "
-                    #                 f"{order.order_id} (parent={order.parent_order_id})")
-                    for other_order in self.get_orders(refresh_cache=False):
-                        if (other_order.parent_order_id == order.parent_order_id and
-                            other_order.order_id != order.order_id and
-                            other_order.state == OrderState.PENDING):
-                            state_changed = True
-                            self.logger.info(f"Cancelling order {other_order.order_id}/"
-                                            f"{other_order.scrip}/{other_order.exchange}/"
-                                            f"{other_order.transaction_type}/{other_order.order_type}"
-                                            f"{','.join(other_order.tags)} due OCO (Sibling of {order.order_id})")
-                            self.cancel_order(other_order, refresh_cache=False)
-                            self.delete_gtt_orders_for(other_order)
+        order_book = self.get_order_book()
+        for other_order in order_book.get_pending_orders():
+            if other_order.parent_order_id is None or other_order.state != OrderState.PENDING:
+                continue
+            for order in order_book.get_orders(parent_order_id=other_order.parent_order_id):
+                if order.state != OrderState.PENDING:
+                    state_changed = True
+                    self.logger.info(f"Cancelling order {other_order.order_id}/"
+                                    f"{other_order.scrip}/{other_order.exchange}/"
+                                    f"{other_order.transaction_type}/{other_order.order_type}"
+                                    f"{','.join(other_order.tags)} due OCO (Sibling of {order.order_id})")
+                    self.cancel_order(other_order, refresh_cache=False)
+                    self.delete_gtt_orders_for(other_order)
+                    break
         if state_changed:
             self.get_orders(refresh_cache=True)
 
     def cancel_invalid_group_orders(self):
-        for order in self.get_orders(refresh_cache=False):
-            state_changed = False
-            if (order.group_id is not None
-                and order.state != OrderState.PENDING):
-                #self.logger.info(f"Searching for group members of "
-                #                 f"{order.order_id} (group_id={order.group_id})")
-                for other_order in self.get_orders(refresh_cache=False):
-                    if (other_order.group_id == order.group_id
-                        and other_order.order_id != order.order_id
-                        and other_order.state == OrderState.PENDING):
-                        state_changed = True
-                        self.logger.info(f"Cancelling order {other_order.order_id[:4]}/"
-                                         f"{other_order.scrip}/{other_order.exchange}/"
-                                         f"{other_order.transaction_type}/{other_order.order_type}"
-                                         f"{','.join(other_order.tags)} due OCO (Group of {order.group_id})")
-                        self.cancel_order(other_order, refresh_cache=False)
-                        self.delete_gtt_orders_for(other_order)
-            if state_changed:
-                self.get_orders(refresh_cache=True)
+        state_changed = False
+        order_book = self.get_order_book()
+        for other_order in order_book.get_pending_orders():
+            if other_order.group_id is None or other_order.state != OrderState.PENDING:
+                continue
+            for order in order_book.get_orders(group_id=other_order.group_id):
+                if order.state != OrderState.PENDING:
+                    state_changed = True
+                    self.logger.info(f"Cancelling order {other_order.order_id}/"
+                                     f"{other_order.scrip}/{other_order.exchange}/"
+                                     f"{other_order.transaction_type}/{other_order.order_type}"
+                                     f"{','.join(other_order.tags)} due OCO (Group of {order.group_id})")
+                    self.cancel_order(other_order, refresh_cache=False)
+                    self.delete_gtt_orders_for(other_order)
+                    break
+        if state_changed:
+            self.get_orders(refresh_cache=True)
 
     # Get state in a form that can be printed as a table.
     def get_orders_as_table(self) -> (list[list], list):
@@ -615,8 +603,8 @@ class Broker(TradingServiceProvider):
         for order in self.get_orders():
             if order.state == OrderState.PENDING:
                 printable_orders.append(["R",
-                                         order.order_id[:4],
-                                         order.parent_order_id[:4] if order.parent_order_id is not None else "",
+                                         order.order_id,
+                                         order.parent_order_id if order.parent_order_id is not None else "",
                                          order.group_id[:4] if order.group_id is not None else "",
                                          order.scrip,
                                          order.exchange,
@@ -627,8 +615,8 @@ class Broker(TradingServiceProvider):
                                          ", ".join(order.tags)])
         for from_order, to_order in self.get_gtt_orders():
             printable_orders.append(["GTT",
-                                     to_order.order_id[:4],
-                                     from_order.order_id[:4],
+                                     to_order.order_id,
+                                     from_order.order_id,
                                      to_order.group_id[:4] if to_order.group_id is not None else "",
                                      to_order.scrip,
                                      to_order.exchange,
@@ -724,6 +712,7 @@ class Broker(TradingServiceProvider):
                      exchange_id=exchange,
                      scrip=scrip,
                      exchange=exchange,
+                     order_id=self.new_order_id(),
                      transaction_type=transaction_type,
                      timestamp=self.current_datetime(),
                      order_type = order_type,
@@ -774,58 +763,51 @@ class Broker(TradingServiceProvider):
                                           event="OrderCreated")
         return order
 
+    def new_order_id(self) -> str:
+        """Id of an order created by create_express_order"""
+        return new_id()
+
     def place_gtt_order(self,
                         entry_order: Order,
                         other_order: Order) -> (Order, Order):
         with self.gtt_state_lock:
-            self.gtt_orders.append((entry_order, other_order))
-        self.save_state()
+            self.gtt_registry.add(entry_order, other_order)
+        self.save_state("put", entry_order, other_order)
         return entry_order, other_order
 
     def get_gtt_orders(self) -> list[(Order, Order)]:
         return self.gtt_orders
 
     def get_gtt_orders_for(self, order: Order) -> list[Order]:
-        result = []
-        for o1, o2 in self.get_gtt_orders():
-            if o1.order_id == order.order_id:
-                result.append(o2)
-        return result
+        return self.gtt_registry.get_orders_for(order.order_id)
 
     def update_gtt_order(self,
                          entry_order: Order,
                          other_order: Order) -> (Order, Order):
         with self.gtt_state_lock:
-            for ii, (o1, o2) in enumerate(self.gtt_orders):
-                if (o1.order_id == entry_order.order_id
-                    and o2.order_id == other_order.order_id):
-                    self.gtt_orders[ii] == (entry_order, other_order)
-        self.save_state()
+            updated = self.gtt_registry.update(entry_order, other_order)
+        if updated:
+            self.save_state("put", entry_order, other_order)
         return entry_order, other_order
 
     def delete_gtt_orders_for(self, order: Order):
-        new_gtt_orders = []
         with self.gtt_state_lock:
-            for o1, o2 in self.get_gtt_orders():
-                if o1.order_id == order.order_id:
-                    continue
-                new_gtt_orders.append((o1, o2))
-            self.gtt_orders = new_gtt_orders
-        self.save_state()
+            self.gtt_registry.remove_entry(order.order_id)
+        self.save_state("delete_for", order.order_id)
 
     def clear_gtt_orders(self):
         with self.gtt_state_lock:
-            self.gtt_orders =[]
-        self.save_state()
+            self.gtt_registry.clear()
+        self.save_state("clear")
 
     def gtt_order_callback(self,
                            refresh_cache: bool = True) -> bool:
-        new_gtt_orders = []
+        removed_gtt_orders = []
         gtt_state_changed = False
         self.get_orders(refresh_cache=refresh_cache)
         with self.gtt_state_lock:
-            for entry_order, other_order in self.gtt_orders:
-                print(entry_order.state, other_order.state)
+            # Only pairs whose entry order changed since the last call, see update_gtt_orders_for
+            for entry_order, other_order in self.gtt_registry.pop_ready_pairs():
                 if (entry_order.state == OrderState.COMPLETED
                     and other_order.state == OrderState.PENDING):
                     if entry_order.product == TradingProduct.MIS:
@@ -834,6 +816,7 @@ class Broker(TradingServiceProvider):
                         self.place_order(other_order, refresh_cache=False)
                         # print(other_order)
                         gtt_state_changed = True
+                        removed_gtt_orders.append((entry_order.order_id, other_order.order_id))
                         continue
                     elif entry_order.product in [TradingProduct.NRML, TradingProduct.CNC]: 
                         # This means, there is some order placed for long term. 
@@ -841,26 +824,32 @@ class Broker(TradingServiceProvider):
                         # order is from the previous work day, place gtt orders.
                         
                         self.place_order(other_order, refresh_cache=False)
+                        removed_gtt_orders.append((entry_order.order_id, other_order.order_id))
                         continue
                 elif (entry_order.state == OrderState.CANCELLED or entry_order.state == OrderState.REJECTED):
                     gtt_state_changed = True
+                    removed_gtt_orders.append((entry_order.order_id, other_order.order_id))
                     continue
-                new_gtt_orders.append((entry_order, other_order))
-            self.gtt_orders = new_gtt_orders
+            for entry_order_id, other_order_id in removed_gtt_orders:
+                self.gtt_registry.remove(entry_order_id, other_order_id)
         self.get_orders(refresh_cache=refresh_cache)
         self.cancel_invalid_child_orders()
         self.cancel_invalid_group_orders()
         self.get_orders(refresh_cache=refresh_cache)
         self.get_orders(refresh_cache=refresh_cache)
-        self.save_state()
+        if len(removed_gtt_orders) > 0:
+            self.save_state("remove", removed_gtt_orders)
+        # GTT changes are in the journal already, orders and positions need a snapshot
+        state_version = self.get_state_version()
+        if state_version is None or state_version != self.snapshot_state_version:
+            self.snapshot_state_version = state_version
+            self.save_state()
         return gtt_state_changed
 
     def update_gtt_orders_for(self, order: Order):
+        """Use order as the entry of its GTT pairs, queueing them for gtt_order_callback once it left the pending state"""
         with self.gtt_state_lock:
-            for ii, (from_order, to_order) in enumerate(self.gtt_orders):
-                print(ii, from_order.order_id, to_order.order_id, order.order_id)
-                if from_order.order_id == order.order_id:
-                    self.gtt_orders[ii] = (order, to_order)
+            self.gtt_registry.update_entry(order)
 
 
     def start_order_change_streamer(self):
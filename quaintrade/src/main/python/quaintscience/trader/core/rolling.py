@@ -0,0 +1,49 @@
+"""Rolling window extremes in O(N) regardless of the window size
+
+Windows are split into blocks of the window size and combined from
+per-block prefix and suffix extremes (van Herk / Gil-Werman), so all the
+work is a handful of NumPy accumulations. Results match
+pd.Series.rolling(window).max()/min(): NaN until the window is full and
+NaN for every window holding a NaN.
+"""
+import numpy as np
+
+
+def __blocks(values: np.ndarray, window: int, fill: float) -> np.ndarray:
+    values = np.asarray(values, dtype=float)
+    padding = (-len(values)) % window
+    return np.concatenate([values, np.full(padding, fill)]).reshape(-1, window)
+
+
+def __rolling_extreme(values: np.ndarray, window: int, accumulate, combine, fill: float) -> np.ndarray:
+    n = len(values)
+    out = np.full(n, np.nan)
+    if window < 1:
+        raise ValueError(f"Window size must be positive, got {window}")
+    if n < window:
+        return out
+    blocks = __blocks(values, window, fill)
+    prefix = accumulate(blocks, axis=1).ravel()
+    suffix = accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    ends = np.arange(window - 1, n)
+    out[window - 1:] = combine(suffix[ends - window + 1], prefix[ends])
+    return out
+
+
+def rolling_max(values: np.ndarray, window: int) -> np.ndarray:
+    """Maximum of every trailing window of values"""
+    return __rolling_extreme(values, window, np.maximum.accumulate, np.maximum, -np.inf)
+
+
+def rolling_min(values: np.ndarray, window: int) -> np.ndarray:
+    """Minimum of every trailing window of values"""
+    return __rolling_extreme(values, window, np.minimum.accumulate, np.minimum, np.inf)
+
+
+def centered(rolled: np.ndarray, window: int) -> np.ndarray:
+    """Turn a trailing-window result into the one of rolling(window, center=True)"""
+    shift = (window - 1) // 2
+    out = np.full(len(rolled), np.nan)
+    if shift < len(rolled):
+        out[:len(rolled) - shift] = rolled[shift:]
+    return out
@@ -0,0 +1,140 @@
+"""Candles shared between processes through memory-mapped files
+
+Backtest and optimizer workers running over the same instrument would
+each read and resample their own copy of its candles. A SharedCandleStore
+materializes the candles of every (instrument, interval, range) key once
+into a file under its folder, and every process then maps that file
+read-only: the DataFrames it hands out are views of the mapping, so the
+pages are held once by the OS page cache however many workers use them.
+
+A file is a small header followed by the index and the columns:
+
+    magic (8 bytes) | header length (8 bytes, little endian) | JSON header
+    index as int64 epoch nanoseconds          (64 byte aligned)
+    columns as a float64 [columns x rows] block (64 byte aligned)
+
+The files hold the candles of one run; the store does not notice when the
+underlying storage changes, so it is cleared at the end of the run
+rather than kept across runs.
+"""
+from typing import Callable, Optional
+import hashlib
+import fcntl
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from .logging import LoggerMixin
+from .util import datetime_index_to_ns
+
+
+SHARED_CANDLES_MAGIC = b"QTCANDL1"
+SHARED_CANDLES_ALIGNMENT = 64
+
+
+def align(offset: int) -> int:
+    return -(-offset // SHARED_CANDLES_ALIGNMENT) * SHARED_CANDLES_ALIGNMENT
+
+
+class SharedCandleStore(LoggerMixin):
+
+    def __init__(self, *args,
+                 path: str,
+                 **kwargs):
+        self.path = path
+        # Frames attached by this process, they share the mapping of their file
+        self.attached = {}
+        super().__init__(*args, **kwargs)
+
+    def __getstate__(self):
+        # Mappings are not carried into other processes, they attach again
+        state = self.__dict__.copy()
+        state["attached"] = {}
+        return state
+
+    def get_filepath(self, key: tuple) -> str:
+        return os.path.join(self.path, f"{hashlib.sha1(repr(key).encode()).hexdigest()}.candles")
+
+    def write(self, key: tuple, data: pd.DataFrame):
+        """Materialize data (numeric columns on a DatetimeIndex) as the candles of key"""
+        header = json.dumps({"key": repr(key),
+                             "rows": len(data),
+                             "columns": list(data.columns),
+                             "index_name": data.index.name}).encode()
+        index_offset = align(16 + len(header))
+        values_offset = align(index_offset + 8 * len(data))
+        os.makedirs(self.path, exist_ok=True)
+        fpath = self.get_filepath(key)
+        tmp_fpath = f"{fpath}.{os.getpid()}.tmp"
+        with open(tmp_fpath, "wb") as fid:
+            fid.write(SHARED_CANDLES_MAGIC)
+            fid.write(len(header).to_bytes(8, "little"))
+            fid.write(header)
+            fid.seek(index_offset)
+            fid.write(datetime_index_to_ns(data.index).astype("<i8").tobytes())
+            fid.seek(values_offset)
+            fid.write(np.ascontiguousarray(data.to_numpy(dtype=np.float64).T, dtype="<f8").tobytes())
+        os.replace(tmp_fpath, fpath)
+
+    def attach(self, key: tuple) -> Optional[pd.DataFrame]:
+        """Read-only candles of key mapped from their file, None if they were not materialized"""
+        if key in self.attached:
+            return self.attached[key]
+        fpath = self.get_filepath(key)
+        try:
+            with open(fpath, "rb") as fid:
+                if fid.read(8) != SHARED_CANDLES_MAGIC:
+                    return None
+                header_length = int.from_bytes(fid.read(8), "little")
+                header = json.loads(fid.read(header_length))
+        except (OSError, ValueError):
+            return None
+        if header["key"] != repr(key):
+            return None
+        rows, columns = header["rows"], header["columns"]
+        index_offset = align(16 + header_length)
+        values_offset = align(index_offset + 8 * rows)
+        if rows == 0:
+            frame = pd.DataFrame({col: np.empty(0) for col in columns},
+                                 index=pd.DatetimeIndex([], dtype="datetime64[ns]", name=header["index_name"]))
+        else:
+            mapping = np.memmap(fpath, dtype=np.uint8, mode="r")
+            index = mapping[index_offset:index_offset + 8 * rows].view("<i8").view("datetime64[ns]")
+            values = mapping[values_offset:values_offset + 8 * rows * len(columns)].view("<f8")
+            # The [columns x rows] block is what pandas keeps internally, so no copy is made
+            frame = pd.DataFrame(values.reshape(len(columns), rows).T,
+                                 index=pd.DatetimeIndex(index, name=header["index_name"], copy=False),
+                                 columns=columns,
+                                 copy=False)
+        self.attached[key] = frame
+        return frame
+
+    def get(self, key: tuple, loader: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """Candles of key, calling loader to materialize them if no process did yet
+
+        Processes asking for the same key at once wait on a lock file, so the
+        candles are loaded by one of them only.
+        """
+        frame = self.attach(key)
+        if frame is None:
+            os.makedirs(self.path, exist_ok=True)
+            with open(f"{self.get_filepath(key)}.lock", "wb") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    frame = self.attach(key)
+                    if frame is None:
+                        self.logger.info(f"Materializing shared candles for {key}")
+                        self.write(key, loader())
+                        frame = self.attach(key)
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+        # Callers may add columns, which must not show up in the attached frame
+        return frame.copy(deep=False)
+
+    def clear(self):
+        """Remove the files, frames attached already keep their mappings"""
+        self.attached = {}
+        shutil.rmtree(self.path, ignore_errors=True)
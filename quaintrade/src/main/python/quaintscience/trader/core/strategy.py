@@ -1,6 +1,5 @@
 from abc import ABC, abstractmethod
 from typing import Optional, Union
-import copy
 import datetime
 from functools import partial
 import os
@@ -353,7 +352,7 @@ class Strategy(ABC, LoggerMixin):
         if tags is None:
             tags = []
 
-        all_tags = copy.deepcopy(self.default_tags)
+        all_tags = list(self.default_tags)
         all_tags.extend(tags)
         all_tags = list(set(all_tags))
         all_tags.append(position_type.value)
@@ -462,26 +461,28 @@ class Strategy(ABC, LoggerMixin):
               window: pd.DataFrame,
               context: dict[str, pd.DataFrame]) -> None:
 
+        last_row = window.iloc[-1]
         colvals = []
         for col in window.columns:
             if col not in ["open", "high", "low", "close"]:
-                colvals.append(f"{col}={window.iloc[-1][col]}")
-        self.logger.info(f"{self.__class__.__name__} [{window.iloc[-1].name}]:"
-                         f" O={window.iloc[-1]['open']}"
-                         f" H={window.iloc[-1]['high']}"
-                         f" L={window.iloc[-1]['low']}"
-                         f" C={window.iloc[-1]['close']}"
+                colvals.append(f"{col}={last_row[col]}")
+        self.logger.info(f"{self.__class__.__name__} [{last_row.name}]:"
+                         f" O={last_row['open']}"
+                         f" H={last_row['high']}"
+                         f" L={last_row['low']}"
+                         f" C={last_row['close']}"
                          f" {' '.join(colvals)}")
         for key, cdf in context.items():
+            last_context_row = cdf.iloc[-1]
             colvals = []
             for col in cdf.columns:
                 if col not in ["open", "high", "low", "close"]:
-                    colvals.append(f"{col}={cdf.iloc[-1][col]}")
-            self.logger.info(f"CONTEXT {key} {self.__class__.__name__} [{cdf.iloc[-1].name}]:"
-                            f" O={cdf.iloc[-1]['open']}"
-                            f" H={cdf.iloc[-1]['high']}"
-                            f" L={cdf.iloc[-1]['low']}"
-                            f" C={cdf.iloc[-1]['close']}"
+                    colvals.append(f"{col}={last_context_row[col]}")
+            self.logger.info(f"CONTEXT {key} {self.__class__.__name__} [{last_context_row.name}]:"
+                            f" O={last_context_row['open']}"
+                            f" H={last_context_row['high']}"
+                            f" L={last_context_row['low']}"
+                            f" C={last_context_row['close']}"
                             f" {' '.join(colvals)}")
         self.apply_impl(broker=broker,
                         scrip=scrip,
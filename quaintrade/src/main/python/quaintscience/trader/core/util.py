@@ -92,19 +92,60 @@ def new_id_field():
     return field(default_factory=lambda: new_id())
 
 
+RESAMPLE_ORIGIN = datetime.datetime.fromisoformat('1970-01-01 09:15:00')
+
+
 def resample_candle_data(data, interval):
-    data = data.resample(interval, origin=datetime.datetime.fromisoformat('1970-01-01 09:15:00')).apply({'open': 'first',
+    data = data.resample(interval, origin=RESAMPLE_ORIGIN).apply({'open': 'first',
                                           'high': 'max',
                                           'low': 'min',
                                           'close': 'last'})
     data.dropna(inplace=True)
     return data
 
+def get_last_candle_start(data, interval):
+    """Timestamp of the first row of data falling in the last candle resample_candle_data builds"""
+    first = data.index.to_series().resample(interval, origin=RESAMPLE_ORIGIN).first().dropna()
+    return first.iloc[-1]
+
+
+def datetime_index_to_ns(index: pd.Index) -> np.ndarray:
+    """Convert a DatetimeIndex into a plain int64 array of epoch nanoseconds"""
+    return np.asarray(index.values).astype("datetime64[ns]").view(np.int64)
+
+
+def to_epoch_ns(dt: Union[datetime.datetime, pd.Timestamp]) -> np.int64:
+    """Convert a datetime into epoch nanoseconds"""
+    return pd.Timestamp(dt).to_datetime64().astype("datetime64[ns]").astype(np.int64)
+
+
+def get_nearest_index(values: np.ndarray, target: np.int64) -> int:
+    """Index of the element in a sorted int64 array nearest to target.
+
+    Ties are broken the same way as pd.Index.get_indexer(method="nearest")
+    (the right neighbour wins), so this can replace it on hot paths.
+    """
+    if len(values) == 0:
+        return -1
+    right = int(np.searchsorted(values, target, side="left"))
+    if right >= len(values):
+        return len(values) - 1
+    if right == 0 or values[right] == target:
+        return right
+    left = right - 1
+    if target - values[left] < values[right] - target:
+        return left
+    return right
+
+
+SANITIZE_PATTERN = re.compile(r"[: \-]")
+
+
 def sanitize(s: str):
-    pattern = re.compile(r"[: \-]")
-    return re.sub(pattern, "_", s)
+    return re.sub(SANITIZE_PATTERN, "_", s)
 
 
+@functools.lru_cache(maxsize=4096)
 def get_key_from_scrip_and_exchange(scrip: str,
                                     exchange: str):
         scrip = sanitize(scrip)
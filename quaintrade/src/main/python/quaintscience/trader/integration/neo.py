@@ -254,6 +254,11 @@ class NeoBrokerProvider(NeoBaseMixin,
                 "extra": {"orders_cache": self.orders_cache,
                           "positions_cache": self.positions_cache}}
 
+    def get_state_version(self) -> tuple:
+        return (tuple((order.order_id, order.state, order.quantity, order.price) for order in self.orders_cache),
+                tuple((position.scrip, position.exchange, position.product, position.quantity)
+                      for position in self.positions_cache))
+
     # Order management
 
     """
@@ -575,6 +580,6 @@ class NeoBrokerProvider(NeoBaseMixin,
 
     def __update_gtt_orders_using_dct(self, order: dict):
         with self.gtt_state_lock:
-            for from_order, _ in self.gtt_orders:
-                if from_order.order_id == order["nOrdNo"]:
-                    self.__update_order_from_dct(from_order, order)
+            for from_order in self.gtt_registry.get_entry_orders(order["nOrdNo"]):
+                self.__update_order_from_dct(from_order, order)
+            self.gtt_registry.mark_ready(order["nOrdNo"])
@@ -1,8 +1,11 @@
 import datetime
-from typing import Optional
+from typing import Optional, Union, Callable
 from dataclasses import dataclass
 import copy
 import copy
+import itertools
+from functools import partial
+import numpy as np
 import pandas as pd
 from tabulate import tabulate
 
@@ -13,9 +16,16 @@ from ..core.ds import (Order,
                        OrderState,
                        TransactionType)
 from ..core.roles import Broker, HistoricDataProvider
+from ..core.orderbook import OrderBook
+from ..core.matching import OrderMatchingEngine, get_intrabar_path
+from ..core.ledger import PnLLedger, get_drawdown, get_periodic_pnl
+from ..core.shared_candles import SharedCandleStore
 from ..core.util import (default_dataclass_field,
                          get_key_from_scrip_and_exchange,
-                         get_scrip_and_exchange_from_key)
+                         get_scrip_and_exchange_from_key,
+                         datetime_index_to_ns,
+                         to_epoch_ns,
+                         get_nearest_index)
 from .common import get_instrument_for_provider
 
 
@@ -54,9 +64,17 @@ class PaperBroker(Broker):
                  refresh_orders_immediately_on_gtt_state_change: bool = False,
                  refresh_data_on_every_time_change: bool = False,
                  max_history_days: int = 1,
+                 intrabar_fill_order: Union[str, Callable] = "nearest_extreme_first",
+                 fill_interval: Optional[str] = None,
+                 fill_storage_type: str = "perm",
+                 mark_to_market: str = "bar",
+                 shared_candles: Optional[SharedCandleStore] = None,
                  **kwargs):
 
         self.data_provider = data_provider
+        # Candles are attached from (and materialized once into) memory-mapped
+        # files that concurrent workers share instead of loading their own
+        self.shared_candles = shared_candles
 
         if instruments is None:
             instruments = []
@@ -72,51 +90,167 @@ class PaperBroker(Broker):
         self.historic_context_to = historic_context_to
         
         self.interval = interval
+        # Orders can be filled against finer candles than the bars the strategy
+        # runs on (interval), e.g. 1min candles from the PERM store, from the
+        # ticks recorded in the LIVE store, or both ("blend", PERM first).
+        if fill_interval == interval:
+            fill_interval = None
+        if fill_storage_type not in ["perm", "live", "blend"]:
+            raise ValueError(f"Unknown fill storage type {fill_storage_type}")
+        self.fill_interval = fill_interval
+        self.fill_storage_type = fill_storage_type
         self.refresh_orders_immediately_on_gtt_state_change = refresh_orders_immediately_on_gtt_state_change
 
         self.refresh_data_on_every_time_change = refresh_data_on_every_time_change
+        self.intrabar_path = get_intrabar_path(intrabar_fill_order)
+        # Positions are revalued (and stored in the tradebook) on every bar,
+        # on the last bar of every period of this frequency (e.g. "1D") or
+        # only by mark_positions_to_market ("end"). The equity curve comes
+        # from the ledger either way.
+        self.mark_to_market = mark_to_market
+        self.ledger = PnLLedger()
         self.orders = []
         self.positions = {}
 
         self.data = {}
         self.idx = {}
+        self.timestamps = {}
+        self.candles = {}
 
         self.current_time = None
 
         self.events = []
 
         self.pnl_history = []
-        self.trade_timestamps = {}
-        self.trade_transaction_types = {}
+        self.start_idx = {}
+        self.checkpoints = {}
         self.max_history_days = max_history_days
         self.order_stats = {"completed": 0,
                             "cancelled": 0,
                             "pending": 0}
+        self.order_id_counter = itertools.count(1)
 
         super().__init__(*args, **kwargs)
 
+    @property
+    def trade_pnl(self) -> dict:
+        trades = self.ledger.get_trades()
+        return dict(zip(trades["order_id"], trades["pnl"]))
+
+    @trade_pnl.setter
+    def trade_pnl(self, trade_pnl: dict):
+        # Broker.__init__ starts from an empty dict
+        self.ledger.clear_trades()
+        for order_id, pnl in trade_pnl.items():
+            self.ledger.record_trade(order_id, None, None, TransactionType.BUY, pnl)
+
+    @property
+    def trade_timestamps(self) -> dict:
+        trades = self.ledger.get_trades()
+        return {order_id: [entry_time, exit_time]
+                for order_id, entry_time, exit_time in zip(trades["order_id"],
+                                                           trades["entry_time"],
+                                                           trades["exit_time"])}
+
+    @property
+    def trade_transaction_types(self) -> dict:
+        trades = self.ledger.get_trades()
+        return {order_id: TransactionType(transaction_type)
+                for order_id, transaction_type in zip(trades["order_id"], trades["transaction_type"])}
+
+    @property
+    def orders(self) -> list[Order]:
+        return self.order_book.orders
+
+    @orders.setter
+    def orders(self, orders: list[Order]):
+        self.order_book = OrderBook(orders)
+        self.matching_engine = OrderMatchingEngine(self.order_book)
+        for order in self.order_book:
+            self.matching_engine.add(order)
+
     def get_state(self) -> dict:
         return {"gtt_orders": self.gtt_orders,
                 "extra": {"orders": self.orders,
                           "positions": self.positions,
                           "current_time": self.current_time}}
 
+    def get_state_version(self) -> int:
+        # Positions only change when orders fill
+        return self.order_book.version
+
     def init(self):
         del self.data
         self.data = {}
+        self.timestamps = {}
+        self.candles = {}
         for instrument in self.instruments:
-            self.logger.info(f"Paper Trader: Loading data for {instrument}")
-            scrip = instrument["scrip"]
-            exchange = instrument["exchange"]
-            data_provider_instrument = get_instrument_for_provider(instrument, self.data_provider.__class__)
-            instrument_data = self.data_provider.get_data_as_df(scrip=data_provider_instrument["scrip"],
-                                                                exchange=data_provider_instrument["exchange"],
-                                                                interval=self.interval,
-                                                                from_date=self.historic_context_from,
-                                                                to_date=self.historic_context_to,
-                                                                storage_type=OHLCStorageType.PERM,
-                                                                download_missing_data=False)
-            self.data[get_key_from_scrip_and_exchange(scrip, exchange)] = instrument_data
+            self.set_instrument_data(get_key_from_scrip_and_exchange(instrument["scrip"], instrument["exchange"]),
+                                     self.load_instrument_data(instrument))
+
+    def load_instrument_data(self,
+                             instrument: dict,
+                             from_date: Optional[datetime.datetime] = None,
+                             to_date: Optional[datetime.datetime] = None) -> pd.DataFrame:
+        """Candles of instrument over [from_date, to_date], the historic context by default"""
+        from_date = self.historic_context_from if from_date is None else from_date
+        to_date = self.historic_context_to if to_date is None else to_date
+        if self.shared_candles is None:
+            return self.read_instrument_data(instrument, from_date, to_date)
+        key = ("broker", self.data_provider.ProviderName, instrument["scrip"], instrument["exchange"],
+               self.interval, self.fill_interval, self.fill_storage_type, str(from_date), str(to_date))
+        return self.shared_candles.get(key, partial(self.read_instrument_data, instrument, from_date, to_date))
+
+    def read_instrument_data(self,
+                             instrument: dict,
+                             from_date: datetime.datetime,
+                             to_date: datetime.datetime) -> pd.DataFrame:
+        self.logger.info(f"Paper Trader: Loading data for {instrument}")
+        data_provider_instrument = get_instrument_for_provider(instrument, self.data_provider.__class__)
+        if self.fill_interval is None:
+            return self.data_provider.get_data_as_df(scrip=data_provider_instrument["scrip"],
+                                                     exchange=data_provider_instrument["exchange"],
+                                                     interval=self.interval,
+                                                     from_date=from_date,
+                                                     to_date=to_date,
+                                                     storage_type=OHLCStorageType.PERM,
+                                                     download_missing_data=False)
+        storage_types = {"perm": [OHLCStorageType.PERM],
+                         "live": [OHLCStorageType.LIVE],
+                         "blend": [OHLCStorageType.PERM, OHLCStorageType.LIVE]}[self.fill_storage_type]
+        data = None
+        for storage_type in storage_types:
+            storage_data = self.data_provider.get_data_as_df(scrip=data_provider_instrument["scrip"],
+                                                             exchange=data_provider_instrument["exchange"],
+                                                             interval=self.fill_interval,
+                                                             from_date=from_date,
+                                                             to_date=to_date,
+                                                             storage_type=storage_type,
+                                                             download_missing_data=False)
+            data = storage_data if data is None else data.combine_first(storage_data)
+        self.logger.info(f"Paper Trader: Filling orders on {len(data)} {self.fill_interval} candles "
+                         f"from {self.fill_storage_type} data")
+        return data
+
+    def set_instrument_data(self, key: str, data: pd.DataFrame):
+        # Order matching walks these arrays with an integer cursor
+        # instead of calling iloc on the dataframe for every candle.
+        self.data[key] = data
+        self.timestamps[key] = datetime_index_to_ns(data.index)
+        self.candles[key] = {col: data[col].to_numpy()
+                             for col in ["open", "high", "low", "close"]}
+        if self.mark_to_market not in ["bar", "end"]:
+            # Last bar of every period
+            periods = data.index.to_period(self.mark_to_market).asi8
+            self.checkpoints[key] = np.append(periods[1:] != periods[:-1], True)
+
+    def get_candle(self, key: str, idx: Optional[int] = None) -> dict:
+        if idx is None:
+            idx = self.idx[key]
+        return {col: values[idx] for col, values in self.candles[key].items()}
+
+    def get_last_price(self, key: str) -> float:
+        return self.candles[key]["close"][self.idx[key]]
 
     def current_datetime(self):
         return self.current_time
@@ -130,47 +264,107 @@ class PaperBroker(Broker):
         if (self.current_datetime() is not None
             and self.current_datetime().day != dt.day
             and (dt - self.current_datetime()).days >= self.max_history_days):
-            orders = []
-            for order in self.get_orders():
-                if (order.state == OrderState.COMPLETED
-                    or order.state == OrderState.CANCELLED):
-                    continue
-                orders.append(order)
-            self.orders = orders
+            self.order_book.remove_orders([OrderState.COMPLETED, OrderState.CANCELLED])
             print(f"Cleaned orders {len(self.orders)}")
 
+        dt_ns = to_epoch_ns(dt)
+        if self.fill_interval is not None:
+            # Walk every fill candle of the strategy bar starting at dt
+            bar_end_ns = dt_ns + pd.Timedelta(self.interval).value
         for instrument in self.data.keys():
-
-            to_idx = self.data[instrument].index.get_indexer([dt], method="nearest")[0]
-            if to_idx + 1 >= len(self.data[instrument]):
-                print(to_idx, len(self.data[instrument]))
+            timestamps = self.timestamps[instrument]
+            if self.fill_interval is None:
+                to_idx = get_nearest_index(timestamps, dt_ns)
+            else:
+                to_idx = int(np.searchsorted(timestamps, bar_end_ns, side="left")) - 1
+            if to_idx + 1 >= len(timestamps):
+                print(to_idx, len(timestamps))
                 raise PaperTraderTimeExceededException(f"Time exceeds last item in data for {instrument}")
-            if self.data[instrument].iloc[to_idx].name < dt:
+            if self.fill_interval is None and timestamps[to_idx] < dt_ns:
                 to_idx += 1
 
             if not traverse:
                 self.current_time = dt
                 self.idx[instrument] = to_idx
+                self.start_idx.setdefault(instrument, to_idx)
 
+            index = self.data[instrument].index
+            scrip, exchange = get_scrip_and_exchange_from_key(instrument)
             for idx in range(self.idx.get(instrument, 0) + 1, to_idx + 1):
-                scrip, exchange = get_scrip_and_exchange_from_key(instrument)
                 self.idx[instrument] = idx
-                self.logger.debug(f"INC TIME {self.current_time} >>>> {self.data[instrument].iloc[idx].name} FOR {instrument} [idx={idx}]")
-                self.current_time = self.data[instrument].iloc[idx].name
+                bar_time = index[idx]
+                self.logger.debug(f"INC TIME {self.current_time} >>>> {bar_time} FOR {instrument} [idx={idx}]")
+                self.current_time = bar_time
+                candle = self.get_candle(instrument, idx)
                 self.logger.debug(f"{self.current_time} >>>> "
-                                  f" O {self.data[instrument].iloc[idx]['open']}"
-                                  f" H {self.data[instrument].iloc[idx]['high']}"
-                                  f" L {self.data[instrument].iloc[idx]['low']}"
-                                  f" C {self.data[instrument].iloc[idx]['close']}")
+                                  f" O {candle['open']}"
+                                  f" H {candle['high']}"
+                                  f" L {candle['low']}"
+                                  f" C {candle['close']}")
 
 
                 self.__process_orders(scrip=scrip,
                                       exchange=exchange)
 
-                self.__update_positions()
+                if (self.mark_to_market == "bar"
+                    or (instrument in self.checkpoints and self.checkpoints[instrument][idx])):
+                    self.__update_positions()
+
+    def mark_positions_to_market(self):
+        """Revalue every position at the last price and store it in the tradebook"""
+        self.__update_positions()
+
+    def __get_curves(self,
+                     values_at,
+                     scrip: Optional[str] = None,
+                     exchange: Optional[str] = None) -> pd.Series:
+        """values_at(key, timestamps, closes) over every bar walked so far, summed over instruments"""
+        curves = []
+        for key in self.data.keys():
+            if scrip is not None and exchange is not None and key != get_key_from_scrip_and_exchange(scrip, exchange):
+                continue
+            start, end = self.start_idx.get(key, 0), self.idx.get(key, -1) + 1
+            timestamps = self.timestamps[key][start:end]
+            values = values_at(key, timestamps, self.candles[key]["close"][start:end])
+            curves.append(pd.Series(values, index=pd.to_datetime(timestamps)))
+        if len(curves) == 0:
+            return pd.Series(dtype=np.float64)
+        if len(curves) == 1:
+            return curves[0]
+        return pd.concat(curves, axis=1).ffill().fillna(0.).sum(axis=1)
+
+    def get_equity_curve(self,
+                         scrip: Optional[str] = None,
+                         exchange: Optional[str] = None) -> pd.Series:
+        """P&L over every bar walked so far, summed over instruments (or of one instrument)"""
+        return self.__get_curves(self.ledger.mark_to_market, scrip=scrip, exchange=exchange)
+
+    def get_exposure_curve(self,
+                           scrip: Optional[str] = None,
+                           exchange: Optional[str] = None) -> pd.Series:
+        """Absolute net quantity held over every bar walked so far, summed over instruments"""
+        return self.__get_curves(lambda key, timestamps, closes: np.abs(self.ledger.get_positions_at(key, timestamps)[0]),
+                                 scrip=scrip, exchange=exchange)
+
+    def get_candle_ranges(self) -> dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """(timestamps in ns, highs, lows) of the bars walked so far, per instrument"""
+        ranges = {}
+        for key in self.data.keys():
+            start, end = self.start_idx.get(key, 0), self.idx.get(key, -1) + 1
+            ranges[key] = (self.timestamps[key][start:end],
+                           self.candles[key]["high"][start:end],
+                           self.candles[key]["low"][start:end])
+        return ranges
+
+    def get_drawdown(self, **kwargs) -> pd.Series:
+        return get_drawdown(self.get_equity_curve(**kwargs))
+
+    def get_periodic_pnl(self, freq: str = "1D", **kwargs) -> pd.Series:
+        return get_periodic_pnl(self.get_equity_curve(**kwargs), freq)
 
 
     def get_orders_as_table(self):
+        self.order_stats["pending"] = len(self.order_book.get_pending_orders())
         status = [[self.current_time,
                    self.order_stats["pending"],
                    self.order_stats["completed"],
@@ -187,7 +381,7 @@ class PaperBroker(Broker):
             position.average_price =  (abs(money_spent) / abs(net_quantity)) if abs(net_quantity) > 0 else 0
             key = get_key_from_scrip_and_exchange(position.scrip, position.exchange)
             #print(cash_flow, position.quantity_and_price_history)
-            position.pnl = cash_flow + (net_quantity * self.data[key].iloc[self.idx[key]]["close"]) - position.charges
+            position.pnl = cash_flow + (net_quantity * self.get_last_price(key)) - position.charges
 
             storage = self.get_tradebook_storage()
             storage.store_position_state(strategy=self.strategy,
@@ -210,13 +404,15 @@ class PaperBroker(Broker):
         position.stats["money_spent"] = money_spent
         position.stats["cash_flow"] = cash_flow
         position.stats["net_quantity"] = net_quantity
+        key = get_key_from_scrip_and_exchange(position.scrip, position.exchange)
+        self.ledger.record_fill(key, self.timestamps[key][self.idx[key]], quantity, price, charges)
 
         position.average_price =  (abs(money_spent) / abs(net_quantity)) if abs(net_quantity) > 0 else 0
         
         key = get_key_from_scrip_and_exchange(position.scrip, position.exchange)
         #print(cash_flow, position.quantity_and_price_history)
         position.charges += charges
-        position.pnl = cash_flow + (net_quantity * self.data[key].iloc[self.idx[key]]["close"]) - position.charges
+        position.pnl = cash_flow + (net_quantity * self.get_last_price(key)) - position.charges
 
     def get_positions_as_table(self):
         # self.logger.debug(f"{self.current_time} entered __refresh_positions")
@@ -230,7 +426,7 @@ class PaperBroker(Broker):
                                         position.exchange,
                                         position.stats["net_quantity"],
                                         position.average_price,
-                                        self.data[key].iloc[self.idx[key]]["close"],
+                                        self.get_last_price(key),
                                         position.pnl,
                                         position.charges])
             self.logger.info(f"{self.current_time} "
@@ -244,6 +440,7 @@ class PaperBroker(Broker):
                        last_price: float,
                        price: Optional[float] = None):
         order.state = OrderState.COMPLETED
+        self.order_book.update_state(order)
         self.order_stats["completed"] += 1
         if price is None:
             price = order.limit_price
@@ -253,23 +450,28 @@ class PaperBroker(Broker):
             self.pnlcnt = 0
         if order.parent_order_id is not None:
             self.pnlcnt += 1
-            for other_order in self.get_orders():
-                if (other_order.order_id == order.parent_order_id
-                    and "entry" in other_order.tags):
-                    other_charges, this_charges = 0., 0.
-                    if self.commission_func is not None:
-                        other_charges = self.commission_func(other_order)
-                        this_charges = self.commission_func(order)
-                    self.trade_pnl[other_order.order_id] = (order.price - other_order.price if other_order.transaction_type == TransactionType.BUY else other_order.price - order.price) * order.quantity
-                    self.trade_pnl[other_order.order_id] -= other_charges
-                    self.trade_pnl[other_order.order_id] -= this_charges
-                    self.trade_timestamps[other_order.order_id] = [other_order.timestamp, order.timestamp]
-                    self.trade_transaction_types[other_order.order_id] = other_order.transaction_type
+            other_order = self.order_book.get(order.parent_order_id)
+            if other_order is not None and "entry" in other_order.tags:
+                other_charges, this_charges = 0., 0.
+                if self.commission_func is not None:
+                    other_charges = self.commission_func(other_order)
+                    this_charges = self.commission_func(order)
+                pnl = (order.price - other_order.price if other_order.transaction_type == TransactionType.BUY else other_order.price - order.price) * order.quantity
+                pnl -= other_charges
+                pnl -= this_charges
+                self.ledger.record_trade(other_order.order_id,
+                                         other_order.timestamp,
+                                         order.timestamp,
+                                         other_order.transaction_type,
+                                         pnl,
+                                         key=get_key_from_scrip_and_exchange(other_order.scrip, other_order.exchange),
+                                         entry_price=other_order.price,
+                                         exit_price=order.price,
+                                         quantity=order.quantity)
         elif "squareoff_order" in order.tags:
             latest_order = None
-            for other_order in self.get_orders():
-                if ("entry" in other_order.tags
-                    and other_order.state == OrderState.COMPLETED):
+            for other_order in self.order_book.get_orders(state=OrderState.COMPLETED):
+                if "entry" in other_order.tags:
                     if latest_order is not None and other_order.timestamp > latest_order.timestamp:
                         latest_order = other_order
                     elif latest_order is None:
@@ -280,14 +482,21 @@ class PaperBroker(Broker):
                 if self.commission_func is not None:
                     other_charges = self.commission_func(other_order)
                     this_charges = self.commission_func(order)
-                self.trade_pnl[other_order.order_id] = (order.price - other_order.price if other_order.transaction_type == TransactionType.BUY else other_order.price - order.price) * order.quantity
-                self.trade_pnl[other_order.order_id] -= other_charges
-                self.trade_pnl[other_order.order_id] -= this_charges
-                self.trade_timestamps[other_order.order_id] = [other_order.timestamp, order.timestamp]
-                self.trade_transaction_types[other_order.order_id] = other_order.transaction_type
-
-
-        self.logger.info(f"Order {order.transaction_type.value} {order.order_id[:4]}/{order.scrip}/"
+                pnl = (order.price - other_order.price if other_order.transaction_type == TransactionType.BUY else other_order.price - order.price) * order.quantity
+                pnl -= other_charges
+                pnl -= this_charges
+                self.ledger.record_trade(other_order.order_id,
+                                         other_order.timestamp,
+                                         order.timestamp,
+                                         other_order.transaction_type,
+                                         pnl,
+                                         key=get_key_from_scrip_and_exchange(other_order.scrip, other_order.exchange),
+                                         entry_price=other_order.price,
+                                         exit_price=order.price,
+                                         quantity=order.quantity)
+
+
+        self.logger.info(f"Order {order.transaction_type.value} {order.order_id}/{order.scrip}/"
                          f"{order.exchange}/{order.order_type.value} [tags={order.tags}] @ {order.price} x {order.quantity} executed.")
         """
         self.events.append([self.current_time,
@@ -334,20 +543,16 @@ class PaperBroker(Broker):
             position.quantity += order.quantity
         self.__update_position_stats(position, price, order.quantity, charges, order.transaction_type)
 
-    def __process_orders(self,
-                         scrip=None,
-                         exchange=None,
-                         inside_a_recursion=False):
-        # self.logger.debug(f"{self.current_time} entered __process_orders scrip={scrip} exchange={exchange}")
-        for order in self.get_orders():
-            key = get_key_from_scrip_and_exchange(order.scrip, order.exchange)
-            order_scrip, order_exchange = get_scrip_and_exchange_from_key(key)
-            if scrip is not None and exchange is not None:
-                if order_scrip != scrip or order_exchange != exchange:
+    def __match_orders_in_placement_order(self, scrip: str, exchange: str, candle: dict):
+        # Orders placed while matching (GTT legs released by a cancellation)
+        # are matched against the same candle, as they come after the rest.
+        visited = set()
+        orders = self.matching_engine.pop_crossed_orders(scrip, exchange, candle["low"], candle["high"])
+        while len(orders) > 0:
+            for order in orders:
+                visited.add(order.order_id)
+                if order.state != OrderState.PENDING:
                     continue
-            candle = self.data[key].iloc[self.idx[key]]
-            self.order_stats["pending"] = 0
-            if order.state == OrderState.PENDING:
                 change = False
                 if order.order_type in [OrderType.SL_LIMIT, OrderType.SL_MARKET]:
                     if order.transaction_type == TransactionType.BUY:
@@ -360,7 +565,7 @@ class PaperBroker(Broker):
                         # print(candle["low"], order.trigger_price, order.limit_price)
                         if candle["low"] <= order.trigger_price:
                             if order.order_type == OrderType.SL_LIMIT:
-                                self.logger.info(f"{order.order_id[:4]} Became LIMIT FROM SL_LIMIT")
+                                self.logger.info(f"{order.order_id} Became LIMIT FROM SL_LIMIT")
                                 change = True
                                 order.order_type = OrderType.LIMIT
                             else:
@@ -391,7 +596,58 @@ class PaperBroker(Broker):
                     self.cancel_invalid_group_orders()
                     self.update_gtt_orders_for(order)
                 else:
-                    self.order_stats["pending"] += 1
+                    # Triggered into a limit order the candle did not reach
+                    self.matching_engine.add(order)
+            orders = []
+            for order in self.matching_engine.pop_crossed_orders(scrip, exchange, candle["low"], candle["high"]):
+                if order.order_id in visited:
+                    self.matching_engine.add(order)
+                else:
+                    orders.append(order)
+
+    def __match_orders_along_path(self, scrip: str, exchange: str, candle: dict):
+        points = self.intrabar_path(candle["open"], candle["high"], candle["low"], candle["close"])
+        price = points[0]
+        for end in points:
+            while True:
+                match = self.matching_engine.pop_next_order(scrip, exchange, price, end)
+                if match is None:
+                    break
+                order, fill_price = match
+                if order.order_type == OrderType.SL_LIMIT:
+                    order.order_type = OrderType.LIMIT
+                elif order.order_type == OrderType.SL_MARKET:
+                    order.order_type = OrderType.MARKET
+                if order.order_type == OrderType.LIMIT:
+                    if order.transaction_type == TransactionType.BUY:
+                        marketable = fill_price <= order.limit_price
+                    else:
+                        marketable = fill_price >= order.limit_price
+                    if not marketable:
+                        # Stop triggered by a gap past its limit, rests as a limit order
+                        self.matching_engine.add(order)
+                        continue
+                self.__add_position(order, last_price=candle["close"], price=fill_price)
+                self.cancel_invalid_child_orders()
+                self.cancel_invalid_group_orders()
+                self.update_gtt_orders_for(order)
+            price = end
+
+    def __process_orders(self,
+                         scrip=None,
+                         exchange=None,
+                         inside_a_recursion=False):
+        # self.logger.debug(f"{self.current_time} entered __process_orders scrip={scrip} exchange={exchange}")
+        if scrip is not None and exchange is not None:
+            instruments = [(scrip, exchange)]
+        else:
+            instruments = [get_scrip_and_exchange_from_key(key) for key in self.data.keys()]
+        for order_scrip, order_exchange in instruments:
+            candle = self.get_candle(get_key_from_scrip_and_exchange(order_scrip, order_exchange))
+            if self.intrabar_path is None:
+                self.__match_orders_in_placement_order(order_scrip, order_exchange, candle)
+            else:
+                self.__match_orders_along_path(order_scrip, order_exchange, candle)
 
         gtt_state_changed = self.gtt_order_callback()
 
@@ -413,25 +669,26 @@ class PaperBroker(Broker):
 
     # Order streaming / management
     def get_orders(self, refresh_cache: bool = True) -> list[Order]:
-        return self.orders
+        return self.order_book.orders
+
+    def get_order_book(self) -> OrderBook:
+        return self.order_book
 
     def update_order(self, order: Order,
                      local_update: bool = False,
                      refresh_cache: bool = True) -> Order:
-        found = False
-        for ii, other_order in enumerate(self.orders):
-            if other_order.order_id == order.order_id:
-                self.orders[ii] = copy.deepcopy(order)
-                found = True
-        if not found:
-            raise KeyError(f"Order {order} not found.")
+        self.matching_engine.add(self.order_book.replace(order.copy()))
+
+    def new_order_id(self) -> str:
+        # A counter instead of UUIDs, prefixed by the run as tradebooks key orders by id across runs
+        return f"{self.run_id[:8]}-{next(self.order_id_counter)}"
 
     def place_order(self,
                     order: Order,
                     refresh_cache: bool = True) -> Order:
         self.logger.info(f"PaperTrader placed order {order}")
         order.timestamp = self.current_datetime()
-        self.orders.append(order)
+        self.matching_engine.add(self.order_book.add(order))
         storage = self.get_tradebook_storage()
         storage.store_order_execution(self.strategy,
                                       self.run_name,
@@ -443,10 +700,12 @@ class PaperBroker(Broker):
 
     def cancel_order(self, order: Order,
                      refresh_cache: bool = True) -> Order:
-        for other_order in self.orders:
-            if other_order.order_id == order.order_id:
-                other_order.state = OrderState.CANCELLED
-                self.order_stats["cancelled"] += 1
+        other_order = self.order_book.get(order.order_id)
+        if other_order is not None:
+            other_order.state = OrderState.CANCELLED
+            self.order_book.update_state(other_order)
+            self.order_stats["cancelled"] += 1
+            self.gtt_registry.mark_ready(other_order.order_id)
         self.gtt_order_callback()
 
     def get_positions(self,
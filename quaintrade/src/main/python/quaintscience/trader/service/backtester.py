@@ -1,13 +1,77 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union, Optional
 import datetime
+import copy
+import os
+
 from configargparse import ArgParser
-from typing import Union
+from tabulate import tabulate
 
-from ..core.util import get_datetime
+from ..core.util import get_datetime, new_id
+from ..core.analytics import get_trade_stats
+from ..core.indicator import IndicatorCache
+from ..core.shared_candles import SharedCandleStore
 from .common import BotService, DataProviderService
 from ..integration.paper import PaperBroker
 from ..core.util import get_datetime
 
 
+def get_indicator_cache(data_path: str,
+                        indicator_cache_size_mb: float) -> Optional[IndicatorCache]:
+    """Indicator cache persisted under data_path, None if disabled (size 0)"""
+    if indicator_cache_size_mb is None or indicator_cache_size_mb <= 0:
+        return None
+    return IndicatorCache(cache_path=os.path.join(data_path, "indicator-cache"),
+                          max_disk_bytes=int(indicator_cache_size_mb * 1024 * 1024))
+
+
+def get_shared_candles_path(data_path: str,
+                            shared_candles: Union[bool, str, None]) -> Optional[str]:
+    """Folder of the shared candles of a run, None if disabled
+
+    True starts a new folder under data_path; workers are given its path
+    so they attach to the candles of the run that started them.
+    """
+    if shared_candles is None or shared_candles is False:
+        return None
+    if shared_candles is True:
+        return os.path.join(data_path, "shared-candles", new_id())
+    return shared_candles
+
+
+def run_backtest_worker(service_kwargs: dict,
+                        instrument: dict,
+                        thread_id: str) -> Optional[dict]:
+    """Backtest one instrument in a worker process
+
+    The worker builds its own service, and so its own PaperBroker and its
+    own tradebook file (keyed by thread_id), so nothing is shared with
+    the parent or with the other workers.
+    """
+    service_kwargs = copy.deepcopy(service_kwargs)
+    service_kwargs["instruments"] = [instrument]
+    service_kwargs["broker_thread_id"] = thread_id
+    service_kwargs["parallel_workers"] = 0
+    service_kwargs["plot_results"] = False
+    service = BackTesterService(**service_kwargs)
+    return service.backtest_instrument(instrument)
+
+
+def merge_pnl_data(results: list[dict]) -> list[list]:
+    """P&L table rows of several backtests (see Bot.get_backtest_pnl_table) in the order the trades closed"""
+    return sorted([row for result in results for row in result["pnl_data"]], key=lambda row: row[2])
+
+
+def merge_backtest_stats(results: list[dict]) -> dict:
+    """Trade stats of several backtests taken as one portfolio
+
+    The trades of all results are replayed in the order they closed, so
+    max_drawdown, lowest_point and the streaks are those of the combined
+    P&L rather than of the worst instrument.
+    """
+    return get_trade_stats([row[4] for row in merge_pnl_data(results)])
+
+
 class BackTesterService(BotService):
 
     default_config_file = ".backtesting.trader.env"
@@ -23,7 +87,40 @@ class BackTesterService(BotService):
                  window_size: int = 5,
                  live_trading_mode: bool = False,
                  clear_tradebook_for_scrip_and_exchange: bool = False,
+                 backtest_type: str = "standard",
+                 parallel_workers: int = 0,
+                 indicator_cache_size_mb: float = 0,
+                 intrabar_fill_order: str = "nearest_extreme_first",
+                 fill_interval: Optional[str] = None,
+                 fill_storage_type: str = "perm",
+                 tradebook_position_rows: str = "all",
+                 mark_to_market: str = "bar",
+                 shared_candles: Union[bool, str] = False,
                  **kwargs):
+        # Only the run that started the folder removes it
+        self.owns_shared_candles = shared_candles is True
+        shared_candles_path = get_shared_candles_path(kwargs["data_path"], shared_candles)
+        self.shared_candles = (SharedCandleStore(path=shared_candles_path)
+                               if shared_candles_path is not None else None)
+        self.service_kwargs = copy.deepcopy(kwargs)
+        self.service_kwargs.update({"from_date": from_date,
+                                    "to_date": to_date,
+                                    "context_from_date": context_from_date,
+                                    "interval": interval,
+                                    "refresh_orders_immediately_on_gtt_state_change": refresh_orders_immediately_on_gtt_state_change,
+                                    "plot_results": plot_results,
+                                    "window_size": window_size,
+                                    "live_trading_mode": live_trading_mode,
+                                    "clear_tradebook_for_scrip_and_exchange": clear_tradebook_for_scrip_and_exchange,
+                                    "backtest_type": backtest_type,
+                                    "indicator_cache_size_mb": indicator_cache_size_mb,
+                                    "intrabar_fill_order": intrabar_fill_order,
+                                    "fill_interval": fill_interval,
+                                    "fill_storage_type": fill_storage_type,
+                                    "tradebook_position_rows": tradebook_position_rows,
+                                    "mark_to_market": mark_to_market,
+                                    "shared_candles": shared_candles_path if shared_candles_path is not None else False})
+        self.parallel_workers = int(parallel_workers) if parallel_workers is not None else 0
         self.from_date = get_datetime(from_date)
         self.to_date = get_datetime(to_date)
         self.context_from_date = get_datetime(context_from_date)
@@ -42,7 +139,7 @@ class BackTesterService(BotService):
         DataProviderService.__init__(self, *args, **kwargs)
         kwargs["BrokerClass"] = PaperBroker
         kwargs["broker_login"] = False
-        kwargs["broker_init"] = True
+        kwargs["broker_init"] = self.is_broker_init_needed()
         kwargs["broker_skip_order_streamer"] = True
         broker_kwargs_overrides = {"instruments": self.instruments,
                                    "data_provider": self.data_provider,
@@ -50,32 +147,132 @@ class BackTesterService(BotService):
                                    "historic_context_to": self.to_date,
                                    "interval": self.interval,
                                    "refresh_orders_immediately_on_gtt_state_change": refresh_orders_immediately_on_gtt_state_change,
-                                   "refresh_data_on_every_time_change": False}
+                                   "refresh_data_on_every_time_change": False,
+                                   "intrabar_fill_order": intrabar_fill_order,
+                                   "fill_interval": fill_interval,
+                                   "fill_storage_type": fill_storage_type,
+                                   "tradebook_storage_kwargs": {"position_rows": tradebook_position_rows},
+                                   "mark_to_market": mark_to_market,
+                                   "shared_candles": self.shared_candles}
         if "broker_custom_kwargs" in kwargs and isinstance(kwargs["broker_custom_kwargs"], dict):
             kwargs["broker_custom_kwargs"].update(broker_kwargs_overrides)
         else:
             kwargs["broker_custom_kwargs"] = broker_kwargs_overrides
         print(kwargs["broker_custom_kwargs"])
+        if "bot_custom_kwargs" not in kwargs or not isinstance(kwargs["bot_custom_kwargs"], dict):
+            kwargs["bot_custom_kwargs"] = {}
+        kwargs["bot_custom_kwargs"].setdefault("backtest_type", backtest_type)
+        indicator_cache = get_indicator_cache(kwargs["data_path"], indicator_cache_size_mb)
+        if indicator_cache is not None:
+            kwargs["bot_custom_kwargs"].setdefault("indicator_cache", indicator_cache)
+        kwargs["bot_custom_kwargs"]["shared_candles"] = self.shared_candles
         BotService.__init__(self,
                             *args,
                             **kwargs)
 
+    def is_broker_init_needed(self) -> bool:
+        # In parallel mode every worker initializes its own broker, live mode runs in this process
+        return self.live_trading_mode or self.parallel_workers <= 1
+
+    def backtest_instrument(self, instrument: dict) -> Optional[dict]:
+        return self.bot.backtest(scrip=instrument["scrip"],
+                                 exchange=instrument["exchange"],
+                                 from_date=self.from_date,
+                                 to_date=self.to_date,
+                                 context_from_date=self.context_from_date,
+                                 interval=self.interval,
+                                 window_size=self.window_size,
+                                 plot_results=self.plot_results,
+                                 clear_tradebook_for_scrip_and_exchange=self.clear_tradebook_for_scrip_and_exchange)
+
+    def backtest_in_parallel(self) -> tuple[list[dict], list[dict]]:
+        """Results of the instruments backtested, and the instruments whose backtest failed"""
+        base_thread_id = self.service_kwargs.get("broker_thread_id", "1")
+        results, failed = [], []
+        with ProcessPoolExecutor(max_workers=self.parallel_workers) as executor:
+            futures = []
+            for ii, instrument in enumerate(self.instruments):
+                futures.append(executor.submit(run_backtest_worker,
+                                               self.service_kwargs,
+                                               instrument,
+                                               f"{base_thread_id}-{ii}"))
+            for instrument, future in zip(self.instruments, futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.logger.error(f"Backtest failed for {instrument['scrip']}:{instrument['exchange']}: {e}")
+                    failed.append(instrument)
+                    continue
+                if result is not None:
+                    results.append(result)
+        return results, failed
+
+    def write_merged_report(self, results: list[dict], failed: Optional[list[dict]] = None):
+        """Merge the per-instrument P&L tables of a parallel run into one report
+
+        Instruments whose backtest failed are listed in the summary, the
+        TOTAL row leaves them out.
+        """
+        if failed is None:
+            failed = []
+        summary = []
+        trades = []
+        for result in results:
+            stats = result["stats"]
+            summary.append([result["scrip"],
+                            result["exchange"],
+                            stats["trades"],
+                            stats["accuracy"],
+                            stats["max_drawdown"],
+                            stats["largest_loss"],
+                            stats["final_pnl"]])
+            for row in result["pnl_data"]:
+                trades.append([result["scrip"], result["exchange"]] + row)
+        for instrument in failed:
+            summary.append([instrument["scrip"], instrument["exchange"], "FAILED", "", "", "", ""])
+        trades.sort(key=lambda row: row[3])
+        total = merge_backtest_stats(results)
+        summary.append(["TOTAL" if len(failed) == 0 else f"TOTAL ({len(failed)} failed excluded)", "",
+                        total["trades"],
+                        total["accuracy"],
+                        total["max_drawdown"],
+                        total["largest_loss"],
+                        total["final_pnl"]])
+        summary_headers = ["scrip", "exchange", "trades", "accuracy", "max_drawdown", "largest_loss", "pnl"]
+        trade_headers = ["scrip", "exchange", "order_id", "entry_time", "exit_time", "transaction_type", "pnl"]
+        folder = self.bot.backtest_results_folder
+        os.makedirs(folder, exist_ok=True)
+        fname = (f"backtest-merged-{self.strategy.__class__.__name__}-{self.interval}-"
+                 f"{self.from_date.strftime('%Y%m%d')}-{self.to_date.strftime('%Y%m%d')}.txt")
+        with open(os.path.join(folder, fname), 'w') as fid:
+            print(tabulate(summary, headers=summary_headers), file=fid)
+            print("", file=fid)
+            print(tabulate(trades, headers=trade_headers), file=fid)
+        print(tabulate(summary, headers=summary_headers))
+        self.logger.info(f"Merged report for {len(results)} instruments written to {os.path.join(folder, fname)}")
+        if len(failed) > 0:
+            self.logger.error("Backtest failed for "
+                              + ", ".join(f"{instrument['scrip']}:{instrument['exchange']}" for instrument in failed)
+                              + ", the merged report leaves them out")
+
+    def release_shared_candles(self):
+        if self.shared_candles is not None and self.owns_shared_candles:
+            self.shared_candles.clear()
+
     def start(self):
         self.logger.info("Running backtest...")
-        if self.live_trading_mode:
-            self.bot.live(self.instruments,
-                          self.interval)
-        else:
-            for instrument in self.instruments:
-                self.bot.backtest(scrip=instrument["scrip"],
-                                  exchange=instrument["exchange"],
-                                  from_date=self.from_date,
-                                  to_date=self.to_date,
-                                  context_from_date=self.context_from_date,
-                                  interval=self.interval,
-                                  window_size=self.window_size,
-                                  plot_results=self.plot_results,
-                                  clear_tradebook_for_scrip_and_exchange=self.clear_tradebook_for_scrip_and_exchange)
+        try:
+            if self.live_trading_mode:
+                self.bot.live(self.instruments,
+                              self.interval)
+            elif self.parallel_workers > 1:
+                results, failed = self.backtest_in_parallel()
+                self.write_merged_report(results, failed)
+            else:
+                for instrument in self.instruments:
+                    self.backtest_instrument(instrument)
+        finally:
+            self.release_shared_candles()
 
     @classmethod
     def enrich_arg_parser(cls, p: ArgParser):
@@ -91,3 +288,12 @@ class BackTesterService(BotService):
         p.add('--window_size', type=int, help="Window size to be passed into backtesting function", env_var="WINDOW_SIZE")
         p.add('--live_trading_mode', action="store_true", help="Run bot in live mode with paper broker", env_var="LIVE_TRADING_MODE")
         p.add('--clear_tradebook_for_scrip_and_exchange', action="store_true", help="Clear tradebook for scrip and exchange", env_var="CLEAR_TRADEBOOK_FOR_SCRIP_AND_EXCHANGE")
+        p.add('--backtest_type', help="Backtest engine (standard/fast/live_simulation)", env_var="BACKTEST_TYPE", default="standard")
+        p.add('--parallel_workers', type=int, help="Backtest instruments in parallel over these many worker processes", env_var="PARALLEL_WORKERS", default=0)
+        p.add('--intrabar_fill_order', help="Order in which the paper broker assumes candle prices were visited when filling orders (nearest_extreme_first/high_first/low_first/candle_direction/placement or a function name)", env_var="INTRABAR_FILL_ORDER", default="nearest_extreme_first")
+        p.add('--fill_interval', help="Fill paper orders against candles of this interval (e.g. 1min) while the strategy runs on --interval", env_var="FILL_INTERVAL")
+        p.add('--fill_storage_type', help="Candles to fill paper orders against with --fill_interval (perm/live/blend)", env_var="FILL_STORAGE_TYPE", default="perm")
+        p.add('--tradebook_position_rows', help="Position rows written to the tradebook (all/on_change/none); on_change only stores pnl or charges changes", env_var="TRADEBOOK_POSITION_ROWS", default="all")
+        p.add('--mark_to_market', help="When the paper broker revalues positions: every bar, at the end of every period of a frequency (e.g. 1D) or only at the end", env_var="MARK_TO_MARKET", default="bar")
+        p.add('--shared_candles', action="store_true", help="Materialize candles once into memory-mapped files that parallel workers attach to read-only", env_var="SHARED_CANDLES")
+        p.add('--indicator_cache_size_mb', type=float, help="Cache indicator outputs under data_path up to this size across runs (0 disables)", env_var="INDICATOR_CACHE_SIZE_MB", default=0)
@@ -76,7 +76,7 @@ class DataProviderService(Service):
                  data_provider_login: bool = False,
                  data_provider_init: bool = False,
                  instruments: Union[str, list]=None,
-                 StorageClass: Optional[Union[str, Type[OHLCStorageMixin]]] == None,
+                 StorageClass: Optional[Union[str, Type[OHLCStorageMixin]]] = None,
                  data_provider_auth_credentials: Optional[dict] = None,
                  data_provider_auth_cache_filepath: Optional[str] = None,
                  data_provider_reset_auth_cache: Optional[bool] = False,
@@ -89,7 +89,7 @@ class DataProviderService(Service):
             DataProviderClass = dynamically_load_class(DataProviderClass)
         provider_kwargs = {"data_path": data_path}
         if StorageClass is not None:
-            provider_kwargs["storage_class"] = StorageClass
+            provider_kwargs["StorageClass"] = StorageClass
 
         if issubclass(DataProviderClass, AuthenticatorMixin):
             provider_kwargs["auth_credentials"] = data_provider_auth_credentials
@@ -0,0 +1,402 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union, Optional
+import itertools
+import datetime
+import copy
+import os
+
+import numpy as np
+import yaml
+from configargparse import ArgParser
+from scipy.stats import norm
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import Matern, WhiteKernel
+from tabulate import tabulate
+
+from ..core.bot import Bot
+from ..core.indicator import IndicatorCache
+from ..core.reflection import dynamically_load_class
+from ..core.shared_candles import SharedCandleStore
+from ..core.util import get_key_from_scrip_and_exchange
+from ..integration.common import get_instrument_for_provider
+from ..integration.paper import PaperBroker
+from .common import DataProviderService
+from .backtester import BackTesterService, merge_backtest_stats, merge_pnl_data, get_indicator_cache
+
+
+# Per-process state of optimizer workers, set up once by init_optimizer_worker
+# and reused by every trial the worker runs.
+optimizer_worker_state = {}
+
+
+def init_optimizer_worker(service_kwargs: dict,
+                          shared_data: dict):
+    """Set up a worker process
+
+    shared_data holds the candles loaded once by the parent. With the default
+    fork start method workers inherit it without copying; it must be treated
+    as read-only. With shared candles it only holds the ranges the parent
+    materialized, and workers attach to those files instead.
+    """
+    optimizer_worker_state["service_kwargs"] = service_kwargs
+    optimizer_worker_state["shared_data"] = shared_data
+    shared_candles = service_kwargs.get("shared_candles")
+    optimizer_worker_state["shared_candles"] = (SharedCandleStore(path=shared_candles)
+                                                if isinstance(shared_candles, str) else None)
+    optimizer_worker_state["data_provider"] = DataProviderService(**service_kwargs).data_provider
+    indicator_cache = get_indicator_cache(service_kwargs["data_path"],
+                                          service_kwargs.get("indicator_cache_size_mb"))
+    optimizer_worker_state["indicator_cache"] = indicator_cache if indicator_cache is not None else IndicatorCache()
+
+
+def run_optimizer_trial(trial_id: str,
+                        params: dict,
+                        from_date: datetime.datetime,
+                        to_date: datetime.datetime,
+                        context_from_date: datetime.datetime) -> dict:
+    """Backtest all instruments with the strategy kwargs overridden by params"""
+    service_kwargs = optimizer_worker_state["service_kwargs"]
+    shared_data = optimizer_worker_state["shared_data"]
+    data_provider = optimizer_worker_state["data_provider"]
+
+    StrategyClass = service_kwargs["StrategyClass"]
+    if isinstance(StrategyClass, str):
+        StrategyClass = dynamically_load_class(StrategyClass)
+    strategy_kwargs = copy.deepcopy(service_kwargs.get("strategy_kwargs") or {})
+    strategy_kwargs.update(params)
+    bot_custom_kwargs = copy.deepcopy(service_kwargs.get("bot_custom_kwargs") or {})
+    bot_custom_kwargs.setdefault("backtest_type", service_kwargs.get("backtest_type", "standard"))
+    results_folder = os.path.join(bot_custom_kwargs.get("backtest_results_folder", "backtest-results"),
+                                  "optimizer", f"trial-{trial_id}")
+    bot_custom_kwargs["backtest_results_folder"] = results_folder
+
+    results = []
+    for instrument in shared_data["instruments"]:
+        key = get_key_from_scrip_and_exchange(instrument["scrip"], instrument["exchange"])
+        broker_kwargs = copy.deepcopy(service_kwargs.get("broker_custom_kwargs") or {})
+        broker_kwargs.update({"audit_records_path": service_kwargs["broker_audit_records_path"],
+                              "thread_id": f"optimizer-{os.getpid()}",
+                              "instruments": [instrument],
+                              "data_provider": data_provider,
+                              "historic_context_from": from_date,
+                              "historic_context_to": to_date,
+                              "interval": service_kwargs["interval"],
+                              "refresh_orders_immediately_on_gtt_state_change":
+                                  service_kwargs.get("refresh_orders_immediately_on_gtt_state_change", False),
+                              "refresh_data_on_every_time_change": False,
+                              "intrabar_fill_order": service_kwargs.get("intrabar_fill_order", "nearest_extreme_first"),
+                              "fill_interval": service_kwargs.get("fill_interval"),
+                              "fill_storage_type": service_kwargs.get("fill_storage_type", "perm"),
+                              "tradebook_storage_kwargs":
+                                  {"position_rows": service_kwargs.get("tradebook_position_rows", "all")},
+                              "mark_to_market": service_kwargs.get("mark_to_market", "bar"),
+                              "shared_candles": optimizer_worker_state["shared_candles"]})
+        broker = PaperBroker(**broker_kwargs)
+        broker_data = shared_data["broker"].get(key)
+        if broker_data is None:
+            broker_data = broker.load_instrument_data(instrument,
+                                                      from_date=shared_data["from_date"],
+                                                      to_date=shared_data["to_date"])
+        broker.set_instrument_data(key, broker_data)
+
+        bot_kwargs = {"broker": broker,
+                      "strategy": StrategyClass(**strategy_kwargs),
+                      "data_provider": data_provider,
+                      "online_mode": False,
+                      "backtesting_print_tables": False,
+                      "indicator_cache": optimizer_worker_state["indicator_cache"],
+                      "shared_candles": optimizer_worker_state["shared_candles"]}
+        bot_kwargs.update(bot_custom_kwargs)
+        bot = Bot(**bot_kwargs)
+        data_provider_instrument = get_instrument_for_provider(instrument, data_provider.__class__)
+        bot_data = shared_data["bot"].get(key)
+        if bot_data is None:
+            bot_data = bot.get_historic_data(scrip=data_provider_instrument["scrip"],
+                                             exchange=data_provider_instrument["exchange"],
+                                             from_date=shared_data["context_from_date"],
+                                             to_date=shared_data["to_date"])
+        bot.set_historic_data(data_provider_instrument["scrip"],
+                              data_provider_instrument["exchange"],
+                              bot_data)
+        result = bot.backtest(scrip=instrument["scrip"],
+                              exchange=instrument["exchange"],
+                              from_date=from_date,
+                              to_date=to_date,
+                              context_from_date=context_from_date,
+                              interval=service_kwargs["interval"],
+                              window_size=service_kwargs["window_size"],
+                              plot_results=False)
+        if result is not None:
+            results.append(result)
+    return {"trial": trial_id,
+            "params": params,
+            "stats": merge_backtest_stats(results),
+            "pnl_data": merge_pnl_data(results)}
+
+
+def get_grid_values(spec) -> list:
+    if isinstance(spec, list):
+        return spec
+    if isinstance(spec, dict):
+        if "step" not in spec:
+            raise ValueError(f"Cannot grid search over {spec} without a step")
+        values = np.arange(spec["low"], spec["high"] + spec["step"] / 2, spec["step"]).tolist()
+        if all(isinstance(spec[k], int) for k in ["low", "high", "step"]):
+            values = [int(value) for value in values]
+        return values
+    return [spec]
+
+
+def sample_value(spec, rng: np.random.Generator):
+    if isinstance(spec, list):
+        return spec[rng.integers(len(spec))]
+    if isinstance(spec, dict):
+        if "step" in spec:
+            return get_grid_values(spec)[rng.integers(len(get_grid_values(spec)))]
+        if isinstance(spec["low"], int) and isinstance(spec["high"], int):
+            return int(rng.integers(spec["low"], spec["high"] + 1))
+        return float(rng.uniform(spec["low"], spec["high"]))
+    return spec
+
+
+def encode_value(spec, value) -> float:
+    """Map a value of a dimension onto [0, 1] for the surrogate model"""
+    if isinstance(spec, list):
+        return spec.index(value) / max(len(spec) - 1, 1)
+    if isinstance(spec, dict):
+        return (value - spec["low"]) / max(spec["high"] - spec["low"], 1e-12)
+    return 0.
+
+
+class OptimizerService(BackTesterService):
+    """Search strategy_kwargs for the best backtest stats
+
+    search_space maps strategy kwargs to a list of values, a fixed value or
+    a range given as {low, high[, step]}. Candles are loaded once for all
+    trials, and resampled candles and indicators are cached per worker so
+    only indicators affected by the swept kwargs are recomputed.
+    """
+
+    default_config_file = ".optimizer.trader.env"
+
+    def __init__(self,
+                 *args,
+                 search_space: Optional[Union[str, dict]] = None,
+                 search_type: str = "grid",
+                 n_trials: int = 20,
+                 rank_by: str = "final_pnl",
+                 rank_ascending: bool = False,
+                 optimizer_seed: int = 0,
+                 **kwargs):
+        if isinstance(search_space, str):
+            search_space = yaml.safe_load(search_space)
+        if not isinstance(search_space, dict) or len(search_space) == 0:
+            raise ValueError("A search space over strategy kwargs is required")
+        if search_type not in ["grid", "random", "bayesian"]:
+            raise ValueError(f"Unknown search type {search_type}")
+        self.search_space = search_space
+        self.search_type = search_type
+        self.n_trials = int(n_trials)
+        self.rank_by = rank_by
+        self.rank_ascending = rank_ascending
+        self.rng = np.random.default_rng(optimizer_seed)
+        super().__init__(*args, **kwargs)
+
+    def is_broker_init_needed(self) -> bool:
+        # Candles are loaded once by load_shared_data instead
+        return False
+
+    def load_shared_data(self,
+                         from_date: datetime.datetime,
+                         to_date: datetime.datetime,
+                         context_from_date: datetime.datetime) -> dict:
+        self.broker.historic_context_from = from_date
+        self.broker.historic_context_to = to_date
+        shared_data = {"instruments": self.instruments,
+                       "from_date": from_date,
+                       "to_date": to_date,
+                       "context_from_date": context_from_date,
+                       "bot": {},
+                       "broker": {}}
+        for instrument in self.instruments:
+            key = get_key_from_scrip_and_exchange(instrument["scrip"], instrument["exchange"])
+            data_provider_instrument = get_instrument_for_provider(instrument, self.data_provider.__class__)
+            bot_data = self.bot.get_historic_data(scrip=data_provider_instrument["scrip"],
+                                                  exchange=data_provider_instrument["exchange"],
+                                                  from_date=context_from_date,
+                                                  to_date=to_date)
+            broker_data = self.broker.load_instrument_data(instrument)
+            if self.shared_candles is None:
+                shared_data["bot"][key] = bot_data
+                shared_data["broker"][key] = broker_data
+            # else the candles were materialized, workers attach to them by the same ranges
+        return shared_data
+
+    def get_score(self, result: dict) -> float:
+        score = result["stats"][self.rank_by]
+        return -score if self.rank_ascending else score
+
+    def grid_candidates(self) -> list[dict]:
+        names = list(self.search_space.keys())
+        values = [get_grid_values(self.search_space[name]) for name in names]
+        return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+    def random_candidates(self, n: int, exclude: Optional[list[dict]] = None) -> list[dict]:
+        exclude = [] if exclude is None else exclude
+        candidates = []
+        for _ in range(n * 20):
+            if len(candidates) >= n:
+                break
+            params = {name: sample_value(spec, self.rng) for name, spec in self.search_space.items()}
+            if params not in candidates and params not in exclude:
+                candidates.append(params)
+        return candidates
+
+    def bayesian_candidates(self, n: int, results: list[dict]) -> list[dict]:
+        """Pick the n candidates with the highest expected improvement under a GP surrogate"""
+        names = list(self.search_space.keys())
+        evaluated = [result["params"] for result in results]
+        x = np.array([[encode_value(self.search_space[name], params[name]) for name in names]
+                      for params in evaluated])
+        y = np.array([self.get_score(result) for result in results])
+        model = GaussianProcessRegressor(kernel=Matern(nu=2.5) + WhiteKernel(),
+                                         normalize_y=True,
+                                         random_state=int(self.rng.integers(2 ** 31)))
+        model.fit(x, y)
+        candidates = self.random_candidates(1000, exclude=evaluated)
+        if len(candidates) == 0:
+            return []
+        xc = np.array([[encode_value(self.search_space[name], params[name]) for name in names]
+                       for params in candidates])
+        mean, std = model.predict(xc, return_std=True)
+        std = np.maximum(std, 1e-12)
+        improvement = mean - y.max()
+        z = improvement / std
+        expected_improvement = improvement * norm.cdf(z) + std * norm.pdf(z)
+        order = np.argsort(-expected_improvement)
+        return [candidates[ii] for ii in order[:n]]
+
+    def run_trials(self,
+                   executor: Optional[ProcessPoolExecutor],
+                   trials: list[tuple]) -> list[Optional[dict]]:
+        """Run run_optimizer_trial arguments in the pool; failed trials give None"""
+        if executor is None:
+            return [run_optimizer_trial(*trial) for trial in trials]
+        futures = [executor.submit(run_optimizer_trial, *trial) for trial in trials]
+        results = []
+        for trial, future in zip(trials, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                self.logger.error(f"Optimizer trial {trial[0]} failed for {trial[1]}: {e}")
+                results.append(None)
+        return results
+
+    def start_workers(self, shared_data: dict) -> Optional[ProcessPoolExecutor]:
+        if self.parallel_workers > 1:
+            return ProcessPoolExecutor(max_workers=self.parallel_workers,
+                                       initializer=init_optimizer_worker,
+                                       initargs=(self.service_kwargs, shared_data))
+        init_optimizer_worker(self.service_kwargs, shared_data)
+        return None
+
+    def propose_candidates(self, results: list[dict], n_proposed: int) -> list[dict]:
+        """Next batch of params to try given the results so far, empty once the search is done"""
+        if self.search_type == "grid":
+            return self.grid_candidates() if n_proposed == 0 else []
+        if self.search_type == "random":
+            return self.random_candidates(self.n_trials) if n_proposed == 0 else []
+        batch_size = max(self.parallel_workers, 1)
+        if n_proposed == 0:
+            return self.random_candidates(min(self.n_trials, max(batch_size, 5)))
+        if n_proposed >= self.n_trials or len(results) < 2:
+            return []
+        return self.bayesian_candidates(min(batch_size, self.n_trials - n_proposed), results)
+
+    def optimize_windows(self,
+                         executor: Optional[ProcessPoolExecutor],
+                         windows: list[tuple]) -> list[list[dict]]:
+        """Search each (from_date, to_date, context_from_date) window, results best first
+
+        Every round proposes candidates for all windows that are still
+        searching and runs them together, so windows are evaluated in parallel.
+        """
+        results = [[] for _ in windows]
+        n_proposed = [0 for _ in windows]
+        active = list(range(len(windows)))
+        while len(active) > 0:
+            trials = []
+            owners = []
+            still_active = []
+            for ww in active:
+                candidates = self.propose_candidates(results[ww], n_proposed[ww])
+                if len(candidates) == 0:
+                    continue
+                still_active.append(ww)
+                for params in candidates:
+                    trial_id = f"{n_proposed[ww]}" if len(windows) == 1 else f"w{ww}-{n_proposed[ww]}"
+                    trials.append((trial_id, params) + tuple(windows[ww]))
+                    owners.append(ww)
+                    n_proposed[ww] += 1
+            for ww, result in zip(owners, self.run_trials(executor, trials)):
+                if result is not None:
+                    results[ww].append(result)
+            active = still_active
+        for window_results in results:
+            window_results.sort(key=self.get_score, reverse=True)
+        return results
+
+    def optimize(self,
+                 from_date: datetime.datetime,
+                 to_date: datetime.datetime,
+                 context_from_date: Optional[datetime.datetime] = None) -> list[dict]:
+        """Run the search over [from_date, to_date] and return trial results, best first"""
+        if context_from_date is None:
+            context_from_date = from_date
+        shared_data = self.load_shared_data(from_date, to_date, context_from_date)
+        executor = self.start_workers(shared_data)
+        try:
+            return self.optimize_windows(executor, [(from_date, to_date, context_from_date)])[0]
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def write_ranked_report(self,
+                            results: list[dict],
+                            from_date: datetime.datetime,
+                            to_date: datetime.datetime):
+        names = list(self.search_space.keys())
+        stat_names = list(results[0]["stats"].keys()) if len(results) > 0 else []
+        table = []
+        for rank, result in enumerate(results):
+            table.append([rank + 1, result["trial"]]
+                         + [result["params"][name] for name in names]
+                         + [result["stats"][name] for name in stat_names])
+        headers = ["rank", "trial"] + names + stat_names
+        folder = self.bot.backtest_results_folder
+        os.makedirs(folder, exist_ok=True)
+        fname = (f"optimizer-{self.search_type}-{self.strategy.__class__.__name__}-{self.interval}-"
+                 f"{from_date.strftime('%Y%m%d')}-{to_date.strftime('%Y%m%d')}.txt")
+        with open(os.path.join(folder, fname), 'w') as fid:
+            print(tabulate(table, headers=headers), file=fid)
+        print(tabulate(table, headers=headers))
+        self.logger.info(f"Ranked {len(results)} trials by {self.rank_by}; report written to {os.path.join(folder, fname)}")
+
+    def start(self):
+        self.logger.info(f"Running {self.search_type} search over {list(self.search_space.keys())}...")
+        try:
+            results = self.optimize(self.from_date, self.to_date, self.context_from_date)
+            self.write_ranked_report(results, self.from_date, self.to_date)
+        finally:
+            self.release_shared_candles()
+
+    @classmethod
+    def enrich_arg_parser(cls, p: ArgParser):
+        BackTesterService.enrich_arg_parser(p)
+        p.add('--search_space', help="Strategy kwargs to search over, e.g. {rsi_period: [7, 14], atr_factor: {low: 0.5, high: 3.0}}",
+              env_var="SEARCH_SPACE", type=yaml.safe_load)
+        p.add('--search_type', help="Search type (grid/random/bayesian)", env_var="SEARCH_TYPE", default="grid")
+        p.add('--n_trials', type=int, help="Number of trials for random and bayesian search", env_var="N_TRIALS", default=20)
+        p.add('--rank_by', help="Backtest stat to rank trials by", env_var="RANK_BY", default="final_pnl")
+        p.add('--rank_ascending', action="store_true", help="Lower values of rank_by are better", env_var="RANK_ASCENDING")
+        p.add('--optimizer_seed', type=int, help="Seed for random and bayesian search", env_var="OPTIMIZER_SEED", default=0)
@@ -0,0 +1,125 @@
+from typing import Optional
+import datetime
+import os
+
+from configargparse import ArgParser
+from tabulate import tabulate
+
+from .backtester import merge_backtest_stats
+from .optimizer import OptimizerService
+
+
+class WalkForwardService(OptimizerService):
+    """Walk-forward analysis over rolling in-sample / out-of-sample windows
+
+    Strategy kwargs are optimized on every in-sample window and the best
+    ones are backtested on the out-of-sample window that follows it.
+    Candles are loaded once for the whole range; windows only bound the
+    backtest loop, so resampled candles and indicator columns cached by a
+    worker are reused across windows.
+    """
+
+    default_config_file = ".walkforward.trader.env"
+
+    def __init__(self,
+                 *args,
+                 in_sample_days: int = 60,
+                 out_of_sample_days: int = 20,
+                 step_days: Optional[int] = None,
+                 **kwargs):
+        self.in_sample_days = int(in_sample_days)
+        self.out_of_sample_days = int(out_of_sample_days)
+        self.step_days = int(step_days) if step_days is not None else self.out_of_sample_days
+        super().__init__(*args, **kwargs)
+
+    def get_windows(self) -> list[dict]:
+        """(from_date, to_date, context_from_date) of every in-sample and out-of-sample window"""
+        warmup = datetime.timedelta(0)
+        if self.context_from_date is not None:
+            warmup = self.from_date - self.context_from_date
+        windows = []
+        start = self.from_date
+        while True:
+            in_sample_end = start + datetime.timedelta(days=self.in_sample_days)
+            if in_sample_end >= self.to_date:
+                break
+            out_of_sample_end = min(in_sample_end + datetime.timedelta(days=self.out_of_sample_days),
+                                    self.to_date)
+            windows.append({"in_sample": (start, in_sample_end, start - warmup),
+                            "out_of_sample": (in_sample_end, out_of_sample_end, in_sample_end - warmup)})
+            start = start + datetime.timedelta(days=self.step_days)
+        return windows
+
+    def walk_forward(self) -> tuple[list[dict], list[list[dict]], list[Optional[dict]]]:
+        windows = self.get_windows()
+        if len(windows) == 0:
+            raise ValueError(f"No {self.in_sample_days}d in-sample window fits between "
+                             f"{self.from_date} and {self.to_date}")
+        context_from_date = self.context_from_date if self.context_from_date is not None else self.from_date
+        shared_data = self.load_shared_data(self.from_date, self.to_date, context_from_date)
+        executor = self.start_workers(shared_data)
+        try:
+            in_sample_results = self.optimize_windows(executor, [window["in_sample"] for window in windows])
+            trials = []
+            owners = []
+            for ww, (window, results) in enumerate(zip(windows, in_sample_results)):
+                if len(results) == 0:
+                    self.logger.warn(f"No successful in-sample trials for window {ww}")
+                    continue
+                trials.append((f"w{ww}-oos", results[0]["params"]) + window["out_of_sample"])
+                owners.append(ww)
+            out_of_sample_results = [None for _ in windows]
+            for ww, result in zip(owners, self.run_trials(executor, trials)):
+                out_of_sample_results[ww] = result
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return windows, in_sample_results, out_of_sample_results
+
+    def write_walk_forward_report(self,
+                                  windows: list[dict],
+                                  in_sample_results: list[list[dict]],
+                                  out_of_sample_results: list[Optional[dict]]):
+        names = list(self.search_space.keys())
+        table = []
+        for ww, window in enumerate(windows):
+            best = in_sample_results[ww][0] if len(in_sample_results[ww]) > 0 else None
+            result = out_of_sample_results[ww]
+            table.append([ww,
+                          window["in_sample"][0].strftime('%Y%m%d'),
+                          window["out_of_sample"][0].strftime('%Y%m%d'),
+                          window["out_of_sample"][1].strftime('%Y%m%d')]
+                         + [best["params"][name] if best is not None else None for name in names]
+                         + [best["stats"][self.rank_by] if best is not None else None]
+                         + ([result["stats"][name] for name in ["trades", "accuracy", "max_drawdown", self.rank_by]]
+                            if result is not None else [None] * 4))
+        total = merge_backtest_stats([result for result in out_of_sample_results if result is not None])
+        table.append(["TOTAL", "", "", ""] + [""] * len(names) + [""]
+                     + [total[name] for name in ["trades", "accuracy", "max_drawdown", self.rank_by]])
+        headers = (["window", "in_sample_from", "out_of_sample_from", "out_of_sample_to"] + names
+                   + [f"in_sample_{self.rank_by}", "oos_trades", "oos_accuracy", "oos_max_drawdown",
+                      f"oos_{self.rank_by}"])
+        folder = self.bot.backtest_results_folder
+        os.makedirs(folder, exist_ok=True)
+        fname = (f"walkforward-{self.search_type}-{self.strategy.__class__.__name__}-{self.interval}-"
+                 f"{self.from_date.strftime('%Y%m%d')}-{self.to_date.strftime('%Y%m%d')}.txt")
+        with open(os.path.join(folder, fname), 'w') as fid:
+            print(tabulate(table, headers=headers), file=fid)
+        print(tabulate(table, headers=headers))
+        self.logger.info(f"Walk-forward report for {len(windows)} windows written to {os.path.join(folder, fname)}")
+
+    def start(self):
+        self.logger.info(f"Running walk-forward analysis ({self.in_sample_days}d in-sample, "
+                         f"{self.out_of_sample_days}d out-of-sample, {self.step_days}d step)...")
+        try:
+            windows, in_sample_results, out_of_sample_results = self.walk_forward()
+            self.write_walk_forward_report(windows, in_sample_results, out_of_sample_results)
+        finally:
+            self.release_shared_candles()
+
+    @classmethod
+    def enrich_arg_parser(cls, p: ArgParser):
+        OptimizerService.enrich_arg_parser(p)
+        p.add('--in_sample_days', type=int, help="Length of in-sample (optimization) windows in days", env_var="IN_SAMPLE_DAYS", default=60)
+        p.add('--out_of_sample_days', type=int, help="Length of out-of-sample (evaluation) windows in days", env_var="OUT_OF_SAMPLE_DAYS", default=20)
+        p.add('--step_days', type=int, help="Days between the starts of consecutive windows (defaults to out_of_sample_days)", env_var="STEP_DAYS")
@@ -189,7 +189,7 @@ class HiekinAshiStrategyV2(Strategy):
                         or self.long_position_tag not in current_entry_order.tags):
                             next_run = TradeType.LONG
                     else:
-                        self.logger.info(f"Potential Long Position ({current_entry_order.order_id[:4]}) "
+                        self.logger.info(f"Potential Long Position ({current_entry_order.order_id}) "
                                          f"already exists, but hasn't fructified. So not creating new entry")
                 else:
                     clear_entry_orders = TradeType.SHORT
@@ -204,7 +204,7 @@ class HiekinAshiStrategyV2(Strategy):
                         or self.short_position_tag not in current_entry_order.tags):
                         next_run = TradeType.SHORT
                     else:
-                        self.logger.info(f"Potential Short Position ({current_entry_order.order_id[:4]}) "
+                        self.logger.info(f"Potential Short Position ({current_entry_order.order_id}) "
                                          f"already exists, but hasn't fructified. So not creating new entry")
                 else:
                     clear_entry_orders = TradeType.LONG
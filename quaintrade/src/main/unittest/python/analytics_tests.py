@@ -0,0 +1,103 @@
+import unittest
+import tempfile
+import json
+import os
+
+import pandas as pd
+import numpy as np
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.ds import TransactionType
+from quaintscience.trader.core.ledger import PnLLedger
+from quaintscience.trader.core.util import datetime_index_to_ns
+from quaintscience.trader.core.analytics import (get_trade_stats,
+                                                 get_drawdown_stats,
+                                                 get_return_stats,
+                                                 get_backtest_report,
+                                                 write_report_json)
+
+
+class TestAnalytics(Unittest):
+
+    def test_trade_stats(self):
+        # Runs: loss | win | three losses (a flat trade counts as one) | three wins | loss | win
+        pnl = [-4., 10., -5., -3., 0., 8., 7., 9., -20., 4.]
+        stats = get_trade_stats(pnl)
+        self.assertEqual(stats["trades"], 10)
+        self.assertEqual(stats["accuracy"], 0.5)
+        self.assertEqual(stats["max_drawdown"], -20.)
+        self.assertEqual(stats["lowest_point"], -4.)
+        self.assertEqual(stats["longest_loss_streak"], 3)
+        self.assertEqual(stats["longest_profit_streak"], 3)
+        self.assertEqual(stats["final_pnl"], 6.)
+        self.assertEqual(stats["largest_loss"], -20.)
+        self.assertEqual(stats["gross_profit"], 38.)
+        self.assertEqual(stats["gross_loss"], 32.)
+        self.assertEqual(stats["profit_factor"], 38. / 32.)
+        self.assertEqual(stats["average_loss"], -8.)
+
+    def test_trade_stats_edge_cases(self):
+        stats = get_trade_stats([])
+        self.assertEqual((stats["trades"], stats["accuracy"], stats["max_drawdown"]), (0, 0., 0.))
+        stats = get_trade_stats([3., 2.])
+        self.assertEqual((stats["max_drawdown"], stats["lowest_point"]), (0., 0.))
+        self.assertEqual((stats["longest_loss_streak"], stats["longest_profit_streak"]), (0, 2))
+        self.assertIsNone(stats["profit_factor"])
+
+    def test_drawdown_stats(self):
+        index = pd.date_range("2023-01-02 09:15", periods=6, freq="1min")
+        stats = get_drawdown_stats(pd.Series([0., 5., 2., 3., 6., 1.], index=index))
+        self.assertEqual(stats["max_equity_drawdown"], -5.)
+        # From the peak at 09:16 to the recovery at 09:19
+        self.assertEqual(stats["max_drawdown_duration"], pd.Timedelta(minutes=3))
+        self.assertEqual(stats["max_drawdown_bars"], 2)
+        stats = get_drawdown_stats(pd.Series([0., 1., 2.], index=index[:3]))
+        self.assertEqual((stats["max_equity_drawdown"], stats["max_drawdown_duration"]), (0., None))
+
+    def test_return_stats(self):
+        index = pd.date_range("2023-01-02 15:00", periods=3, freq="1D")
+        stats = get_return_stats(pd.Series([10., 30., 20.], index=index))
+        daily = np.array([10., 20., -10.])
+        self.assertAlmostEqual(stats["sharpe"], daily.mean() / daily.std(ddof=1) * np.sqrt(252))
+        self.assertIsNone(stats["cagr"])
+
+    def test_backtest_report(self):
+        index = pd.date_range("2023-01-02 09:15", periods=4, freq="1min").append(
+            pd.date_range("2023-01-03 09:15", periods=4, freq="1min"))
+        highs = np.array([101., 103., 104., 102., 100., 101., 99., 98.])
+        lows = np.array([99., 100., 101., 100., 98., 97., 96., 97.])
+        ledger = PnLLedger()
+        ledger.record_trade("o1", index[1], index[3], TransactionType.BUY, 20.,
+                            key="INFY:NSE", entry_price=101., exit_price=103., quantity=10)
+        ledger.record_trade("o2", index[5], index[6], TransactionType.SELL, -5.,
+                            key="INFY:NSE", entry_price=98., exit_price=98.5, quantity=10)
+        equity = pd.Series([0., 5., 15., 20., 20., 18., 15., 15.], index=index)
+        exposure = pd.Series([0, 10, 10, 10, 0, 10, 10, 0], index=index)
+        report = get_backtest_report(ledger.get_trades(), equity, exposure=exposure,
+                                     candle_ranges={"INFY:NSE": (datetime_index_to_ns(index), highs, lows)})
+        self.assertEqual(report["stats"]["trades"], 2)
+        self.assertEqual(report["stats"]["exposure"], 5 / 8)
+        self.assertEqual(report["stats"]["max_equity_drawdown"], -5.)
+        self.assertEqual(report["daily"]["pnl"].tolist(), [20., -5.])
+        self.assertEqual(report["daily"]["trades"].tolist(), [1, 1])
+        self.assertEqual(report["daily"]["accuracy"].tolist(), [1., 0.])
+        self.assertEqual(report["monthly"]["trade_pnl"].tolist(), [15.])
+        # Over bars 1..3 for the long, 5..6 for the short
+        self.assertEqual(report["trades"]["mfe"].tolist(), [(104. - 101.) * 10, (98. - 96.) * 10])
+        self.assertEqual(report["trades"]["mae"].tolist(), [(100. - 101.) * 10, (98. - 101.) * 10])
+
+        fid, path = tempfile.mkstemp(suffix=".json")
+        os.close(fid)
+        try:
+            write_report_json(report, path)
+            with open(path) as fid:
+                written = json.load(fid)
+        finally:
+            os.remove(path)
+        self.assertEqual(written["stats"]["trades"], 2)
+        self.assertEqual([row["period"] for row in written["daily"]], ["2023-01-02", "2023-01-03"])
+        self.assertEqual([row["mfe"] for row in written["trades"]], [30., 20.])
+
+
+if __name__ == "__main__":
+    unittest.main()
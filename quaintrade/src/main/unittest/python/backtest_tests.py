@@ -0,0 +1,191 @@
+import unittest
+import datetime
+import tempfile
+import shutil
+import contextlib
+import io
+import os
+
+import pandas as pd
+import numpy as np
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.ds import OHLCStorageType, OrderState, PositionType, TradeType
+from quaintscience.trader.core.roles import HistoricDataProvider
+from quaintscience.trader.core.strategy import Strategy
+from quaintscience.trader.core.indicator import IndicatorPipeline, RSIIndicator, ATRIndicator
+from quaintscience.trader.core.util import new_id
+from quaintscience.trader.integration.paper import PaperBroker
+from quaintscience.trader.core.bot import Bot
+
+
+class SyntheticDataProvider(HistoricDataProvider):
+    """Serves the candles stored under data_path, never downloads"""
+
+    ProviderName = "synthetic"
+
+    def init(self):
+        pass
+
+    def download_historic_data(self, *args, **kwargs) -> bool:
+        return True
+
+
+def get_synthetic_candles(days: int, seed: int = 0) -> pd.DataFrame:
+    """Random walk minute candles over the market hours of days weekdays from 2023-01-02"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2023-01-02", periods=days)
+    index = pd.DatetimeIndex([date + pd.Timedelta(hours=9, minutes=15 + minute)
+                              for date in dates for minute in range(375)], name="date")
+    close = 18000 + np.cumsum(rng.normal(0, 5, len(index)))
+    opn = np.concatenate([close[:1], close[:-1]])
+    return pd.DataFrame({"open": opn,
+                         "high": np.maximum(opn, close) + rng.uniform(0, 4, len(index)),
+                         "low": np.minimum(opn, close) - rng.uniform(0, 4, len(index)),
+                         "close": close,
+                         "volume": rng.integers(1, 1000, len(index)),
+                         "oi": 0},
+                        index=index)
+
+
+class RSIBracketStrategy(Strategy):
+    """Bracket orders in the direction of an RSI extreme, one trade at a time"""
+
+    def __init__(self, *args, **kwargs):
+        kwargs["indicator_pipeline"] = {"window": IndicatorPipeline([(RSIIndicator(period=14), None, None),
+                                                                     (ATRIndicator(period=14), None, None)]),
+                                        "context": {"1d": IndicatorPipeline([(RSIIndicator(period=3), None, None)])}}
+        kwargs["context_required"] = ["1d"]
+        super().__init__(*args, **kwargs)
+
+    def apply_impl(self, broker, scrip, exchange, window, context):
+        row = window.iloc[-1]
+        if not self.can_trade(window, context) or np.isnan(row["RSI_14"]) or np.isnan(row["ATR_14"]):
+            return
+        if (any(order.state == OrderState.PENDING for order in broker.get_orders())
+                or len(broker.get_gtt_orders()) > 0):
+            return
+        if 40 <= row["RSI_14"] <= 60:
+            return
+        trade_type = TradeType.LONG if row["RSI_14"] > 60 else TradeType.SHORT
+        sign = 1 if trade_type == TradeType.LONG else -1
+        entry = row["close"] + sign * row["ATR_14"] * 0.5
+        group_id = new_id()
+        entry_order = self.take_position(scrip=scrip, exchange=exchange, broker=broker,
+                                         position_type=PositionType.ENTRY, trade_type=trade_type,
+                                         limit_price=entry, group_id=group_id)
+        for position_type, distance in [(PositionType.STOPLOSS, -row["ATR_14"]),
+                                        (PositionType.TARGET, 1.5 * row["ATR_14"])]:
+            self.take_position(scrip=scrip, exchange=exchange, broker=broker,
+                               position_type=position_type, trade_type=trade_type,
+                               limit_price=entry + sign * distance, parent_order=entry_order, group_id=group_id)
+
+
+class TestBacktestTypes(Unittest):
+
+    def customSetUp(self):
+        self.data_path = tempfile.mkdtemp()
+        candles = get_synthetic_candles(days=10)
+        candles.index = candles.index.strftime("%Y-%m-%d %H:%M:%S")
+        provider = SyntheticDataProvider(data_path=self.data_path)
+        provider.get_storage("NIFTY", "NSE", OHLCStorageType.PERM).put("NIFTY", "NSE", candles)
+        self.from_date = datetime.datetime(2023, 1, 4)
+        self.to_date = datetime.datetime(2023, 1, 13, 15, 30)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_path, ignore_errors=True)
+
+    def run_backtest(self, backtest_type: str) -> dict:
+        provider = SyntheticDataProvider(data_path=self.data_path)
+        broker = PaperBroker(audit_records_path=os.path.join(self.data_path, f"audit-{backtest_type}"),
+                             data_provider=provider,
+                             instruments=[{"scrip": "NIFTY", "exchange": "NSE"}],
+                             historic_context_from=self.from_date - datetime.timedelta(days=3),
+                             historic_context_to=self.to_date,
+                             interval="3min")
+        broker.init()
+        bot = Bot(broker=broker,
+                  strategy=RSIBracketStrategy(),
+                  data_provider=provider,
+                  backtest_type=backtest_type,
+                  backtesting_print_tables=False,
+                  backtest_results_folder=os.path.join(self.data_path, f"results-{backtest_type}"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            return bot.backtest("NIFTY", "NSE",
+                                from_date=self.from_date,
+                                to_date=self.to_date,
+                                context_from_date=self.from_date - datetime.timedelta(days=2),
+                                interval="3min",
+                                window_size=5)
+
+    def test_fast_matches_standard(self):
+        standard = self.run_backtest("standard")
+        fast = self.run_backtest("fast")
+        self.assertGreater(len(standard["pnl_data"]), 5)
+        # Order ids are new in every run
+        self.assertEqual([row[1:] for row in fast["pnl_data"]], [row[1:] for row in standard["pnl_data"]])
+        self.assertEqual(fast["stats"].keys(), standard["stats"].keys())
+        for key, value in standard["stats"].items():
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                self.assertTrue(fast["stats"][key] is None or np.isnan(fast["stats"][key]), key)
+            else:
+                self.assertEqual(fast["stats"][key], value, key)
+
+
+def reference_context(context: dict[str, pd.DataFrame], now_tick: datetime.datetime) -> dict[str, pd.DataFrame]:
+    """Context rows complete at now_tick, as Bot.pick_relevant_context used to filter them"""
+    this_context = {}
+    for k, v in context.items():
+        if k in ["1d", "1w"]:
+            this_context[k] = v[v.index < now_tick.replace(hour=0, minute=0, second=0, microsecond=0)]
+        else:
+            this_context[k] = v[v.index < now_tick - datetime.timedelta(seconds=pd.Timedelta(k).total_seconds())]
+    return this_context
+
+
+class TestContextAlignment(Unittest):
+
+    def customSetUp(self):
+        self.data_path = tempfile.mkdtemp()
+        provider = SyntheticDataProvider(data_path=self.data_path)
+        broker = PaperBroker(audit_records_path=self.data_path,
+                             data_provider=provider,
+                             instruments=[],
+                             disable_state_persistence=True)
+        self.bot = Bot(broker=broker, strategy=RSIBracketStrategy(), data_provider=provider)
+        candles = get_synthetic_candles(days=12)
+        aggregations = {"open": "first", "high": "max", "low": "min", "close": "last"}
+        self.data = candles.resample("3min").agg(aggregations).dropna()
+        self.context = {interval: candles.resample(interval).agg(aggregations).dropna()
+                        for interval in ["15min", "1h", "1d", "1w"]}
+
+    def tearDown(self):
+        shutil.rmtree(self.data_path, ignore_errors=True)
+
+    def test_matches_the_old_cutoffs(self):
+        alignment = self.bot.get_context_alignment(self.data.index, self.context)
+        empty_ticks = 0
+        for tick_idx, now_tick in enumerate(self.data.index.to_pydatetime()):
+            expected = reference_context(self.context, now_tick)
+            picked = self.bot.pick_relevant_context(self.context, now_tick)
+            aligned = self.bot.pick_aligned_context(self.context, alignment, tick_idx)
+            if any(len(v) == 0 for v in expected.values()):
+                empty_ticks += 1
+                self.assertIsNone(aligned, now_tick)
+            for k, v in expected.items():
+                self.assertTrue(picked[k].index.equals(v.index), (k, now_tick))
+                if aligned is not None:
+                    self.assertTrue(aligned[k].index.equals(v.index), (k, now_tick))
+        # The first day has no complete daily candle, the first week no weekly one
+        self.assertGreater(empty_ticks, 0)
+        self.assertLess(empty_ticks, len(self.data))
+
+    def test_empty_context(self):
+        context = {"15min": self.context["15min"], "1d": self.context["1d"].iloc[:0]}
+        alignment = self.bot.get_context_alignment(self.data.index, context)
+        self.assertTrue((alignment["1d"] == 0).all())
+        self.assertIsNone(self.bot.pick_aligned_context(context, alignment, len(self.data) - 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import datetime
+import tempfile
+import shutil
+import logging
+import os
+from types import SimpleNamespace
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.ds import TransactionType
+from quaintscience.trader.core.analytics import get_trade_stats
+from quaintscience.trader.service.backtester import (BackTesterService,
+                                                     merge_pnl_data,
+                                                     merge_backtest_stats)
+
+
+def get_result(scrip: str, exits: list[datetime.datetime], pnl: list[float]) -> dict:
+    """Result of Bot.backtest for trades closing at exits"""
+    pnl_data = [[f"{scrip}-{ii}", exit_time - datetime.timedelta(minutes=30), exit_time, TransactionType.BUY, value]
+                for ii, (exit_time, value) in enumerate(zip(exits, pnl))]
+    return {"scrip": scrip,
+            "exchange": "NSE",
+            "pnl_data": pnl_data,
+            "stats": get_trade_stats(pnl)}
+
+
+class TestMergeBacktestStats(Unittest):
+
+    def customSetUp(self):
+        start = datetime.datetime(2023, 1, 2, 10, 0)
+        times = [start + datetime.timedelta(hours=ii) for ii in range(6)]
+        # The losing streaks of both instruments overlap in time
+        self.results = [get_result("INFY", times[0::2], [-10., -10., 30.]),
+                        get_result("TCS", times[1::2], [-5., -5., 2.])]
+
+    def test_per_instrument(self):
+        self.assertEqual(self.results[0]["stats"]["max_drawdown"], -20.)
+        self.assertEqual(self.results[1]["stats"]["max_drawdown"], -10.)
+
+    def test_replayed_in_exit_order(self):
+        self.assertEqual([row[4] for row in merge_pnl_data(self.results)],
+                         [-10., -5., -10., -5., 30., 2.])
+        stats = merge_backtest_stats(self.results)
+        self.assertEqual(stats["trades"], 6)
+        self.assertEqual(stats["max_drawdown"], -30.)
+        self.assertEqual(stats["lowest_point"], -30.)
+        self.assertEqual(stats["longest_loss_streak"], 4)
+        self.assertEqual(stats["longest_profit_streak"], 2)
+        self.assertEqual(stats["largest_loss"], -10.)
+        self.assertEqual(stats["final_pnl"], 2.)
+        self.assertAlmostEqual(stats["accuracy"], 2 / 6)
+
+    def test_empty(self):
+        stats = merge_backtest_stats([])
+        self.assertEqual(stats["trades"], 0)
+        self.assertEqual(stats["max_drawdown"], 0.)
+
+
+class TestMergedReport(Unittest):
+
+    def customSetUp(self):
+        self.dirpath = tempfile.mkdtemp()
+        start = datetime.datetime(2023, 1, 2, 10, 0)
+        times = [start + datetime.timedelta(hours=ii) for ii in range(6)]
+        self.results = [get_result("INFY", times[0::2], [-10., -10., 30.]),
+                        get_result("TCS", times[1::2], [-5., -5., 2.])]
+        # Only the attributes write_merged_report reads
+        self.service = SimpleNamespace(bot=SimpleNamespace(backtest_results_folder=self.dirpath),
+                                       strategy=SimpleNamespace(),
+                                       interval="3min",
+                                       from_date=datetime.datetime(2023, 1, 2),
+                                       to_date=datetime.datetime(2023, 1, 3),
+                                       logger=logging.getLogger(__name__))
+
+    def tearDown(self):
+        shutil.rmtree(self.dirpath, ignore_errors=True)
+
+    def read_report(self) -> list[str]:
+        fnames = os.listdir(self.dirpath)
+        self.assertEqual(len(fnames), 1)
+        with open(os.path.join(self.dirpath, fnames[0]), 'r') as fid:
+            return fid.read().splitlines()
+
+    def get_row(self, lines: list[str], first: str) -> list[str]:
+        rows = [line.split() for line in lines if line.startswith(first)]
+        self.assertEqual(len(rows), 1, first)
+        return rows[0]
+
+    def test_failed_rows(self):
+        failed = [{"scrip": "WIPRO", "exchange": "NSE"}]
+        BackTesterService.write_merged_report(self.service, self.results, failed)
+        lines = self.read_report()
+        self.assertEqual(self.get_row(lines, "WIPRO"), ["WIPRO", "NSE", "FAILED"])
+        total = self.get_row(lines, "TOTAL")
+        self.assertEqual(total[:4], ["TOTAL", "(1", "failed", "excluded)"])
+        # trades, accuracy, max_drawdown, largest_loss, pnl of the two instruments that ran
+        self.assertEqual(int(total[4]), 6)
+        self.assertEqual(float(total[6]), -30.)
+        self.assertEqual(float(total[8]), 2.)
+        # Trades of every instrument, in the order they closed
+        scrips = [line.split()[0] for line in lines if line.startswith(("INFY ", "TCS "))
+                  and "-" in line.split()[2]]
+        self.assertEqual(scrips, ["INFY", "TCS"] * 3)
+
+    def test_no_failures(self):
+        BackTesterService.write_merged_report(self.service, self.results)
+        lines = self.read_report()
+        total = self.get_row(lines, "TOTAL")
+        self.assertEqual(int(total[1]), 6)
+        self.assertEqual(float(total[3]), -30.)
+        self.assertFalse(any("FAILED" in line for line in lines))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+import numpy as np
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.ds import Order, OrderState, TransactionType, TradingProduct
+from quaintscience.trader.core.commission import NSECommissionModel, nse_commission_func
+
+
+def get_order(price: float, quantity: int = 10, **kwargs) -> Order:
+    return Order(scrip_id="INFY", exchange_id="NSE", scrip="INFY", exchange="NSE",
+                 state=OrderState.COMPLETED, price=price, quantity=quantity, **kwargs)
+
+
+class TestNSECommissionModel(Unittest):
+
+    def customSetUp(self):
+        self.model = NSECommissionModel(log_breakdown=False)
+
+    def test_numpy_and_python_floats_agree(self):
+        rng = np.random.default_rng(0)
+        count = 20000
+        prices = rng.uniform(10, 5000, count).round(2)
+        quantities = rng.integers(1, 500, count)
+        sides = rng.choice([TransactionType.BUY, TransactionType.SELL], count)
+        products = rng.choice([TradingProduct.MIS, TradingProduct.CNC, TradingProduct.NRML], count)
+        for price, quantity, side, product in zip(prices, quantities, sides, products):
+            self.assertEqual(self.model.get_breakdown(price, quantity, side, product),
+                             self.model.get_breakdown(float(price), int(quantity), side, product))
+
+    def test_halves_round_like_python(self):
+        # 52.535 is stored just below the half, np.round(np.float64(52.535), 2) gives 52.54
+        model = NSECommissionModel(brokerage_percentage=100, max_commission=0, log_breakdown=False)
+        for price in [52.535, np.float64(52.535)]:
+            breakdown = model.get_breakdown(price, 1, TransactionType.BUY, TradingProduct.MIS)
+            self.assertEqual(breakdown["brokerage"], 52.53)
+
+    def test_breakdown(self):
+        breakdown = self.model.get_breakdown(1000., 100, TransactionType.SELL, TradingProduct.MIS)
+        self.assertEqual(breakdown["brokerage"], 20.)
+        self.assertEqual(breakdown["stt"], 25.)
+        self.assertEqual(breakdown["transaction_charges"], 3.25)
+        self.assertEqual(breakdown["stamp_charges"], 0.)
+        self.assertEqual(breakdown["total"], round(sum(v for k, v in breakdown.items() if k != "total"), 2))
+        self.assertEqual(self.model.get_breakdown(1000., 100, TransactionType.BUY, TradingProduct.MIS)["stt"], 0.)
+        self.assertEqual(self.model.get_breakdown(1000., 100, TransactionType.BUY, TradingProduct.CNC)["stt"], 100.)
+
+    def test_orders_priced_once(self):
+        order = get_order(np.float64(1500.25))
+        charges = self.model(order)
+        self.assertEqual(charges,
+                         self.model.get_breakdown(1500.25, 10, TransactionType.BUY, TradingProduct.MIS)["total"])
+        # Cached, not priced again
+        self.model.get_breakdown = None
+        self.assertEqual(self.model(order), charges)
+        self.assertEqual(nse_commission_func(order), charges)
+
+    def test_refilled_orders_are_priced_again(self):
+        order = get_order(1500.)
+        charges = self.model(order)
+        order.price = 3000.
+        self.assertNotEqual(self.model(order), charges)
+        self.assertEqual(len(self.model.cache), 1)
+
+    def test_cache_is_bounded(self):
+        model = NSECommissionModel(log_breakdown=False, max_cached_orders=3)
+        orders = [get_order(100. + ii) for ii in range(5)]
+        for order in orders:
+            model(order)
+        self.assertEqual(list(model.cache.keys()), [order.order_id for order in orders[2:]])
+        # Forgotten orders are priced the same again
+        self.assertEqual(model(orders[0]), self.model(orders[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
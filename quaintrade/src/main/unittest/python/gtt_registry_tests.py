@@ -0,0 +1,90 @@
+import unittest
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.ds import Order, OrderState, TransactionType
+from quaintscience.trader.core.gtt import GTTRegistry
+
+
+def get_order(**kwargs) -> Order:
+    return Order(scrip_id="INFY", exchange_id="NSE", scrip="INFY", exchange="NSE", **kwargs)
+
+
+class TestGTTRegistry(Unittest):
+
+    def customSetUp(self):
+        self.entries = [get_order() for _ in range(3)]
+        self.stops = [get_order(transaction_type=TransactionType.SELL) for _ in range(3)]
+        self.targets = [get_order(transaction_type=TransactionType.SELL) for _ in range(3)]
+        self.registry = GTTRegistry()
+        # Stops of every entry first, then the targets, so pairs of an entry are not adjacent
+        for entry, stop in zip(self.entries, self.stops):
+            self.registry.add(entry, stop)
+        for entry, target in zip(self.entries, self.targets):
+            self.registry.add(entry, target)
+
+    def test_iteration_and_lookups(self):
+        self.assertEqual(len(self.registry), 6)
+        self.assertEqual(list(self.registry),
+                         list(zip(self.entries, self.stops)) + list(zip(self.entries, self.targets)))
+        self.assertIn(self.entries[1].order_id, self.registry)
+        self.assertNotIn(self.stops[1].order_id, self.registry)
+        self.assertEqual(self.registry.get_orders_for(self.entries[1].order_id), [self.stops[1], self.targets[1]])
+        self.assertEqual(self.registry.get_orders_for("missing"), [])
+
+    def test_pop_ready_pairs_in_the_order_added(self):
+        self.assertEqual(self.registry.pop_ready_pairs(), [])
+        # Marked out of order, popped in the order the pairs were added
+        self.registry.mark_ready(self.entries[2].order_id)
+        self.registry.mark_ready(self.entries[0].order_id)
+        self.registry.mark_ready(self.entries[2].order_id)
+        self.registry.mark_ready("missing")
+        self.assertEqual(self.registry.pop_ready_pairs(),
+                         [(self.entries[0], self.stops[0]),
+                          (self.entries[2], self.stops[2]),
+                          (self.entries[0], self.targets[0]),
+                          (self.entries[2], self.targets[2])])
+        self.assertEqual(self.registry.pop_ready_pairs(), [])
+
+    def test_entries_already_done_are_ready(self):
+        entry = get_order(state=OrderState.COMPLETED)
+        stop = get_order(transaction_type=TransactionType.SELL)
+        self.registry.add(entry, stop)
+        self.assertEqual(self.registry.pop_ready_pairs(), [(entry, stop)])
+
+    def test_update_entry(self):
+        filled = self.entries[1].copy()
+        filled.state = OrderState.COMPLETED
+        self.registry.update_entry(filled)
+        self.assertEqual(self.registry.get_entry_orders(filled.order_id), [filled, filled])
+        self.assertEqual(self.registry.pop_ready_pairs(), [(filled, self.stops[1]), (filled, self.targets[1])])
+
+    def test_update(self):
+        stop = self.stops[0].copy()
+        self.assertTrue(self.registry.update(self.entries[0], stop))
+        self.assertIs(self.registry.get_orders_for(self.entries[0].order_id)[0], stop)
+        self.assertFalse(self.registry.update(self.entries[0], get_order()))
+        self.assertEqual(len(self.registry), 6)
+
+    def test_remove(self):
+        self.registry.mark_ready(self.entries[0].order_id)
+        self.registry.remove(self.entries[0].order_id, self.stops[0].order_id)
+        self.registry.remove(self.entries[0].order_id, self.stops[0].order_id)
+        self.assertEqual(self.registry.pop_ready_pairs(), [(self.entries[0], self.targets[0])])
+        self.registry.mark_ready(self.entries[0].order_id)
+        self.registry.remove(self.entries[0].order_id, self.targets[0].order_id)
+        self.assertNotIn(self.entries[0].order_id, self.registry)
+        self.assertEqual(self.registry.pop_ready_pairs(), [])
+
+    def test_remove_entry(self):
+        self.assertEqual(self.registry.remove_entry(self.entries[1].order_id),
+                         [(self.entries[1].order_id, self.stops[1].order_id),
+                          (self.entries[1].order_id, self.targets[1].order_id)])
+        self.assertEqual(self.registry.remove_entry(self.entries[1].order_id), [])
+        self.assertEqual(len(self.registry), 4)
+        self.registry.clear()
+        self.assertEqual(len(self.registry), 0)
+        self.assertEqual(list(self.registry), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+import pandas as pd
+import numpy as np
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.indicator import (IndicatorCache,
+                                                 IndicatorPipeline,
+                                                 DonchianIndicator,
+                                                 RSIIndicator)
+from quaintscience.trader.core.ml.lorentzian import LorentzianClassificationIndicator
+
+
+class TestIndicatorCache(Unittest):
+
+    def test_cache_token_depends_on_settings_only(self):
+        self.assertEqual(DonchianIndicator(period=10).get_cache_token(),
+                         DonchianIndicator(period=10).get_cache_token())
+        self.assertNotEqual(DonchianIndicator(period=10).get_cache_token(),
+                            DonchianIndicator(period=20).get_cache_token())
+        self.assertNotEqual(DonchianIndicator(period=10).get_cache_token(),
+                            DonchianIndicator(period=10).get_cache_token(settings={"period": 20}))
+        self.assertNotEqual(LorentzianClassificationIndicator(neighbors_count=8).get_cache_token(),
+                            LorentzianClassificationIndicator(neighbors_count=16).get_cache_token())
+
+    def test_pipeline_cache_token_covers_its_indicators(self):
+        def get_pipeline(period):
+            return IndicatorPipeline([(DonchianIndicator(period=period), None, None),
+                                      (RSIIndicator(), None, None)],
+                                     cache=IndicatorCache())
+        self.assertEqual(get_pipeline(10).get_cache_token(), get_pipeline(10).get_cache_token())
+        self.assertNotEqual(get_pipeline(10).get_cache_token(), get_pipeline(20).get_cache_token())
+
+    def test_memory_eviction(self):
+        frame = pd.DataFrame({"close": np.zeros(1000)})
+        size = IndicatorCache.get_memory_size(frame)
+        cache = IndicatorCache(max_memory_bytes=int(size * 2.5))
+        for ii in range(3):
+            cache.put(("frame", ii), frame.copy())
+        self.assertIsNone(cache.get(("frame", 0)))
+        self.assertIsNotNone(cache.get(("frame", 1)))
+        self.assertIsNotNone(cache.get(("frame", 2)))
+        self.assertEqual(cache.memory_bytes, 2 * size)
+        # Replacing an entry does not count it twice
+        cache.put(("frame", 2), frame.copy())
+        self.assertEqual(cache.memory_bytes, 2 * size)
+
+    def test_entries_evicted_by_count(self):
+        cache = IndicatorCache(max_entries=2)
+        for ii in range(3):
+            cache.put(("frame", ii), pd.DataFrame({"close": [float(ii)]}))
+        self.assertEqual(list(cache.entries.keys()), [("frame", 1), ("frame", 2)])
+        self.assertEqual(sorted(cache.entry_sizes.keys()), [("frame", 1), ("frame", 2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+
+import pandas as pd
+import numpy as np
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.indicator import (IndicatorPipeline,
+                                                 MAIndicator,
+                                                 ATRIndicator,
+                                                 RSIIndicator,
+                                                 DonchianIndicator,
+                                                 HeikinAshiIndicator,
+                                                 SlopeIndicator,
+                                                 ADXIndicator)
+
+
+def get_candles(rows: int = 500, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2023-01-02 09:15", periods=rows, freq="1min")
+    close = 100 + np.cumsum(rng.normal(0, 1, rows))
+    opn = close + rng.normal(0, 0.5, rows)
+    high = np.maximum(opn, close) + rng.uniform(0, 1, rows)
+    low = np.minimum(opn, close) - rng.uniform(0, 1, rows)
+    return pd.DataFrame({"open": opn, "high": high, "low": low, "close": close}, index=index)
+
+
+def update_in_chunks(indicator, df: pd.DataFrame, chunk_sizes: list[int]) -> pd.DataFrame:
+    """update() over df fed in chunks of chunk_sizes (the last one repeated)"""
+    state, frames, start = None, [], 0
+    ii = 0
+    while start < len(df):
+        size = chunk_sizes[min(ii, len(chunk_sizes) - 1)]
+        state, rows = indicator.update(state, df.iloc[start:start + size])
+        frames.append(rows)
+        start += size
+        ii += 1
+    return pd.concat(frames, axis=0)
+
+
+class TestIndicatorUpdate(Unittest):
+
+    def customSetUp(self):
+        self.test_data = get_candles()
+
+    def assert_update_matches_compute(self, indicator):
+        expected, output_column_names, _ = indicator.compute(self.test_data.copy())
+        for chunk_sizes in [[1], [7], [300, 1], [len(self.test_data)]]:
+            result = update_in_chunks(indicator, self.test_data, chunk_sizes)
+            self.assertTrue(result.index.equals(expected.index))
+            for col in output_column_names.values():
+                np.testing.assert_allclose(result[col].to_numpy(dtype=float),
+                                           expected[col].to_numpy(dtype=float),
+                                           rtol=1e-9, atol=1e-9, equal_nan=True,
+                                           err_msg=f"{indicator.__class__.__name__} {col} {chunk_sizes}")
+
+    def test_moving_averages(self):
+        for ma_type in ["SMA", "EMA", "WMA"]:
+            indicator = MAIndicator(period=22, ma_type=ma_type)
+            self.assertTrue(indicator.supports_update())
+            self.assert_update_matches_compute(indicator)
+
+    def test_atr(self):
+        self.assert_update_matches_compute(ATRIndicator(period=14))
+
+    def test_rsi(self):
+        self.assert_update_matches_compute(RSIIndicator(period=14))
+
+    def test_donchian(self):
+        self.assert_update_matches_compute(DonchianIndicator(period=15))
+
+    def test_heikinashi(self):
+        self.assert_update_matches_compute(HeikinAshiIndicator())
+
+    def test_bounded_lookback_recomputes_over_history(self):
+        # Falls back to recomputing the rows of the look-back only
+        self.assert_update_matches_compute(SlopeIndicator("close", shift=3))
+
+    def test_pipeline(self):
+        pipeline = IndicatorPipeline([(MAIndicator(period=10, ma_type="EMA"), None, None),
+                                      (RSIIndicator(period=14), None, None),
+                                      (DonchianIndicator(period=15), None, None)])
+        self.assertTrue(pipeline.supports_update())
+        expected = pipeline.compute(self.test_data.copy())[0]
+        result = update_in_chunks(pipeline, self.test_data, [5])
+        for col in expected.columns:
+            np.testing.assert_allclose(result[col].to_numpy(dtype=float),
+                                       expected[col].to_numpy(dtype=float),
+                                       rtol=1e-9, atol=1e-9, equal_nan=True, err_msg=col)
+
+    def test_unbounded_lookback_is_refused(self):
+        indicator = ADXIndicator()
+        self.assertFalse(indicator.supports_update())
+        self.assertFalse(MAIndicator(ma_type="DEMA").supports_update())
+        self.assertFalse(IndicatorPipeline([(RSIIndicator(), None, None),
+                                            (indicator, None, None)]).supports_update())
+        with self.assertRaises(ValueError):
+            indicator.update(None, self.test_data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import datetime
+
+import pandas as pd
+import numpy as np
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.ds import TransactionType
+from quaintscience.trader.core.util import datetime_index_to_ns
+from quaintscience.trader.core.ledger import (PnLLedger,
+                                              GrowableColumns,
+                                              get_drawdown,
+                                              get_periodic_pnl)
+
+
+class TestPnLLedger(Unittest):
+
+    def customSetUp(self):
+        self.index = pd.date_range("2023-01-02 09:15", periods=8, freq="1min")
+        self.timestamps = datetime_index_to_ns(self.index)
+        self.closes = np.array([100., 101., 99., 104., 103., 106., 105., 107.])
+        # (bar, signed quantity, price, charges)
+        self.fills = [(1, 10, 100.5, 2.), (3, 5, 104., 1.), (5, -15, 106., 3.), (6, -4, 105., 0.5)]
+        self.ledger = PnLLedger()
+        for bar, quantity, price, charges in self.fills:
+            self.ledger.record_fill("INFY:NSE", self.index[bar], quantity, price, charges)
+
+    def get_manual_pnl(self) -> list[float]:
+        """Cash, position and charges walked bar by bar"""
+        pnl, cash, position, paid = [], 0., 0., 0.
+        for bar, close in enumerate(self.closes):
+            for fill_bar, quantity, price, charges in self.fills:
+                if fill_bar == bar:
+                    cash -= quantity * price
+                    position += quantity
+                    paid += charges
+            pnl.append(cash + position * close - paid)
+        return pnl
+
+    def test_mark_to_market(self):
+        pnl = self.ledger.mark_to_market("INFY:NSE", self.timestamps, self.closes)
+        np.testing.assert_allclose(pnl, self.get_manual_pnl())
+        # Flat after the closing sell, the P&L of the trade is realized
+        self.assertAlmostEqual(pnl[5], 15 * 106. - 10 * 100.5 - 5 * 104. - 6.)
+
+    def test_positions_at(self):
+        quantity, cash_flow, charges = self.ledger.get_positions_at("INFY:NSE", self.timestamps)
+        np.testing.assert_array_equal(quantity, [0, 10, 10, 15, 15, 0, -4, -4])
+        np.testing.assert_array_equal(charges, [0., 2., 2., 3., 3., 6., 6.5, 6.5])
+        self.assertEqual(cash_flow[1], -1005.)
+        # Timestamps between bars see the fills up to them
+        quantity, _, _ = self.ledger.get_positions_at("INFY:NSE", self.timestamps[3:4] + 30 * 10 ** 9)
+        np.testing.assert_array_equal(quantity, [15])
+
+    def test_unknown_instrument(self):
+        pnl = self.ledger.mark_to_market("TCS:NSE", self.timestamps, self.closes)
+        np.testing.assert_array_equal(pnl, np.zeros(len(self.index)))
+        self.assertEqual(len(self.ledger.get_fills("TCS:NSE")), 0)
+
+    def test_fills(self):
+        fills = self.ledger.get_fills("INFY:NSE")
+        self.assertTrue(fills.index.equals(self.index[[1, 3, 5, 6]]))
+        self.assertEqual(fills["quantity"].tolist(), [10, 5, -15, -4])
+        self.assertEqual(fills["charges"].sum(), 6.5)
+
+    def test_trades(self):
+        self.ledger.record_trade("o1", self.index[1], self.index[5], TransactionType.BUY, 80.,
+                                 key="INFY:NSE", entry_price=100.5, exit_price=106., quantity=10)
+        self.ledger.record_trade("o2", self.index[6], None, TransactionType.SELL, -2.)
+        self.ledger.record_trade("o1", self.index[1], self.index[5], TransactionType.BUY, 79.)
+        trades = self.ledger.get_trades()
+        self.assertEqual(trades["order_id"].tolist(), ["o1", "o2"])
+        self.assertEqual(trades["pnl"].tolist(), [79., -2.])
+        self.assertEqual(trades["transaction_type"].tolist(), ["buy", "sell"])
+        self.assertEqual(trades["entry_time"].iloc[0], self.index[1])
+        self.assertTrue(pd.isna(trades["exit_time"].iloc[1]))
+        self.ledger.clear_trades()
+        self.assertEqual(len(self.ledger.get_trades()), 0)
+
+    def test_growable_columns(self):
+        columns = GrowableColumns({"value": np.int64}, capacity=2)
+        for ii in range(5):
+            self.assertEqual(columns.append(value=ii), ii)
+        self.assertEqual(len(columns), 5)
+        self.assertEqual(columns["value"].tolist(), [0, 1, 2, 3, 4])
+
+
+class TestEquityCurves(Unittest):
+
+    def test_drawdown(self):
+        equity = pd.Series([-5., 10., 4., 12., 0.])
+        self.assertEqual(get_drawdown(equity).tolist(), [-5., 0., -6., 0., -12.])
+
+    def test_periodic_pnl(self):
+        index = pd.DatetimeIndex([datetime.datetime(2023, 1, 2, 10), datetime.datetime(2023, 1, 2, 15),
+                                  datetime.datetime(2023, 1, 3, 11), datetime.datetime(2023, 1, 4, 11)])
+        periodic = get_periodic_pnl(pd.Series([5., 8., 3., 10.], index=index), "1D")
+        self.assertEqual(periodic.tolist(), [8., -5., 7.])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+from concurrent.futures import ProcessPoolExecutor
+import unittest
+import resource
+import time
+import os
+
+import numpy as np
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.ml.lorentzian import LorentzianClassificationIndicator
+
+
+def reference_lorentzian_predictions(features, y_train_array, maxBarsBackIndex, max_bars_back, neighbors_count):
+    """Bar by bar neighbor scan the batched LorentzianClassificationIndicator must match"""
+    n = features.shape[1]
+    size = n - maxBarsBackIndex
+    prediction = np.zeros(n, dtype=np.int64)
+    predictions, distances = [], []
+    for bar_index in range(maxBarsBackIndex, n):
+        row = np.zeros(size)
+        for feature in features:
+            row += np.log(1 + np.abs(feature[bar_index] - feature[:size]))
+        lastDistance = -1.0
+        for i, d in enumerate(row[:min(max_bars_back, bar_index + 1)]):
+            if d >= lastDistance and i % 4:
+                lastDistance = d
+                distances.append(d)
+                predictions.append(round(y_train_array[i]))
+                if len(predictions) > neighbors_count:
+                    lastDistance = distances[round(neighbors_count * 3 / 4)]
+                    distances.pop(0)
+                    predictions.pop(0)
+        prediction[bar_index] = sum(predictions)
+    return prediction
+
+
+def get_lorentzian_inputs(bars: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    features = rng.uniform(0, 1, (5, bars))
+    features[:, :20] = np.nan
+    y_train_array = rng.integers(-1, 2, bars)
+    return features, y_train_array
+
+
+def run_lorentzian_benchmark(batched: bool, bars: int, max_bars_back: int):
+    """Runtime and peak RSS growth (MB) of the neighbor search, meant to run in a fresh process"""
+    features, y_train_array = get_lorentzian_inputs(bars)
+    indicator = LorentzianClassificationIndicator(max_bars_back=max_bars_back)
+    maxBarsBackIndex = max(bars - max_bars_back, 0)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if batched:
+        indicator.get_lorentzian_predictions(features, y_train_array, maxBarsBackIndex)
+    else:
+        reference_lorentzian_predictions(features, y_train_array, maxBarsBackIndex,
+                                         max_bars_back, indicator.neighbors_count)
+    elapsed = time.perf_counter() - start
+    return elapsed, (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) / 1024
+
+
+class TestLorentzianClassification(Unittest):
+
+    def test_predictions_match_reference(self):
+        for bars, max_bars_back, neighbors_count, knn_memory_limit_mb in [(1500, 500, 8, 16.0),
+                                                                          (1200, 2000, 8, 0.05),
+                                                                          (2000, 800, 16, 1.0)]:
+            features, y_train_array = get_lorentzian_inputs(bars)
+            indicator = LorentzianClassificationIndicator(max_bars_back=max_bars_back,
+                                                          neighbors_count=neighbors_count,
+                                                          knn_memory_limit_mb=knn_memory_limit_mb)
+            maxBarsBackIndex = max(bars - max_bars_back, 0)
+            np.testing.assert_array_equal(indicator.get_lorentzian_predictions(features, y_train_array, maxBarsBackIndex),
+                                          reference_lorentzian_predictions(features, y_train_array, maxBarsBackIndex,
+                                                                           max_bars_back, neighbors_count))
+
+    @unittest.skipUnless(os.environ.get("QTRADE_PY_UNITTEST_BENCHMARKS"), "benchmarks run on request only")
+    def test_predictions_benchmark(self):
+        bars = int(os.environ.get("QTRADE_LORENTZIAN_BENCHMARK_BARS", 100000))
+        max_bars_back = int(os.environ.get("QTRADE_LORENTZIAN_BENCHMARK_MAX_BARS_BACK", 5000))
+        results = {}
+        for batched in [False, True]:
+            # A fresh process per run so that peak RSS is not shared between them
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                results[batched] = executor.submit(run_lorentzian_benchmark, batched, bars, max_bars_back).result()
+            self.logger.info(f"{'Batched' if batched else 'Bar by bar'} neighbor search on {bars} bars "
+                             f"(max_bars_back={max_bars_back}): {results[batched][0]:.2f}s, "
+                             f"peak RSS +{results[batched][1]:.1f} MB")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.ds import Order, OrderState, OrderType, TransactionType
+from quaintscience.trader.core.orderbook import OrderBook
+from quaintscience.trader.core.matching import (OrderMatchingEngine,
+                                                get_intrabar_path,
+                                                nearest_extreme_first,
+                                                candle_direction)
+
+
+class TestOrderMatchingEngine(Unittest):
+
+    def customSetUp(self):
+        self.order_book = OrderBook()
+        self.engine = OrderMatchingEngine(self.order_book)
+
+    def place(self, transaction_type: TransactionType, order_type: OrderType,
+              limit_price: float = None, trigger_price: float = None) -> Order:
+        order = Order(scrip_id="INFY", exchange_id="NSE", scrip="INFY", exchange="NSE",
+                      transaction_type=transaction_type, order_type=order_type,
+                      limit_price=limit_price, trigger_price=trigger_price)
+        self.order_book.add(order)
+        self.engine.add(order)
+        return order
+
+    def test_crossed_orders_in_placement_order(self):
+        far_sell = self.place(TransactionType.SELL, OrderType.LIMIT, limit_price=120.)
+        sell = self.place(TransactionType.SELL, OrderType.LIMIT, limit_price=104.)
+        stop = self.place(TransactionType.SELL, OrderType.SL_MARKET, trigger_price=97.)
+        buy = self.place(TransactionType.BUY, OrderType.LIMIT, limit_price=99.)
+        market = self.place(TransactionType.BUY, OrderType.MARKET)
+        self.assertEqual(self.engine.pop_crossed_orders("INFY", "NSE", low=96., high=105.),
+                         [sell, stop, buy, market])
+        self.assertEqual(self.engine.pop_crossed_orders("INFY", "NSE", low=96., high=105.), [])
+        self.assertEqual(self.engine.pop_crossed_orders("INFY", "NSE", low=100., high=121.), [far_sell])
+        self.assertEqual(self.engine.pop_crossed_orders("TCS", "NSE", low=0., high=1000.), [])
+
+    def test_next_order_follows_the_path(self):
+        self.place(TransactionType.BUY, OrderType.MARKET)
+        near = self.place(TransactionType.SELL, OrderType.LIMIT, limit_price=102.)
+        far = self.place(TransactionType.BUY, OrderType.SL_LIMIT, trigger_price=104., limit_price=105.)
+        dip = self.place(TransactionType.BUY, OrderType.LIMIT, limit_price=98.)
+        market, price = self.engine.pop_next_order("INFY", "NSE", 100., 105.)
+        self.assertEqual((market.order_type, price), (OrderType.MARKET, 100.))
+        self.assertEqual(self.engine.pop_next_order("INFY", "NSE", 100., 105.), (near, 102.))
+        self.assertEqual(self.engine.pop_next_order("INFY", "NSE", 100., 105.), (far, 104.))
+        self.assertIsNone(self.engine.pop_next_order("INFY", "NSE", 100., 105.))
+        self.assertEqual(self.engine.pop_next_order("INFY", "NSE", 105., 95.), (dip, 98.))
+
+    def test_gap_fills_at_the_open(self):
+        stop = self.place(TransactionType.SELL, OrderType.SL_MARKET, trigger_price=99.)
+        # The open gapped below the trigger, the order is reached at the open
+        self.assertEqual(self.engine.pop_next_order("INFY", "NSE", 95., 95.), (stop, 95.))
+
+    def test_stale_entries_are_skipped(self):
+        cancelled = self.place(TransactionType.BUY, OrderType.LIMIT, limit_price=99.)
+        moved = self.place(TransactionType.BUY, OrderType.LIMIT, limit_price=98.)
+        replaced = self.place(TransactionType.BUY, OrderType.LIMIT, limit_price=97.)
+        cancelled.state = OrderState.CANCELLED
+        moved.limit_price = 90.
+        self.order_book.replace(replaced.copy())
+        self.assertEqual(self.engine.pop_crossed_orders("INFY", "NSE", low=95., high=101.), [])
+        self.assertEqual(self.engine.pop_crossed_orders("INFY", "NSE", low=89., high=101.), [moved])
+
+    def test_intrabar_paths(self):
+        self.assertEqual(nearest_extreme_first(100., 101., 95., 97.), [100., 101., 95., 97.])
+        self.assertEqual(nearest_extreme_first(100., 105., 99., 103.), [100., 99., 105., 103.])
+        self.assertEqual(candle_direction(100., 105., 95., 103.), [100., 95., 105., 103.])
+        self.assertIs(get_intrabar_path("nearest_extreme_first"), nearest_extreme_first)
+        self.assertIsNone(get_intrabar_path("placement"))
+        self.assertIs(get_intrabar_path(candle_direction), candle_direction)
+
+
+if __name__ == "__main__":
+    unittest.main()
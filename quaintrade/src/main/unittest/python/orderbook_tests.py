@@ -0,0 +1,85 @@
+import unittest
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.ds import Order, OrderState, TransactionType
+from quaintscience.trader.core.orderbook import OrderBook
+
+
+def get_order(scrip: str = "INFY", exchange: str = "NSE", **kwargs) -> Order:
+    return Order(scrip_id=scrip, exchange_id=exchange, scrip=scrip, exchange=exchange, **kwargs)
+
+
+class TestOrderBook(Unittest):
+
+    def customSetUp(self):
+        self.parent = get_order()
+        self.child = get_order(parent_order_id=self.parent.order_id, group_id="g1",
+                               transaction_type=TransactionType.SELL)
+        self.other = get_order(scrip="TCS", group_id="g1")
+        self.book = OrderBook([self.parent, self.child, self.other])
+
+    def test_lookups(self):
+        self.assertEqual(len(self.book), 3)
+        self.assertIn(self.child.order_id, self.book)
+        self.assertIs(self.book.get(self.child.order_id), self.child)
+        self.assertIsNone(self.book.get("missing"))
+        self.assertEqual(self.book.get_orders(parent_order_id=self.parent.order_id), [self.child])
+        self.assertEqual(self.book.get_orders(group_id="g1"), [self.child, self.other])
+        self.assertEqual(self.book.get_orders(scrip="INFY", exchange="NSE"), [self.parent, self.child])
+        self.assertEqual(self.book.get_orders(group_id="g1", scrip="TCS", exchange="NSE"), [self.other])
+        self.assertEqual(list(self.book), [self.parent, self.child, self.other])
+
+    def test_state_changes_are_picked_up_lazily(self):
+        self.child.state = OrderState.COMPLETED
+        self.parent.state = OrderState.CANCELLED
+        self.assertEqual(self.book.get_pending_orders("INFY", "NSE"), [])
+        self.assertEqual(self.book.get_orders(state=OrderState.PENDING), [self.other])
+        self.assertEqual(self.book.get_orders(state=OrderState.COMPLETED), [self.child])
+        self.assertEqual(self.book.get_orders(state=OrderState.CANCELLED), [self.parent])
+        self.assertNotIn(("INFY", "NSE"), self.book.pending_by_instrument)
+
+    def test_state_results_keep_placement_order(self):
+        self.other.state = OrderState.COMPLETED
+        self.book.update_state(self.other)
+        self.parent.state = OrderState.COMPLETED
+        self.book.update_state(self.parent)
+        self.assertEqual(self.book.get_orders(state=OrderState.COMPLETED), [self.parent, self.other])
+
+    def test_replace(self):
+        replacement = self.child.copy()
+        replacement.state = OrderState.CANCELLED
+        self.book.add(replacement)
+        self.assertEqual(len(self.book), 3)
+        self.assertIs(self.book.get(self.child.order_id), replacement)
+        self.assertEqual(self.book.get_orders(group_id="g1"), [replacement, self.other])
+        self.assertEqual(self.book.get_pending_orders("INFY", "NSE"), [self.parent])
+        with self.assertRaises(KeyError):
+            self.book.replace(get_order())
+
+    def test_remove_orders(self):
+        self.child.state = OrderState.COMPLETED
+        self.other.state = OrderState.REJECTED
+        self.assertEqual(self.book.remove_orders([OrderState.COMPLETED, OrderState.REJECTED]), 2)
+        self.assertEqual(list(self.book), [self.parent])
+        self.assertEqual(self.book.get_orders(group_id="g1"), [])
+        self.assertEqual(self.book.positions, {self.parent.order_id: 0})
+        self.assertEqual(self.book.remove_orders([OrderState.CANCELLED]), 0)
+
+    def test_version(self):
+        version = self.book.version
+        self.assertEqual(version, 3)
+        self.book.update_state(self.child)
+        self.assertEqual(self.book.version, version)
+        self.child.state = OrderState.COMPLETED
+        self.book.update_state(self.child)
+        self.assertEqual(self.book.version, version + 1)
+        self.book.replace(self.child.copy())
+        self.assertEqual(self.book.version, version + 2)
+        self.book.remove_orders([OrderState.COMPLETED])
+        self.assertEqual(self.book.version, version + 3)
+        self.book.remove_orders([OrderState.COMPLETED])
+        self.assertEqual(self.book.version, version + 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
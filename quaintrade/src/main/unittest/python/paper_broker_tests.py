@@ -0,0 +1,110 @@
+import unittest
+import datetime
+import tempfile
+import shutil
+
+import pandas as pd
+import numpy as np
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.ds import (Order, OrderState, OrderType, OHLCStorageType,
+                                          TransactionType)
+from quaintscience.trader.core.roles import HistoricDataProvider
+from quaintscience.trader.core.util import get_key_from_scrip_and_exchange
+from quaintscience.trader.core.persistence.sqlite.common import sqlite_connections
+from quaintscience.trader.integration.paper import PaperBroker
+
+
+class SyntheticDataProvider(HistoricDataProvider):
+    """Serves the candles stored under data_path, never downloads"""
+
+    ProviderName = "synthetic"
+
+    def init(self):
+        pass
+
+    def download_historic_data(self, *args, **kwargs) -> bool:
+        return True
+
+
+def get_flat_candles(start: str, periods: int, price: float) -> pd.DataFrame:
+    index = pd.date_range(start, periods=periods, freq="1min")
+    return pd.DataFrame({"open": price, "high": price + 0.5, "low": price - 0.5, "close": price,
+                         "volume": 10, "oi": 0},
+                        index=pd.DatetimeIndex(index.strftime("%Y-%m-%d %H:%M:%S"), name="date"))
+
+
+class TestPaperBrokerFillInterval(Unittest):
+
+    def customSetUp(self):
+        self.data_path = tempfile.mkdtemp()
+        self.provider = SyntheticDataProvider(data_path=self.data_path)
+        self.key = get_key_from_scrip_and_exchange("NIFTY", "NSE")
+
+    def tearDown(self):
+        sqlite_connections.close()
+        shutil.rmtree(self.data_path, ignore_errors=True)
+
+    def put(self, storage_type: OHLCStorageType, candles: pd.DataFrame):
+        self.provider.get_storage("NIFTY", "NSE", storage_type).put("NIFTY", "NSE", candles)
+
+    def get_broker(self, **kwargs) -> PaperBroker:
+        broker = PaperBroker(audit_records_path=self.data_path,
+                             data_provider=self.provider,
+                             instruments=[{"scrip": "NIFTY", "exchange": "NSE"}],
+                             historic_context_from=datetime.datetime(2023, 1, 2),
+                             historic_context_to=datetime.datetime(2023, 1, 2, 23, 59),
+                             interval="10min",
+                             disable_state_persistence=True,
+                             **kwargs)
+        broker.init()
+        return broker
+
+    def test_stop_fills_on_the_candle_crossing_it(self):
+        candles = get_flat_candles("2023-01-02 09:15", 120, 100.)
+        candles.loc["2023-01-02 09:53:00", "low"] = 95.
+        self.put(OHLCStorageType.PERM, candles)
+
+        results = {}
+        for fill_interval in ["1min", None]:
+            broker = self.get_broker(fill_interval=fill_interval)
+            # The bar before the one the strategy acts on, as Bot.backtest does
+            broker.set_current_time(datetime.datetime(2023, 1, 2, 9, 35), traverse=False)
+            order = broker.place_order(Order(scrip_id="NIFTY", exchange_id="NSE", scrip="NIFTY", exchange="NSE",
+                                             transaction_type=TransactionType.SELL,
+                                             order_type=OrderType.SL_MARKET,
+                                             trigger_price=97., limit_price=97.))
+            broker.set_current_time(datetime.datetime(2023, 1, 2, 9, 45), traverse=True)
+            self.assertEqual(order.state, OrderState.COMPLETED)
+            results[fill_interval] = order.timestamp
+        self.assertEqual(results["1min"], pd.Timestamp("2023-01-02 09:53:00"))
+        # On 10min candles only the bar is known
+        self.assertEqual(results[None], pd.Timestamp("2023-01-02 09:45:00"))
+
+    def test_first_time_aligns_to_the_last_fill_candle_of_the_bar(self):
+        self.put(OHLCStorageType.PERM, get_flat_candles("2023-01-02 09:15", 120, 100.))
+        broker = self.get_broker(fill_interval="1min")
+        broker.set_current_time(datetime.datetime(2023, 1, 2, 9, 35), traverse=False)
+        self.assertEqual(broker.data[self.key].index[broker.idx[self.key]],
+                         pd.Timestamp("2023-01-02 09:44:00"))
+        broker.set_current_time(datetime.datetime(2023, 1, 2, 9, 45), traverse=True)
+        self.assertEqual(broker.current_datetime(), pd.Timestamp("2023-01-02 09:54:00"))
+
+    def test_blend_prefers_perm_data(self):
+        self.put(OHLCStorageType.PERM, get_flat_candles("2023-01-02 09:15", 30, 100.))
+        self.put(OHLCStorageType.LIVE, get_flat_candles("2023-01-02 09:40", 20, 200.))
+        data = self.get_broker(fill_interval="1min", fill_storage_type="blend").data[self.key]
+        self.assertEqual(len(data), 45)
+        self.assertTrue((data.loc[:"2023-01-02 09:44:00", "close"] == 100.).all())
+        self.assertTrue((data.loc["2023-01-02 09:45:00":, "close"] == 200.).all())
+        self.assertTrue(data.index.is_monotonic_increasing)
+
+        data = self.get_broker(fill_interval="1min", fill_storage_type="live").data[self.key]
+        self.assertEqual(len(data), 20)
+        self.assertTrue(np.all(data["close"] == 200.))
+        with self.assertRaises(ValueError):
+            self.get_broker(fill_interval="1min", fill_storage_type="ticks")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import datetime
+import tempfile
+import shutil
+import os
+
+import pandas as pd
+import numpy as np
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.persistence.parquet.ohlc import ParquetOHLCStorage
+
+
+def get_bars(index: pd.DatetimeIndex, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    count = len(index)
+    return pd.DataFrame({"open": rng.random(count) + 100,
+                         "high": rng.random(count) + 101,
+                         "low": rng.random(count) + 99,
+                         "close": rng.random(count) + 100,
+                         "volume": rng.integers(0, 1000, count),
+                         "oi": np.zeros(count, dtype=np.int64)},
+                        index=index.rename("date"))
+
+
+class TestParquetOHLCStorage(Unittest):
+
+    def customSetUp(self):
+        self.path = tempfile.mkdtemp()
+        self.storage = ParquetOHLCStorage(self.path, row_group_size=16)
+        # Spans a month boundary, so two month files
+        self.data = get_bars(pd.date_range("2022-01-31 15:00", "2022-02-01 10:00", freq="1min"))
+        self.storage.put("X", "NSE", self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def get_all(self, scrip: str = "X") -> pd.DataFrame:
+        return self.storage.get(scrip, "NSE", datetime.datetime(2022, 1, 1), datetime.datetime(2022, 3, 1))
+
+    def assert_frame_equal(self, data: pd.DataFrame, expected: pd.DataFrame):
+        pd.testing.assert_frame_equal(data, expected, check_freq=False, check_index_type=False)
+        self.assertTrue(data.index.equals(expected.index))
+
+    def test_round_trip(self):
+        self.assert_frame_equal(self.get_all(), self.data)
+        self.assertEqual(sorted(os.listdir(self.storage.get_instrument_path("X", "NSE"))),
+                         ["2022-01.parquet", "2022-02.parquet"])
+        data = self.storage.get("X", "NSE", datetime.datetime(2022, 1, 31, 23, 0),
+                                datetime.datetime(2022, 2, 1, 9, 30))
+        self.assert_frame_equal(data, self.data.loc["2022-01-31 23:00":"2022-02-01 09:30"])
+
+    def test_conflict_resolution(self):
+        update = self.data.iloc[5:15] * 2
+        update[["volume", "oi"]] = update[["volume", "oi"]].astype(np.int64)
+        self.storage.put("X", "NSE", update, conflict_resolution_type="IGNORE")
+        self.assert_frame_equal(self.get_all(), self.data)
+
+        self.storage.put("X", "NSE", update, conflict_resolution_type="REPLACE")
+        expected = self.data.copy()
+        expected.iloc[5:15] = update
+        self.assert_frame_equal(self.get_all(), expected)
+
+    def test_new_bars_are_merged_in_date_order(self):
+        later = get_bars(pd.date_range("2022-02-01 10:01", periods=5, freq="1min"), seed=1)
+        earlier = get_bars(pd.date_range("2022-01-31 14:00", periods=5, freq="1min"), seed=2)
+        self.storage.put("X", "NSE", pd.concat([later, earlier]))
+        self.assert_frame_equal(self.get_all(), pd.concat([earlier, self.data, later]))
+
+    def test_missing_instrument(self):
+        data = self.get_all(scrip="Y")
+        self.assertEqual(len(data), 0)
+        self.assertEqual(list(data.columns), ["open", "high", "low", "close", "volume", "oi"])
+        self.assertIsNone(self.storage.get_first_date("Y", "NSE"))
+
+    def test_first_date_and_clear(self):
+        self.assertEqual(self.storage.get_first_date("X", "NSE"), datetime.datetime(2022, 1, 1))
+        self.assertEqual(len(self.storage.get("X", "NSE", None, None)), len(self.data))
+        self.storage.clear_data("X", "NSE")
+        self.assertFalse(os.path.exists(self.storage.get_instrument_path("X", "NSE")))
+        self.assertEqual(len(self.get_all()), 0)
+
+    def test_wall_time_and_autofix(self):
+        index = pd.date_range("2022-03-01 09:15", periods=3, freq="1min", tz="Asia/Kolkata")
+        bars = get_bars(index)
+        bars.loc[bars.index[1], ["low", "high"]] = 0.
+        self.storage.put("X", "NSE", bars)
+        data = self.storage.get("X", "NSE", datetime.datetime(2022, 3, 1), datetime.datetime(2022, 3, 2))
+        self.assertTrue(data.index.equals(pd.DatetimeIndex(index.tz_localize(None), name="date")))
+        self.assertEqual(data["low"].iloc[1], min(bars["open"].iloc[1], bars["close"].iloc[1]))
+        self.assertEqual(data["high"].iloc[1], max(bars["open"].iloc[1], bars["close"].iloc[1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+import pandas as pd
+import numpy as np
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.rolling import rolling_max, rolling_min, centered
+
+
+class TestRolling(Unittest):
+
+    def customSetUp(self):
+        rng = np.random.default_rng(0)
+        self.values = rng.normal(0, 1, 200)
+        self.values[[0, 17, 18, 95, 199]] = np.nan
+        # Ties, so equal extremes within a window do not matter either
+        self.values[50:60] = 1.
+
+    def assert_matches_pandas(self, values: np.ndarray, window: int):
+        series = pd.Series(values)
+        for func, method in [(rolling_max, "max"), (rolling_min, "min")]:
+            rolled = func(values, window)
+            np.testing.assert_array_equal(rolled, getattr(series.rolling(window), method)().to_numpy(),
+                                          err_msg=f"{method} {window}")
+            np.testing.assert_array_equal(centered(rolled, window),
+                                          getattr(series.rolling(window, center=True), method)().to_numpy(),
+                                          err_msg=f"centered {method} {window}")
+
+    def test_matches_pandas(self):
+        for window in [1, 2, 3, 4, 7, 10, 64, 199, 200]:
+            self.assert_matches_pandas(self.values, window)
+
+    def test_windows_larger_than_data(self):
+        for window in [201, 500]:
+            self.assert_matches_pandas(self.values, window)
+        self.assert_matches_pandas(np.array([]), 3)
+        self.assert_matches_pandas(np.array([1., 2.]), 3)
+
+    def test_without_nans(self):
+        values = np.cumsum(np.random.default_rng(1).normal(0, 1, 1000))
+        for window in [5, 20, 333]:
+            self.assert_matches_pandas(values, window)
+
+    def test_window_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            rolling_max(self.values, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+import tempfile
+import shutil
+import pickle
+import os
+
+import pandas as pd
+import numpy as np
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.shared_candles import SharedCandleStore
+
+
+class TestSharedCandleStore(Unittest):
+
+    def customSetUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = SharedCandleStore(path=self.path)
+        index = pd.date_range("2023-01-02 09:15", periods=1000, freq="1min", unit="ns", name="date")
+        self.data = pd.DataFrame(np.random.default_rng(0).random((1000, 4)) + 100,
+                                 index=index, columns=["open", "high", "low", "close"])
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def loader(self) -> pd.DataFrame:
+        self.calls.append(1)
+        return self.data
+
+    def test_loaded_once(self):
+        key = ("X", "NSE", "1min")
+        frame = self.store.get(key, self.loader)
+        pd.testing.assert_frame_equal(frame, self.data, check_freq=False)
+        pd.testing.assert_frame_equal(self.store.get(key, self.loader), self.data, check_freq=False)
+        # Another process finds the file
+        other = SharedCandleStore(path=self.path)
+        pd.testing.assert_frame_equal(other.get(key, self.loader), self.data, check_freq=False)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_frames_share_the_mapping(self):
+        key = ("X", "NSE", "1min")
+        frame = self.store.get(key, self.loader)
+        attached = self.store.attached[key]
+        self.assertTrue(np.shares_memory(frame["close"].to_numpy(), attached["close"].to_numpy()))
+        frame["signal"] = 1.
+        self.assertNotIn("signal", attached.columns)
+        self.assertNotIn("signal", self.store.get(key, self.loader).columns)
+
+    def test_other_key_in_file_is_ignored(self):
+        self.store.write(("X",), self.data)
+        shutil.copy(self.store.get_filepath(("X",)), self.store.get_filepath(("Y",)))
+        self.assertIsNone(self.store.attach(("Y",)))
+        self.assertIsNone(self.store.attach(("Z",)))
+        with open(self.store.get_filepath(("Z",)), "wb") as fid:
+            fid.write(b"garbage")
+        self.assertIsNone(self.store.attach(("Z",)))
+
+    def test_empty_frame(self):
+        frame = self.store.get(("X",), lambda: self.data.iloc[:0])
+        self.assertEqual(len(frame), 0)
+        self.assertEqual(list(frame.columns), list(self.data.columns))
+        self.assertEqual(frame.index.name, "date")
+        self.assertTrue(isinstance(frame.index, pd.DatetimeIndex))
+
+    def test_pickling_drops_attached_frames(self):
+        self.store.get(("X",), self.loader)
+        restored = pickle.loads(pickle.dumps(self.store))
+        self.assertEqual(restored.attached, {})
+        self.assertEqual(len(self.store.attached), 1)
+        pd.testing.assert_frame_equal(restored.get(("X",), self.loader), self.data, check_freq=False)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_clear(self):
+        self.store.get(("X",), self.loader)
+        self.store.clear()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(self.store.attached, {})
+        self.store.get(("X",), self.loader)
+        self.assertEqual(len(self.calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import tempfile
+import shutil
+import sqlite3
+import os
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.persistence.sqlite.common import SqliteConnectionRegistry
+
+
+class TestSqliteConnectionRegistry(Unittest):
+
+    def customSetUp(self):
+        self.dirpath = tempfile.mkdtemp()
+        self.path = os.path.join(self.dirpath, "data.sqlite")
+        self.registry = SqliteConnectionRegistry()
+
+    def tearDown(self):
+        self.registry.close()
+        shutil.rmtree(self.dirpath, ignore_errors=True)
+
+    def test_one_connection_per_path_and_mode(self):
+        writable = self.registry.get(self.path)
+        self.assertIs(self.registry.get(self.path), writable)
+        # Relative and absolute paths to the same file share the connection
+        self.assertIs(self.registry.get(os.path.relpath(self.path)), writable)
+        self.assertFalse(writable.read_only)
+        self.assertEqual(writable.connection.execute("PRAGMA journal_mode;").fetchone()[0], "wal")
+
+        read_only = self.registry.get(self.path, read_only=True)
+        self.assertIsNot(read_only, writable)
+        self.assertTrue(read_only.read_only)
+        self.assertIs(self.registry.get(self.path, read_only=True), read_only)
+        with self.assertRaises(sqlite3.OperationalError):
+            read_only.connection.execute("CREATE TABLE t (x INTEGER);")
+
+        other = self.registry.get(os.path.join(self.dirpath, "other.sqlite"))
+        self.assertIsNot(other, writable)
+
+    def test_read_only_missing_file(self):
+        handle = self.registry.get(self.path, read_only=True)
+        self.assertFalse(handle.read_only)
+        handle.connection.execute("CREATE TABLE t (x INTEGER);")
+        self.assertTrue(os.path.exists(self.path))
+        # Once the file exists a read-only connection is opened
+        self.assertTrue(self.registry.get(self.path, read_only=True).read_only)
+
+    def test_reset_after_fork(self):
+        handle = self.registry.get(self.path)
+        # As seen by a forked process
+        self.registry.pid = -1
+        forked = self.registry.get(self.path)
+        self.assertIsNot(forked, handle)
+        self.assertEqual(self.registry.pid, os.getpid())
+        self.assertIs(self.registry.get(self.path), forked)
+        handle.connection.close()
+
+    def test_close(self):
+        handle = self.registry.get(self.path)
+        other = self.registry.get(os.path.join(self.dirpath, "other.sqlite"))
+        self.registry.close(self.path)
+        self.assertIsNone(handle.connection)
+        self.assertIsNotNone(other.connection)
+        reopened = self.registry.get(self.path)
+        self.assertIsNot(reopened, handle)
+        self.registry.close()
+        self.assertIsNone(reopened.connection)
+        self.assertIsNone(other.connection)
+        self.assertEqual(self.registry.connections, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+import unittest
+import datetime
+import tempfile
+import shutil
+import sqlite3
+import os
+
+import pandas as pd
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.persistence.sqlite.common import sqlite_connections, get_date_text
+from quaintscience.trader.core.persistence.sqlite.ohlc import SqliteOHLCStorage
+from quaintscience.trader.core.persistence.sqlite.migration import migrate_sqlite_dates, has_date_index
+
+
+def get_bars(index: pd.DatetimeIndex) -> pd.DataFrame:
+    count = len(index)
+    return pd.DataFrame({"open": [100. + ii for ii in range(count)],
+                         "high": [102. + ii for ii in range(count)],
+                         "low": [99. + ii for ii in range(count)],
+                         "close": [101. + ii for ii in range(count)],
+                         "volume": list(range(count)),
+                         "oi": [0] * count},
+                        index=index.rename("date"))
+
+
+class TestSqliteStorage(Unittest):
+
+    def customSetUp(self):
+        self.dirpath = tempfile.mkdtemp()
+        self.path = os.path.join(self.dirpath, "X__NSE_perm.sqlite")
+
+    def tearDown(self):
+        sqlite_connections.close()
+        shutil.rmtree(self.dirpath, ignore_errors=True)
+
+    def get_storage(self, **kwargs) -> SqliteOHLCStorage:
+        return SqliteOHLCStorage(self.path, **kwargs)
+
+    def test_date_text(self):
+        self.assertEqual(get_date_text(datetime.datetime(2022, 1, 3, 9, 15)), "2022-01-03 09:15:00")
+        self.assertEqual(get_date_text(datetime.datetime(2022, 1, 3, 9, 15, 0, 250000)),
+                         "2022-01-03 09:15:00.250000")
+        self.assertEqual(get_date_text(pd.Timestamp("2022-01-03 09:15:00+05:30").to_pydatetime()),
+                         "2022-01-03 09:15:00")
+
+    def test_range_queries(self):
+        storage = self.get_storage()
+        storage.put("X", "NSE", get_bars(pd.date_range("2022-01-03 09:15", periods=10, freq="1min")))
+        data = storage.get("X", "NSE", datetime.datetime(2022, 1, 3, 9, 17),
+                           datetime.datetime(2022, 1, 3, 9, 20), "IGNORE")
+        self.assertEqual(data.index[0], pd.Timestamp("2022-01-03 09:17:00"))
+        self.assertEqual(data.index[-1], pd.Timestamp("2022-01-03 09:20:00"))
+        # to_date covers its whole second
+        data = storage.get("X", "NSE", datetime.datetime(2022, 1, 3, 9, 15),
+                           datetime.datetime(2022, 1, 3, 9, 15, 0, 500000), "IGNORE")
+        self.assertEqual(len(data), 1)
+        self.assertEqual(len(storage.get("X", "NSE", datetime.datetime(2022, 1, 4),
+                                         datetime.datetime(2022, 1, 5), "IGNORE")), 0)
+
+    def test_tz_aware_bars_are_stored_as_wall_time(self):
+        storage = self.get_storage()
+        index = pd.date_range("2022-01-03 09:15", periods=3, freq="1min", tz="Asia/Kolkata")
+        storage.put("X", "NSE", get_bars(index))
+        data = storage.get("X", "NSE", datetime.datetime(2022, 1, 3, 9, 15),
+                           datetime.datetime(2022, 1, 3, 9, 17), "IGNORE")
+        self.assertTrue(data.index.equals(pd.DatetimeIndex(index.tz_localize(None), name="date")))
+
+    def test_migration_rewrites_mixed_date_formats(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute("CREATE TABLE X__NSE (date VARCHAR(255) NOT NULL, open REAL NOT NULL, "
+                           "high REAL NOT NULL, low REAL NOT NULL, close REAL NOT NULL, "
+                           "volume INTEGER NOT NULL, oi INTEGER NOT NULL, "
+                           "PRIMARY KEY (date) ON CONFLICT REPLACE);")
+        rows = [("2022-01-03T09:15:00", 1.),
+                ("2022-01-03 09:16:00+05:30", 2.),
+                ("2022-01-03 09:17:00", 3.),
+                # Another form of a stored date, it replaces the stored row
+                ("2022-01-03T09:17:00", 4.),
+                ("2022-01-03 09:18:00.250000", 5.),
+                ("2022-01-04", 6.)]
+        connection.executemany("INSERT INTO X__NSE VALUES (?, ?, ?, ?, ?, 0, 0);",
+                               [(date, close, close, close, close) for date, close in rows])
+        connection.commit()
+        connection.close()
+
+        self.assertEqual(migrate_sqlite_dates(self.path), {"X__NSE": 4})
+        connection = sqlite3.connect(self.path)
+        try:
+            self.assertEqual(connection.execute("SELECT date, close FROM X__NSE ORDER BY date;").fetchall(),
+                             [("2022-01-03 09:15:00", 1.),
+                              ("2022-01-03 09:16:00", 2.),
+                              ("2022-01-03 09:17:00", 4.),
+                              ("2022-01-03 09:18:00.250000", 5.),
+                              ("2022-01-04 00:00:00", 6.)])
+            self.assertTrue(has_date_index(connection, "X__NSE"))
+        finally:
+            connection.close()
+        self.assertEqual(migrate_sqlite_dates(self.path), {"X__NSE": 0})
+
+        data = self.get_storage(read_only=True).get("X", "NSE", datetime.datetime(2022, 1, 3, 9, 16),
+                                                     datetime.datetime(2022, 1, 4), "IGNORE")
+        self.assertEqual(data["close"].tolist(), [2., 4., 5., 6.])
+
+
+class TestSqliteReadBars(Unittest):
+
+    def customSetUp(self):
+        self.dirpath = tempfile.mkdtemp()
+        self.storage = SqliteOHLCStorage(os.path.join(self.dirpath, "X__NSE_perm.sqlite"))
+        self.storage.put("X", "NSE", get_bars(pd.date_range("2022-01-03 09:15", periods=50, freq="1min")))
+        self.from_date = datetime.datetime(2022, 1, 3, 9, 20)
+        self.to_date = datetime.datetime(2022, 1, 3, 10, 30)
+
+    def tearDown(self):
+        sqlite_connections.close()
+        shutil.rmtree(self.dirpath, ignore_errors=True)
+
+    def get_timestamped_data(self) -> pd.DataFrame:
+        return self.storage.get_timestamped_data("X", "NSE",
+                                                 from_date=self.from_date,
+                                                 to_date=self.to_date,
+                                                 cols=["date", "open", "high", "low", "close", "volume", "oi"])
+
+    def test_same_frame_as_get_timestamped_data(self):
+        data = self.storage.read_bars("X__NSE", self.from_date, self.to_date)
+        expected = self.get_timestamped_data()
+        self.assertEqual(len(data), 45)
+        pd.testing.assert_frame_equal(data, expected, check_index_type=False)
+        self.assertTrue(data.index.equals(expected.index))
+        pd.testing.assert_frame_equal(self.storage.get("X", "NSE", self.from_date, self.to_date, "IGNORE"), data)
+
+    def test_empty_range(self):
+        data = self.storage.read_bars("X__NSE", datetime.datetime(2030, 1, 1), datetime.datetime(2030, 1, 2))
+        self.assertEqual(len(data), 0)
+        self.assertEqual(list(data.columns), ["open", "high", "low", "close", "volume", "oi"])
+        self.assertTrue(isinstance(data.index, pd.DatetimeIndex))
+
+    def test_microseconds(self):
+        # Stored in the longer normalized form
+        self.storage.put("X", "NSE", get_bars(pd.DatetimeIndex(["2022-01-03 10:05:00.250000"])))
+        data = self.storage.read_bars("X__NSE", self.from_date, self.to_date)
+        self.assertEqual(len(data), 46)
+        self.assertEqual(data.index[-1], pd.Timestamp("2022-01-03 10:05:00.250000"))
+
+    def test_other_date_forms_fall_back(self):
+        # As written by tz-aware frames before dates were normalized
+        rows = [(f"2022-01-03 09:{minute}:00+05:30", float(minute)) for minute in range(15, 25)]
+        self.storage.create_tables("Z", "NSE")
+        self.storage.connection.executemany("INSERT INTO Z__NSE VALUES (?, ?, ?, 0, ?, 5, 0);",
+                                            [(date, close, close + 1, close) for date, close in rows])
+        self.storage.connection.commit()
+        self.assertIsNone(self.storage.read_bars("Z__NSE", self.from_date, self.to_date))
+        data = self.storage.get("Z", "NSE", self.from_date, self.to_date, "IGNORE")
+        self.assertEqual(data["close"].tolist(), [20., 21., 22., 23., 24.])
+        # Fixed by autofix from the open and close
+        self.assertEqual(data["low"].tolist(), [20., 21., 22., 23., 24.])
+
+    def test_missing_file_read_only(self):
+        storage = SqliteOHLCStorage(os.path.join(self.dirpath, "Y__NSE_perm.sqlite"), read_only=True)
+        self.assertEqual(len(storage.get("Y", "NSE", self.from_date, self.to_date, "IGNORE")), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
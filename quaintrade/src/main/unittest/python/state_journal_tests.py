@@ -0,0 +1,151 @@
+import unittest
+import tempfile
+import shutil
+import time
+import os
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.ds import Order, TransactionType
+from quaintscience.trader.core.persistence.journal import StateJournal, apply_gtt_delta
+
+
+def get_order(**kwargs) -> Order:
+    return Order(scrip_id="INFY", exchange_id="NSE", scrip="INFY", exchange="NSE", **kwargs)
+
+
+def get_pair() -> tuple[Order, Order]:
+    return (get_order(), get_order(transaction_type=TransactionType.SELL))
+
+
+def get_ids(gtt_orders: list[tuple[Order, Order]]) -> list[tuple[str, str]]:
+    return [(o1.order_id, o2.order_id) for o1, o2 in gtt_orders]
+
+
+class TestStateJournal(Unittest):
+
+    def customSetUp(self):
+        self.dirpath = tempfile.mkdtemp()
+        self.path = os.path.join(self.dirpath, "state.pickle")
+        self.gtt_orders = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dirpath, ignore_errors=True)
+
+    def get_journal(self) -> StateJournal:
+        # Flushed by the tests, the background writer only sleeps
+        return StateJournal(self.path,
+                            lambda: {"gtt_orders": self.gtt_orders, "extra": {"orders": [1, 2]}},
+                            flush_interval=3600.)
+
+    def record(self, journal: StateJournal, op: str, *args):
+        self.gtt_orders = apply_gtt_delta(self.gtt_orders, op, args)
+        journal.record(op, *args)
+
+    def test_apply_gtt_delta(self):
+        first, second = get_pair(), get_pair()
+        gtt_orders = apply_gtt_delta([], "put", first)
+        gtt_orders = apply_gtt_delta(gtt_orders, "put", second)
+        updated = (first[0].copy(), first[1])
+        gtt_orders = apply_gtt_delta(gtt_orders, "put", updated)
+        self.assertEqual(get_ids(gtt_orders), get_ids([first, second]))
+        self.assertIs(gtt_orders[0][0], updated[0])
+        self.assertEqual(get_ids(apply_gtt_delta(gtt_orders, "delete_for", (second[0].order_id,))),
+                         get_ids([first]))
+        self.assertEqual(get_ids(apply_gtt_delta(gtt_orders, "remove", (get_ids([first]),))),
+                         get_ids([second]))
+        self.assertEqual(apply_gtt_delta(gtt_orders, "clear", ()), [])
+        with self.assertRaises(ValueError):
+            apply_gtt_delta(gtt_orders, "unknown", ())
+
+    def test_no_prior_state(self):
+        self.assertIsNone(self.get_journal().load())
+
+    def test_replay_over_snapshot(self):
+        journal = self.get_journal()
+        pairs = [get_pair() for _ in range(3)]
+        self.record(journal, "put", *pairs[0])
+        journal.compact()
+        self.record(journal, "put", *pairs[1])
+        self.record(journal, "put", *pairs[2])
+        self.record(journal, "delete_for", pairs[0][0].order_id)
+        journal.flush()
+        state = self.get_journal().load()
+        self.assertEqual(get_ids(state["gtt_orders"]), get_ids(pairs[1:]))
+        self.assertEqual(state["extra"], {"orders": [1, 2]})
+
+    def test_replay_without_snapshot(self):
+        journal = self.get_journal()
+        pair = get_pair()
+        self.record(journal, "put", *pair)
+        journal.flush()
+        self.assertFalse(os.path.exists(self.path))
+        state = self.get_journal().load()
+        self.assertEqual(get_ids(state["gtt_orders"]), get_ids([pair]))
+        self.assertIsNone(state["extra"])
+
+    def test_truncated_last_record(self):
+        journal = self.get_journal()
+        pairs = [get_pair() for _ in range(2)]
+        self.record(journal, "put", *pairs[0])
+        journal.flush()
+        self.record(journal, "put", *pairs[1])
+        journal.flush()
+        size = os.path.getsize(journal.journal_path)
+        os.truncate(journal.journal_path, size - 10)
+
+        journal = self.get_journal()
+        state = journal.load()
+        self.assertEqual(get_ids(state["gtt_orders"]), get_ids(pairs[:1]))
+        # The broken record is cut off, so records appended later are replayed
+        self.assertLess(os.path.getsize(journal.journal_path), size - 10)
+        self.gtt_orders = state["gtt_orders"]
+        pair = get_pair()
+        self.record(journal, "put", *pair)
+        journal.flush()
+        state = self.get_journal().load()
+        self.assertEqual(get_ids(state["gtt_orders"]), get_ids([pairs[0], pair]))
+
+    def test_compaction(self):
+        journal = StateJournal(self.path,
+                               lambda: {"gtt_orders": self.gtt_orders, "extra": None},
+                               flush_interval=3600.,
+                               compact_every=2)
+        pairs = [get_pair() for _ in range(3)]
+        for pair in pairs:
+            self.record(journal, "put", *pair)
+        journal.flush()
+        self.assertEqual(os.path.getsize(journal.journal_path), 0)
+        self.assertEqual(journal.snapshot_seq, 3)
+        state = self.get_journal().load()
+        self.assertEqual(get_ids(state["gtt_orders"]), get_ids(pairs))
+        self.assertEqual(state["journal_seq"], 3)
+
+    def test_snapshot_waits_until_due(self):
+        journal = StateJournal(self.path,
+                               lambda: {"gtt_orders": self.gtt_orders, "extra": None},
+                               flush_interval=0.01,
+                               snapshot_interval=0.5)
+        journal.compact()
+        compacted_at = journal.last_snapshot_time
+        flushes = []
+        flush = journal.flush
+
+        def counting_flush(*args):
+            flushes.append(time.monotonic())
+            flush(*args)
+
+        journal.flush = counting_flush
+        journal.request_snapshot()
+        time.sleep(0.25)
+        # The writer does not poll while the snapshot is not due
+        self.assertEqual(flushes, [])
+        deadline = time.monotonic() + 5.
+        while journal.snapshot_requested and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertFalse(journal.snapshot_requested)
+        self.assertEqual(len(flushes), 1)
+        self.assertGreaterEqual(flushes[0] - compacted_at, 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+import datetime
+import tempfile
+import shutil
+import sqlite3
+import os
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.ds import Order, Position, TransactionType
+from quaintscience.trader.core.persistence.sqlite.common import sqlite_connections
+from quaintscience.trader.core.persistence.sqlite.tradebook import SqliteTradeBookStorage
+
+
+class TestSqliteTradeBookStorage(Unittest):
+
+    def customSetUp(self):
+        self.dirpath = tempfile.mkdtemp()
+        self.path = os.path.join(self.dirpath, "tradebook.sqlite")
+        self.start = datetime.datetime(2023, 1, 2, 9, 15)
+
+    def tearDown(self):
+        sqlite_connections.close()
+        shutil.rmtree(self.dirpath, ignore_errors=True)
+
+    def get_storage(self, path: str = None, **kwargs) -> SqliteTradeBookStorage:
+        return SqliteTradeBookStorage(path if path is not None else self.path, **kwargs)
+
+    def count_rows(self, table: str, path: str = None) -> int:
+        # A separate connection sees what was committed only
+        connection = sqlite3.connect(path if path is not None else self.path)
+        try:
+            return connection.execute(f"SELECT COUNT(*) FROM s1__backtest__{table};").fetchone()[0]
+        finally:
+            connection.close()
+
+    def store_events(self, storage: SqliteTradeBookStorage, count: int, offset: int = 0):
+        # Events are keyed by date
+        for ii in range(offset, offset + count):
+            storage.store_event("s1", "backtest", "r1", "INFY", "NSE", "entry",
+                                transaction_type=TransactionType.BUY, price=100. + ii, quantity=1,
+                                date=self.start + datetime.timedelta(minutes=ii))
+
+    def store_position_states(self, storage: SqliteTradeBookStorage, pnls: list[float]):
+        position = Position(scrip_id="INFY", scrip="INFY", exchange_id="NSE", exchange="NSE")
+        for ii, pnl in enumerate(pnls):
+            position.pnl = pnl
+            storage.store_position_state("s1", "backtest", "r1", position,
+                                         date=self.start + datetime.timedelta(minutes=ii))
+
+    def test_rows_are_written_on_commit(self):
+        storage = self.get_storage()
+        self.store_events(storage, 3)
+        order = Order(scrip_id="INFY", exchange_id="NSE", scrip="INFY", exchange="NSE")
+        storage.store_order_execution("s1", "backtest", "r1", order, "placed", date=self.start)
+        self.assertEqual(self.count_rows("events"), 0)
+        storage.commit()
+        self.assertEqual(self.count_rows("events"), 3)
+        self.assertEqual(self.count_rows("orders"), 1)
+        events = storage.get_events("s1", "backtest", run_id="r1")
+        self.assertEqual(events["price"].tolist(), [100., 101., 102.])
+        self.assertEqual(events["transaction_type"].tolist(), [TransactionType.BUY] * 3)
+
+    def test_event_without_date(self):
+        storage = self.get_storage()
+        before = datetime.datetime.now().replace(microsecond=0)
+        storage.store_event("s1", "backtest", "r1", "INFY", "NSE", "squareoff")
+        storage.commit()
+        events = storage.get_events("s1", "backtest", from_date=before, to_date=datetime.datetime.now())
+        self.assertEqual(events["event_type"].tolist(), ["squareoff"])
+
+    def test_flush_every(self):
+        storage = self.get_storage(flush_every=4)
+        self.store_events(storage, 4)
+        storage.writer.wait()
+        self.assertEqual(self.count_rows("events"), 0)
+        # Going over flush_every hands the rows to the writer without a commit
+        self.store_events(storage, 5, offset=4)
+        storage.writer.wait()
+        self.assertEqual(self.count_rows("events"), 5)
+
+    def test_synchronous_writes(self):
+        storage = self.get_storage(async_writes=False)
+        self.assertIsNone(storage.writer)
+        self.store_events(storage, 2)
+        storage.flush()
+        self.assertEqual(self.count_rows("events"), 2)
+
+    def test_position_rows(self):
+        pnls = [0., 0., 5., 5., 5., -2.]
+        for position_rows, expected in [("all", 6), ("on_change", 3), ("none", 0)]:
+            path = os.path.join(self.dirpath, f"tradebook-{position_rows}.sqlite")
+            storage = self.get_storage(path, position_rows=position_rows)
+            storage.create_tables("s1", "backtest")
+            self.store_position_states(storage, pnls)
+            storage.commit()
+            self.assertEqual(self.count_rows("positions", path), expected, position_rows)
+        with self.assertRaises(ValueError):
+            self.get_storage(position_rows="sometimes")
+
+    def test_commit_raises_writer_errors(self):
+        storage = self.get_storage()
+        self.store_events(storage, 1)
+        storage.commit()
+        # The table is known to the storage, so it is not created again
+        storage.connection.execute("DROP TABLE s1__backtest__events;")
+        self.store_events(storage, 2, offset=1)
+        with self.assertRaises(sqlite3.OperationalError):
+            storage.commit()
+        # Reported once, and the failed batch was rolled back
+        storage.commit()
+        storage.store_order_execution("s1", "backtest", "r1",
+                                      Order(scrip_id="INFY", exchange_id="NSE", scrip="INFY", exchange="NSE"),
+                                      "placed", date=self.start)
+        storage.commit()
+        self.assertEqual(self.count_rows("orders"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
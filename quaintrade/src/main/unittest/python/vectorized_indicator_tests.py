@@ -0,0 +1,145 @@
+import unittest
+import time
+import os
+
+import pandas as pd
+import numpy as np
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.core.indicator import (DonchianIndicator,
+                                                 PullbackDetector,
+                                                 HeikinAshiIndicator,
+                                                 IntradayHighLowIndicator)
+
+
+def get_synthetic_data(days: int = 20, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2023-01-02 09:15", periods=days * 24 * 60, freq="1min")
+    index = index[(index.hour * 60 + index.minute >= 555) & (index.hour * 60 + index.minute < 930)]
+    close = 100 + np.cumsum(rng.normal(0, 1, len(index)))
+    opn = close + rng.normal(0, 0.5, len(index))
+    flat = rng.random(len(index)) < 0.05
+    opn[flat] = close[flat]
+    high = np.maximum(opn, close) + rng.uniform(0, 1, len(index)) * (rng.random(len(index)) < 0.8)
+    low = np.minimum(opn, close) - rng.uniform(0, 1, len(index)) * (rng.random(len(index)) < 0.8)
+    return pd.DataFrame({"open": opn, "high": high, "low": low, "close": close}, index=index)
+
+
+def reference_pullbacks(detector, df, settings):
+    """Row by row pullback detection the vectorized PullbackDetector must match"""
+    down = settings["pullback_direction"] == PullbackDetector.PULLBACK_DIRECTION_DOWN
+    starts, ends = np.zeros(len(df)), np.zeros(len(df))
+    after_breakout, pull_back_in_progress = False, False
+    prev_row = None
+    for ii, (_, row) in enumerate(df.iterrows()):
+        against = detector.is_red_candle(row) if down else detector.is_green_candle(row)
+        if prev_row is not None and row["_breakouts"] != 1.0 and prev_row["_breakouts"] == 1.0:
+            starts[ii] = 1.0
+            pull_back_in_progress, after_breakout = against, not against
+        elif after_breakout:
+            if against and not detector.is_doji(row, settings=settings):
+                pull_back_in_progress, after_breakout = True, False
+        elif pull_back_in_progress and not against:
+            ends[ii] = 1.0
+            pull_back_in_progress, after_breakout = False, False
+        prev_row = row
+    return starts, ends
+
+
+def reference_intraday_high_low(df, start_hour, start_minute, end_hour, end_minute):
+    """Row by row period high/low the vectorized IntradayHighLowIndicator must match"""
+    highs, lows = np.full(len(df), np.nan), np.full(len(df), np.nan)
+    current_high, current_low = np.nan, np.nan
+    for ii, (row_id, row) in enumerate(df.iterrows()):
+        if row_id.hour < start_hour or (row_id.hour == start_hour and row_id.minute < start_minute):
+            current_high, current_low = np.nan, np.nan
+            continue
+        if row_id.hour < end_hour or (row_id.hour == end_hour and row_id.minute <= end_hour):
+            current_high = row["high"] if np.isnan(current_high) else max(current_high, row["high"])
+            current_low = row["low"] if np.isnan(current_low) else min(current_low, row["low"])
+        highs[ii], lows[ii] = current_high, current_low
+    return highs, lows
+
+
+def reference_heikin_ashi_open(df):
+    """Cell by cell Heikin-Ashi open the HeikinAshiIndicator must match"""
+    heikin_ashi_df = pd.DataFrame(index=df.index.values, columns=["open", "close"])
+    heikin_ashi_df["close"] = (df["open"] + df["high"] + df["low"] + df["close"]) / 4
+    for ii in range(len(df)):
+        if ii == 0:
+            heikin_ashi_df.iat[0, 0] = df["open"].iloc[0]
+        else:
+            heikin_ashi_df.iat[ii, 0] = (heikin_ashi_df.iat[ii - 1, 0] + heikin_ashi_df.iat[ii - 1, 1]) / 2
+    return heikin_ashi_df["open"].astype(float).to_numpy()
+
+
+class TestVectorizedIndicators(Unittest):
+
+    def customSetUp(self):
+        self.test_data = get_synthetic_data()
+
+    def test_pullback_detector_matches_reference(self):
+        df = DonchianIndicator(period=10).compute(self.test_data.copy())[0]
+        for direction, breakout_column, price_column in [(PullbackDetector.PULLBACK_DIRECTION_DOWN, "donchian_upper_10", "high"),
+                                                         (PullbackDetector.PULLBACK_DIRECTION_UP, "donchian_lower_10", "low")]:
+            for wick_threshold in [0.5, 2.0]:
+                detector = PullbackDetector(breakout_column=breakout_column,
+                                            price_column=price_column,
+                                            pullback_direction=direction,
+                                            wick_threshold=wick_threshold)
+                result, output_columns, settings = detector.compute(df.copy())
+                starts, ends = reference_pullbacks(detector, result, settings)
+                self.assertGreater(starts.sum(), 0)
+                np.testing.assert_array_equal(result[output_columns["pullback_start"]].to_numpy(), starts)
+                np.testing.assert_array_equal(result[output_columns["pullback_end"]].to_numpy(), ends)
+
+    def test_intraday_high_low_matches_reference(self):
+        for start_hour, start_minute, end_hour, end_minute in [(9, 45, 14, 0), (9, 15, 15, 29), (11, 5, 12, 30)]:
+            indicator = IntradayHighLowIndicator(start_hour=start_hour,
+                                                 start_minute=start_minute,
+                                                 end_hour=end_hour,
+                                                 end_minute=end_minute)
+            result, output_columns, _ = indicator.compute(self.test_data.copy())
+            highs, lows = reference_intraday_high_low(self.test_data, start_hour, start_minute, end_hour, end_minute)
+            np.testing.assert_array_equal(result[output_columns["period_high"]].to_numpy(), highs)
+            np.testing.assert_array_equal(result[output_columns["period_low"]].to_numpy(), lows)
+
+    def test_heikinashi_matches_reference(self):
+        for replace_ohlc in [False, True]:
+            result = HeikinAshiIndicator(replace_ohlc=replace_ohlc).compute(self.test_data.copy())[0]
+            ha_open = reference_heikin_ashi_open(self.test_data)
+            np.testing.assert_array_equal(result["ha_open"].to_numpy(), ha_open)
+            np.testing.assert_array_equal(result["ha_high"].to_numpy(),
+                                          np.maximum(np.maximum(ha_open, result["ha_close"].to_numpy()),
+                                                     self.test_data["high"].to_numpy()))
+
+    @unittest.skipUnless(os.environ.get("QTRADE_PY_UNITTEST_BENCHMARKS"), "benchmarks run on request only")
+    def test_vectorized_indicators_benchmark(self):
+        df = DonchianIndicator(period=10).compute(get_synthetic_data(days=60))[0]
+        detector = PullbackDetector(breakout_column="donchian_upper_10",
+                                    price_column="high",
+                                    pullback_direction=PullbackDetector.PULLBACK_DIRECTION_DOWN)
+        intraday_high_low = IntradayHighLowIndicator(start_hour=9, start_minute=45, end_hour=14, end_minute=0)
+        breakouts = detector.compute(df.copy())[0]
+        cases = [("PullbackDetector",
+                  lambda: detector.compute(df.copy()),
+                  lambda: reference_pullbacks(detector, breakouts, detector.get_default_settings())),
+                 ("IntradayHighLowIndicator",
+                  lambda: intraday_high_low.compute(df.copy()),
+                  lambda: reference_intraday_high_low(df, 9, 45, 14, 0)),
+                 ("HeikinAshiIndicator",
+                  lambda: HeikinAshiIndicator().compute(df.copy()),
+                  lambda: reference_heikin_ashi_open(df))]
+        for name, vectorized, reference in cases:
+            start = time.perf_counter()
+            vectorized()
+            vectorized_time = time.perf_counter() - start
+            start = time.perf_counter()
+            reference()
+            reference_time = time.perf_counter() - start
+            self.logger.info(f"{name} on {len(df)} rows: {vectorized_time:.4f}s vectorized, "
+                             f"{reference_time:.4f}s row by row ({reference_time / vectorized_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    unittest.main()
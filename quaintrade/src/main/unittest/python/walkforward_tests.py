@@ -0,0 +1,77 @@
+import unittest
+import datetime
+from types import SimpleNamespace
+
+from quaintscience.trader.tests.common import Unittest
+from quaintscience.trader.service.walkforward import WalkForwardService
+
+
+class TestWalkForwardWindows(Unittest):
+
+    def get_windows(self,
+                    from_date: datetime.datetime,
+                    to_date: datetime.datetime,
+                    context_from_date: datetime.datetime = None,
+                    in_sample_days: int = 60,
+                    out_of_sample_days: int = 20,
+                    step_days: int = 20) -> list[dict]:
+        # Only the attributes get_windows reads
+        service = SimpleNamespace(from_date=from_date,
+                                  to_date=to_date,
+                                  context_from_date=context_from_date,
+                                  in_sample_days=in_sample_days,
+                                  out_of_sample_days=out_of_sample_days,
+                                  step_days=step_days)
+        return WalkForwardService.get_windows(service)
+
+    def test_final_partial_window(self):
+        windows = self.get_windows(datetime.datetime(2023, 1, 1), datetime.datetime(2023, 4, 1))
+        self.assertEqual(len(windows), 2)
+        self.assertEqual(windows[0]["in_sample"][:2], (datetime.datetime(2023, 1, 1), datetime.datetime(2023, 3, 2)))
+        self.assertEqual(windows[0]["out_of_sample"][:2], (datetime.datetime(2023, 3, 2), datetime.datetime(2023, 3, 22)))
+        self.assertEqual(windows[1]["in_sample"][:2], (datetime.datetime(2023, 1, 21), datetime.datetime(2023, 3, 22)))
+        # Cut short at to_date
+        self.assertEqual(windows[1]["out_of_sample"][:2], (datetime.datetime(2023, 3, 22), datetime.datetime(2023, 4, 1)))
+        # Without a context_from_date the context starts with the window
+        for window in windows:
+            for key in ["in_sample", "out_of_sample"]:
+                self.assertEqual(window[key][2], window[key][0])
+
+    def test_edges(self):
+        from_date = datetime.datetime(2023, 1, 1)
+        # The in-sample window must end before to_date to leave an out-of-sample one
+        self.assertEqual(self.get_windows(from_date, from_date + datetime.timedelta(days=60)), [])
+        self.assertEqual(self.get_windows(from_date, from_date + datetime.timedelta(days=30)), [])
+        windows = self.get_windows(from_date, from_date + datetime.timedelta(days=61))
+        self.assertEqual(len(windows), 1)
+        self.assertEqual(windows[0]["out_of_sample"][:2], (from_date + datetime.timedelta(days=60),
+                                                           from_date + datetime.timedelta(days=61)))
+        # Exactly two full windows, the out-of-sample windows end at to_date
+        windows = self.get_windows(from_date, from_date + datetime.timedelta(days=100))
+        self.assertEqual(len(windows), 2)
+        self.assertEqual(windows[-1]["out_of_sample"][1], from_date + datetime.timedelta(days=100))
+        self.assertEqual(windows[-1]["out_of_sample"][0] - windows[-1]["in_sample"][0], datetime.timedelta(days=60))
+
+    def test_step(self):
+        from_date = datetime.datetime(2023, 1, 1)
+        windows = self.get_windows(from_date, from_date + datetime.timedelta(days=100), step_days=10)
+        starts = [window["in_sample"][0] for window in windows]
+        self.assertEqual(starts, [from_date + datetime.timedelta(days=days) for days in range(0, 40, 10)])
+        # Out-of-sample windows overlap when stepping by less than their length
+        self.assertGreater(windows[0]["out_of_sample"][1], windows[1]["out_of_sample"][0])
+        for window in windows:
+            self.assertEqual(window["in_sample"][1], window["out_of_sample"][0])
+            self.assertLessEqual(window["out_of_sample"][1], from_date + datetime.timedelta(days=100))
+
+    def test_context_warmup(self):
+        from_date = datetime.datetime(2023, 1, 1)
+        windows = self.get_windows(from_date,
+                                   datetime.datetime(2023, 4, 1),
+                                   context_from_date=from_date - datetime.timedelta(days=5))
+        for window in windows:
+            for key in ["in_sample", "out_of_sample"]:
+                self.assertEqual(window[key][0] - window[key][2], datetime.timedelta(days=5))
+
+
+if __name__ == "__main__":
+    unittest.main()